@@ -0,0 +1,122 @@
+import os.path
+import queue
+import subprocess
+import threading
+import time
+
+soundsDirectory = '/var/lib/jupyter/notebooks/sounds/'
+
+playlist = {
+    "alert": "alert_sound_1.mp3",
+    "stop": "alert_sound_2.mp3"
+}
+
+
+class Mpg123Player:
+    def __init__(self, directory=soundsDirectory):
+        self.directory = directory
+
+    def __call__(self, sound):
+        subprocess.run(['mpg123', '-q', os.path.join(self.directory, playlist[sound])],
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+class FakePlayer:
+    # Records what would have been played. Used when simulating and in tests.
+    def __init__(self):
+        self.played = []
+        self.lock = threading.Lock()
+
+    def __call__(self, sound):
+        with self.lock:
+            self.played.append(sound)
+
+
+# Plays operator alerts on a background thread so that the protocol never waits for a sound. The worker is
+# started once per run and takes alerts from a queue:
+#   - an alert that is already waiting to be played is not queued a second time (coalescing);
+#   - an alert raised with repeat=True is replayed every repeat_interval seconds until acknowledge() is
+#     called, which the protocol does once it has been resumed.
+class AlertWorker:
+    def __init__(self, player=None, repeat_interval=30.0, clock=time.monotonic):
+        self.player = player or Mpg123Player()
+        self.repeat_interval = repeat_interval
+        self.clock = clock
+        self.queue = queue.Queue()
+        self.pending = set()
+        self.repeating = {}
+        self.lock = threading.Lock()
+        self.thread = None
+        self.errors = []
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._work, name='polartron-alerts', daemon=True)
+            self.thread.start()
+        return self
+
+    def alert(self, sound="alert", repeat=False):
+        if sound not in playlist:
+            raise KeyError("Unknown alert sound %r" % sound)
+        with self.lock:
+            if repeat:
+                self.repeating.setdefault(sound, None)
+            if sound in self.pending:
+                return False
+            self.pending.add(sound)
+        self.queue.put(sound)
+        return True
+
+    def acknowledge(self):
+        with self.lock:
+            self.repeating.clear()
+
+    def stop(self, timeout=5.0):
+        self.acknowledge()
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout)
+            self.thread = None
+
+    def join(self):
+        # Block until everything queued so far has been played; only used by tests and simulations.
+        self.queue.join()
+
+    def _next_repeat(self):
+        with self.lock:
+            due = [when for when in self.repeating.values() if when is not None]
+        if not due:
+            return None
+        return max(min(due) - self.clock(), 0)
+
+    def _work(self):
+        while True:
+            try:
+                sound = self.queue.get(timeout=self._next_repeat())
+            except queue.Empty:
+                now = self.clock()
+                with self.lock:
+                    due = [sound for sound, when in self.repeating.items() if when is not None and when <= now]
+                    for sound in due:
+                        self.repeating[sound] = None
+                for sound in due:
+                    self.alert(sound)
+                continue
+            try:
+                if sound is None:
+                    return
+                with self.lock:
+                    self.pending.discard(sound)
+                self._play(sound)
+                with self.lock:
+                    if sound in self.repeating:
+                        self.repeating[sound] = self.clock() + self.repeat_interval
+            finally:
+                self.queue.task_done()
+
+    def _play(self, sound):
+        try:
+            self.player(sound)
+        except Exception as error:
+            # A missing speaker or player must never stop a run.
+            self.errors.append(error)
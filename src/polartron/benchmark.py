@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import time
+import tracemalloc
+
+from polartron.estimator import format_duration, summarize
+from polartron.protocols.run_polartron import run
+from polartron.simulation import RecordingContext
+
+baselineFormat = 1
+
+defaultBaseline = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+# Runs the benchmark simulates, by name, with the keyword arguments of run() for each.
+scenarios = {
+    '1 sample': {'sample_count': 1},
+    '4 samples': {'sample_count': 4},
+    '4 samples, liquid following': {'sample_count': 4, 'liquid_following': True},
+    '4 samples, distributed': {'sample_count': 4, 'distribute': True},
+    '3 samples, library prep': {'sample_count': 3, 'library_prep': True},
+    '5 samples, tip washing': {'sample_count': 5, 'tip_wash': True}
+}
+
+# A phase regresses when its simulated run time grows by more than this fraction of the baseline, and by
+# more than the allowance, so that short phases are not failed for a fraction of a second.
+defaultThreshold = 0.02
+allowanceSeconds = 1.0
+
+# Metrics of every phase, in report column order. Seconds are simulated robot time, travel is mm of gantry
+# travel and volumeDrawn is uL aspirated over all channels.
+phaseMetrics = ['seconds', 'commands', 'tipPickUps', 'slowZSeconds', 'travel', 'volumeDrawn']
+
+
+def phase_metrics(ctx):
+    # Metrics per update_log phase of a recorded run, in the rows summarize() gives. A message logged more
+    # than once is told apart by how often it has been seen, so phases match up between two runs.
+    channels = {mount: instrument.channels for mount, instrument in ctx._instruments.items()}
+    phases = []
+    seen = {}
+    for row in summarize(ctx.trace)['phases']:
+        occurrence = seen[row['phase']] = seen.get(row['phase'], 0) + 1
+        phases.append({'phase': row['phase'], 'occurrence': occurrence, 'seconds': row['seconds'],
+                       'commands': row['commands'], 'tipPickUps': 0, 'slowZSeconds': row['slowZSeconds'],
+                       'travel': row['travel'], 'volumeDrawn': 0.0})
+    # summarize() starts a new row whenever the phase changes; walk the trace the same way.
+    index = -1
+    current = None
+    for record in ctx.trace:
+        if current is None or record['phase'] != current:
+            index += 1
+            current = record['phase']
+        if record['command'] == 'pick_up_tip':
+            phases[index]['tipPickUps'] += 1
+        elif record['command'] == 'aspirate':
+            phases[index]['volumeDrawn'] += record['volume'] * channels[record['mount']]
+    return phases
+
+
+# Simulate one scenario. The run is simulated twice: once timed and once under tracemalloc for its peak
+# memory, since tracing allocations slows the simulation down several times over.
+def measure(run_kwargs):
+    started = time.perf_counter()
+    ctx = RecordingContext()
+    run(ctx, **run_kwargs)
+    wallSeconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    try:
+        run(RecordingContext(), **run_kwargs)
+        peakMemory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    phases = phase_metrics(ctx)
+    result = {metric: sum(phase[metric] for phase in phases) for metric in phaseMetrics}
+    result.update(runKwargs=run_kwargs, wallSeconds=wallSeconds, peakMemory=peakMemory, phases=phases)
+    return result
+
+
+def benchmark(names=None):
+    return {name: measure(scenarios[name]) for name in names or scenarios}
+
+
+def read_baseline(path=defaultBaseline):
+    with open(path, encoding='utf-8') as baseline:
+        baseline = json.load(baseline)
+    if baseline.get('format') != baselineFormat:
+        raise ValueError("%s is not a format %d benchmark baseline" % (path, baselineFormat))
+    return baseline['scenarios']
+
+
+def write_baseline(results, path=defaultBaseline):
+    with open(path, 'w', encoding='utf-8') as baseline:
+        json.dump({'format': baselineFormat, 'scenarios': results}, baseline, indent=1, ensure_ascii=False)
+        baseline.write('\n')
+
+
+# Compare results with the baseline, phase by phase. Regressions are the phases, and run totals, whose
+# simulated time grew past the threshold; they fail the benchmark. Phases only one side has are listed as
+# added or removed. Simulation wall time and memory depend on the machine, so they are reported but
+# never fail it.
+def compare(results, baseline, threshold=defaultThreshold, allowance=allowanceSeconds):
+    def slower(seconds, before):
+        return seconds - before > max(threshold * before, allowance)
+
+    comparison = {'regressions': [], 'added': [], 'removed': [], 'scenarios': {}}
+    for name, result in results.items():
+        if name not in baseline:
+            comparison['added'].append((name, None))
+            continue
+        before = baseline[name]
+        comparison['scenarios'][name] = {
+            metric: (before[metric], result[metric]) for metric in phaseMetrics + ['wallSeconds', 'peakMemory']}
+        if slower(result['seconds'], before['seconds']):
+            comparison['regressions'].append((name, 'total', before['seconds'], result['seconds']))
+        phases = {(phase['phase'], phase['occurrence']): phase for phase in result['phases']}
+        beforePhases = {(phase['phase'], phase['occurrence']): phase for phase in before['phases']}
+        for key, phase in phases.items():
+            if key not in beforePhases:
+                if phase['commands']:
+                    comparison['added'].append((name, key))
+            elif slower(phase['seconds'], beforePhases[key]['seconds']):
+                comparison['regressions'].append(
+                    (name, '%s (#%d)' % key, beforePhases[key]['seconds'], phase['seconds']))
+        comparison['removed'] += [(name, key) for key, phase in beforePhases.items()
+                                  if key not in phases and phase['commands']]
+    return comparison
+
+
+def format_report(results, comparison=None):
+    lines = ['%-28s %9s %8s %5s %9s %9s %10s %8s %8s' % (
+        'scenario', 'time', 'commands', 'tips', 'slow Z', 'travel m', 'drawn mL', 'wall s', 'peak MB')]
+    for name, result in results.items():
+        lines.append('%-28s %9s %8d %5d %9s %9.1f %10.1f %8.2f %8.1f' % (
+            name, format_duration(result['seconds']), result['commands'], result['tipPickUps'],
+            format_duration(result['slowZSeconds']), result['travel'] / 1000.0, result['volumeDrawn'] / 1000.0,
+            result['wallSeconds'], result['peakMemory'] / 1e6))
+    if comparison is None:
+        return '\n'.join(lines)
+
+    for name, metrics in comparison['scenarios'].items():
+        changed = ['%s %g -> %g' % (metric, round(before, 2), round(after, 2))
+                   for metric, (before, after) in metrics.items()
+                   if metric not in ('wallSeconds', 'peakMemory') and abs(after - before) > 1e-6]
+        if changed:
+            lines.append('%s: %s' % (name, ', '.join(changed)))
+        wallBefore, wallAfter = metrics['wallSeconds']
+        memoryBefore, memoryAfter = metrics['peakMemory']
+        lines.append('%s: simulation %.2f s -> %.2f s, peak memory %.1f MB -> %.1f MB' % (
+            name, wallBefore, wallAfter, memoryBefore / 1e6, memoryAfter / 1e6))
+    for name, phase in comparison['added']:
+        lines.append('new: %s' % (name if phase is None else '%s / %s (#%d)' % ((name,) + phase)))
+    for name, phase in comparison['removed']:
+        lines.append('gone: %s / %s (#%d)' % ((name,) + phase))
+    for name, phase, before, after in comparison['regressions']:
+        lines.append('SLOWER: %s / %s: %s -> %s (+%.0f s)' % (
+            name, phase, format_duration(before), format_duration(after), after - before))
+    if not comparison['regressions']:
+        lines.append('No phase is slower than the baseline.')
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark simulated POLARtron runs against a baseline.')
+    parser.add_argument('--baseline', default=defaultBaseline, help='baseline JSON file')
+    parser.add_argument('--threshold', type=float, default=defaultThreshold,
+                        help='fraction a phase may grow by before the benchmark fails')
+    parser.add_argument('--scenario', action='append', choices=sorted(scenarios), help='scenario to run')
+    parser.add_argument('--update', action='store_true', help='write the results as the new baseline')
+    args = parser.parse_args(argv)
+
+    results = benchmark(args.scenario)
+    if args.update:
+        if args.scenario and os.path.exists(args.baseline):
+            results = dict(read_baseline(args.baseline), **results)
+        write_baseline(results, args.baseline)
+        print(format_report(results))
+        print('Baseline written to %s' % args.baseline)
+        return
+    comparison = compare(results, read_baseline(args.baseline), args.threshold)
+    print(format_report(results, comparison))
+    if comparison['regressions']:
+        parser.exit(1)
+
+
+if __name__ == '__main__':
+    main()
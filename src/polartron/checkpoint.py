@@ -0,0 +1,252 @@
+import argparse
+import json
+import os
+from datetime import datetime
+
+from polartron.plancache import Compiler, replay_call
+from polartron.simulation import RecordingContext, timing
+from polartron.simulation.context import RecordingMagneticModule, RecordingTemperatureModule, RecordingThermocycler
+
+# Bumped whenever the checkpoint layout changes.
+checkpointFormat = 1
+
+
+class CheckpointError(RuntimeError):
+    pass
+
+
+# <editor-fold desc="Forwarding">
+
+# Runs the protocol against a simulated shadow of the deck and forwards every call to the real protocol
+# context, except while skipping. Loads and speed/flow rate settings are always forwarded. The shadow keeps
+# tips, pipette volumes and module state exactly as if nothing had been skipped, so the protocol's own
+# logic carries on unchanged, and when forwarding starts again the real modules are brought to the
+# shadow's state.
+class Forwarder(Compiler):
+    def __init__(self, ptx):
+        super().__init__()
+        self.real = ptx
+        self.shadow = RecordingContext()
+        self.objects = {'ctx': ptx}
+        self.skipping = False
+        self.synced = {}
+
+    def context(self):
+        return self.wrap(self.shadow, 'ctx')
+
+    def read(self, key, target, name):
+        # What the protocol asks the context about itself comes from the robot, not the shadow.
+        if key == 'ctx' and name in ('is_simulating', 'commands', 'now'):
+            return getattr(self.real, name)
+        return super().read(key, target, name)
+
+    def emit(self, call):
+        if not self.skipping or 'returns' in call or 'set' in call or 'setitem' in call:
+            replay_call(call, self.objects)
+            if 'call' in call and call['call'].startswith('module:'):
+                self.synced[call['call']] = self.module_state(self.recorders[call['call']]._target)
+
+    def forward(self, on):
+        if on and self.skipping:
+            self.skipping = False
+            self.resume_tips()
+            self.sync_modules()
+        elif not on:
+            self.skipping = True
+
+    def resume_tips(self):
+        for key, pipette in self.targets('instrument:'):
+            if pipette.has_tip and not self.objects[key].has_tip:
+                if pipette.current_volume > 0:
+                    raise CheckpointError("Cannot resume with %s uL left in the tip of %s" %
+                                          (pipette.current_volume, pipette))
+                replay_call({'call': key, 'name': 'pick_up_tip', 'args': [self.encode(pipette._tip)],
+                             'kwargs': {}}, self.objects)
+
+    def module_state(self, module):
+        if isinstance(module, RecordingMagneticModule):
+            return {'status': module.status, 'height': module.height}
+        if isinstance(module, RecordingTemperatureModule):
+            return {'target': module.target}
+        if isinstance(module, RecordingThermocycler):
+            # Temperatures at ambient mean that part of the thermocycler is off.
+            return {'lid': module.lid_position,
+                    'block': None if module.block_temperature == timing.ambientTemperature else
+                    module.block_temperature,
+                    'lidTemperature': None if module.lid_temperature == timing.ambientTemperature else
+                    module.lid_temperature}
+        return {}
+
+    def modules(self):
+        return {key: self.module_state(module) for key, module in self.targets('module:')}
+
+    def targets(self, kind):
+        # Shadow pipettes or modules by key, leaving out their flow rates and other wrapped attributes.
+        return [(key, recorder._target) for key, recorder in self.recorders.items()
+                if key.startswith(kind) and '.' not in key]
+
+    def sync_modules(self):
+        for key, state in self.modules().items():
+            real = self.objects[key]
+            known = self.synced.get(key, {})
+            if state == known:
+                continue
+            if 'status' in state:
+                if state['status'] == 'engaged':
+                    real.engage(state['height'])
+                else:
+                    real.disengage()
+            elif 'target' in state:
+                if state['target'] is None:
+                    real.deactivate()
+                else:
+                    real.set_temperature(state['target'])
+            elif 'lid' in state:
+                if state['lid'] != known.get('lid'):
+                    real.open_lid() if state['lid'] == 'open' else real.close_lid()
+                if state['block'] != known.get('block'):
+                    if state['block'] is None:
+                        real.deactivate_block()
+                    else:
+                        real.set_block_temperature(state['block'])
+                if state['lidTemperature'] != known.get('lidTemperature'):
+                    if state['lidTemperature'] is None:
+                        real.deactivate_lid()
+                    else:
+                        real.set_lid_temperature(state['lidTemperature'])
+            self.synced[key] = state
+
+# </editor-fold>
+
+
+# <editor-fold desc="Checkpoints">
+
+# Saves progress at every update_log phase of a run and, when resuming, skips what an earlier run already
+# did. Progress is counted per scheduler task: the tasks that finished, and for the others how many of their
+# phases had started. On resume, finished tasks and the phases before the one that was interrupted run
+# only in the shadow; the interrupted phase is done again from its start.
+class Checkpoint:
+    def __init__(self, path, state=None):
+        self.path = path
+        self.state = state or {}
+        self.completed = set(self.state.get('completed', []))
+        self.resumePhases = dict(self.state.get('phases', {}))
+        self.finished = set()
+        self.phases = {}
+        self.params = {}
+        self.names = {}
+        self.forwarder = None
+        self.scheduler = None
+        self.phase_name = None
+
+    @property
+    def skipping(self):
+        return self.forwarder is not None and self.forwarder.skipping
+
+    def context(self, ptx):
+        self.forwarder = Forwarder(ptx)
+        self.forwarder.skipping = bool(self.completed or self.resumePhases)
+        return self.forwarder.context()
+
+    def start(self, params, labware):
+        # Stored as it reads back from JSON, so a resumed run compares equal to the run it continues.
+        self.params = json.loads(json.dumps(params))
+        if self.state and self.state['params']['plan'] != self.params['plan']:
+            raise CheckpointError("The run does not use the plan the checkpoint was saved with")
+        for name, item in labware.items():
+            for well in item.wells():
+                self.names[repr(well)] = [name, well.well_name]
+
+    def attach(self, scheduler):
+        self.scheduler = scheduler
+        scheduler.on_step = self.gate
+        scheduler.on_done = self.done
+
+    def gate(self, task):
+        skip = task.name in self.completed or self.phases.get(task.name, 0) < self.resumePhases.get(task.name, 0)
+        self.forwarder.forward(not skip)
+
+    def phase(self, message):
+        task = self.scheduler.running if self.scheduler is not None else None
+        if task is None:
+            return
+        self.phases[task.name] = self.phases.get(task.name, 0) + 1
+        self.phase_name = message
+        self.gate(task)
+        self.save()
+
+    def done(self, task):
+        self.finished.add(task.name)
+        self.save()
+
+    def snapshot(self):
+        phases = dict(self.resumePhases)
+        for task, count in self.phases.items():
+            phases[task] = max(count, phases.get(task, 0))
+        tips = []
+        wells = {}
+        for record in self.forwarder.shadow.trace:
+            name = self.names.get(record.get('location'))
+            if name is None:
+                continue
+            if record['command'] == 'pick_up_tip' and name not in tips:
+                tips.append(name)
+            elif record['command'] in ('aspirate', 'dispense'):
+                key = ' '.join(name)
+                wells[key] = wells.get(key, 0.0) + (record['volume'] if record['command'] == 'dispense'
+                                                    else -record['volume'])
+        return {
+            'format': checkpointFormat,
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'params': self.params,
+            'phase': self.phase_name,
+            'completed': sorted(self.completed | self.finished),
+            'phases': phases,
+            'tipsUsed': tips,
+            'wellVolumes': {key: round(volume, 3) for key, volume in wells.items()},
+            'modules': self.forwarder.modules()
+        }
+
+    def save(self):
+        if self.path is None:
+            return
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as output:
+            json.dump(self.snapshot(), output, ensure_ascii=False, indent=1)
+        os.replace(temporary, self.path)
+
+
+def load_checkpoint(path):
+    with open(path, encoding='utf-8') as checkpoint:
+        state = json.load(checkpoint)
+    if state.get('format') != checkpointFormat:
+        raise CheckpointError("Checkpoint format %r is not supported" % state.get('format'))
+    return state
+
+
+# Resume an interrupted run from its checkpoint with the same parameters and plan. Completed phases are
+# skipped, tips are taken from where the plan left off and modules are set back to where they were.
+def resume(ptx, path, **run_kwargs):
+    from polartron.protocols.run_polartron import run
+    state = load_checkpoint(path)
+    params = dict(state['params'], **run_kwargs)
+    return run(ptx, checkpoint=Checkpoint(path, state), **params)
+
+# </editor-fold>
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Show the progress saved in a POLARtron checkpoint.')
+    parser.add_argument('path', help='checkpoint file')
+    args = parser.parse_args(argv)
+    state = load_checkpoint(args.path)
+    print('saved %s in phase: %s' % (state['time'], state['phase']))
+    print('completed tasks: %s' % ', '.join(state['completed']))
+    print('tips used: %d' % len(state['tipsUsed']))
+    for module, moduleState in state['modules'].items():
+        print('%s: %s' % (module, moduleState))
+
+
+if __name__ == '__main__':
+    main()
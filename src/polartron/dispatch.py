@@ -0,0 +1,220 @@
+import argparse
+import glob
+import heapq
+import os
+
+from polartron.estimator import format_duration, summarize
+from polartron.pipeline import split_batches
+from polartron.planner import max_samples, plan_run
+from polartron.protocols.run_polartron import metadata, run
+from polartron.runlog import read_log
+from polartron.simulation import RecordingContext
+
+# A protocol file for one run on one robot: run_polartron with the parameters of that run. The metadata is
+# written out in full because the robot reads it from the file without running it.
+protocolTemplate = '''from polartron.protocols.run_polartron import run as run_polartron
+
+metadata = %(metadata)r
+
+
+def run(ptx):
+    run_polartron(ptx, **%(params)r)
+'''
+
+
+def read_manifest(path):
+    # One sample per line, as the first comma separated field. Blank lines and lines starting with # are
+    # skipped, as is a header whose first field is "sample".
+    samples = []
+    with open(path, encoding='utf-8') as manifest:
+        for line in manifest:
+            name = line.split(',')[0].strip()
+            if not name or name.startswith('#') or (not samples and name.lower() == 'sample'):
+                continue
+            samples.append(name)
+    if len(set(samples)) != len(samples):
+        raise ValueError("The manifest lists a sample more than once")
+    return samples
+
+
+# <editor-fold desc="Sharding">
+
+class RuntimeEstimates:
+    # Simulated run time by sample count, each count simulated once.
+    def __init__(self, **run_kwargs):
+        self.run_kwargs = run_kwargs
+        self.seconds = {}
+
+    def __call__(self, sample_count):
+        if sample_count not in self.seconds:
+            ctx = RecordingContext()
+            run(ctx, sample_count=sample_count, **self.run_kwargs)
+            self.seconds[sample_count] = summarize(ctx.trace)['seconds']
+        return self.seconds[sample_count]
+
+
+# Split a manifest into runs of at most `capacity` samples and hand them to robots so that they all finish
+# at about the same time. Every robot gets the same number of runs, as even in size as possible, and the
+# longest runs go first to whichever robot is least loaded so far. Returns {robot: [samples of each run]}.
+def shard(samples, robots, capacity=None, estimate=None):
+    if not robots:
+        raise ValueError("No robots to dispatch to")
+    if not samples:
+        raise ValueError("The manifest has no samples")
+    capacity = capacity or max_samples()
+    estimate = estimate or RuntimeEstimates()
+    runsPerRobot = -(-len(samples) // (capacity * len(robots)))
+    runs = split_batches(samples, min(runsPerRobot * len(robots), len(samples)))
+    loads = [(0.0, index, robot) for index, robot in enumerate(robots)]
+    shards = {robot: [] for robot in robots}
+    for batch in sorted(runs, key=len, reverse=True):
+        seconds, index, robot = heapq.heappop(loads)
+        shards[robot].append(batch)
+        heapq.heappush(loads, (seconds + estimate(len(batch)), index, robot))
+    return shards
+
+
+def run_params(experiment_name, robot, number, batch, run_kwargs):
+    # Parameters of run_polartron for one run; the plan carries the sample names from the manifest.
+    params = dict(run_kwargs)
+    params['experiment_name'] = '%s_%s_run%d' % (experiment_name, robot, number) if experiment_name else \
+        '%s_run%d' % (robot, number)
+    params['sample_count'] = len(batch)
+    params['plan'] = plan_run(len(batch), layout=run_kwargs.get('layout'),
+                              library_prep=run_kwargs.get('library_prep', False),
+                              tip_wash=run_kwargs.get('tip_wash', False), names=batch)
+    return params
+
+
+def dispatch_plan(samples, robots, experiment_name="", capacity=None, **run_kwargs):
+    # {robot: [run parameters]} for a manifest, in the order each robot runs them.
+    estimate = RuntimeEstimates(**run_kwargs)
+    capacity = capacity or max_samples(run_kwargs.get('layout'), run_kwargs.get('library_prep', False),
+                                       run_kwargs.get('tip_wash', False))
+    shards = shard(samples, robots, capacity, estimate)
+    plan = {}
+    for robot, batches in shards.items():
+        plan[robot] = []
+        for number, batch in enumerate(batches, start=1):
+            params = run_params(experiment_name, robot, number, batch, run_kwargs)
+            params['estimatedSeconds'] = estimate(len(batch))
+            plan[robot].append(params)
+    return plan
+
+
+def protocol_source(params):
+    return protocolTemplate % {'metadata': metadata,
+                               'params': {key: value for key, value in params.items() if key != 'estimatedSeconds'}}
+
+
+def write_protocols(plan, directory):
+    # One protocol file per run, named after its experiment, ready to upload to its robot.
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for robot, runs in plan.items():
+        paths[robot] = []
+        for params in runs:
+            path = os.path.join(directory, params['experiment_name'] + '.py')
+            with open(path, 'w', encoding='utf-8') as protocol:
+                protocol.write(protocol_source(params))
+            paths[robot].append(path)
+    return paths
+
+# </editor-fold>
+
+
+# <editor-fold desc="Running">
+
+# Run a dispatch plan against one protocol context per run. contexts maps each robot to a function that
+# returns a fresh context, such as RecordingContext to stand in for a robot. Each robot's run logs go to
+# its own directory under log_directory. Returns {robot: [run log paths]}.
+def run_plan(plan, contexts, log_directory):
+    logs = {}
+    for robot, runs in plan.items():
+        directory = os.path.join(log_directory, robot)
+        logs[robot] = []
+        for params in runs:
+            params = {key: value for key, value in params.items() if key != 'estimatedSeconds'}
+            run(contexts[robot](), log_directory=directory, **params)
+            logs[robot].extend(sorted(glob.glob(os.path.join(directory, params['experiment_name'] +
+                                                             '_run_log_*.jsonl'))))
+    return logs
+
+
+def run_summary(entries):
+    # What one run log says about its run.
+    ends = [entry for entry in entries if entry['event'] == 'run_end']
+    samples = []
+    for entry in entries:
+        if entry['event'] == 'sample' and entry['sample'] not in samples:
+            samples.append(entry['sample'])
+    return {
+        'status': ends[-1]['status'] if ends else 'incomplete',
+        'started': entries[0]['time'] if entries else None,
+        'ended': ends[-1]['time'] if ends else None,
+        'phases': sum(1 for entry in entries if entry['event'] == 'phase'),
+        'commands': ends[-1]['commands'] if ends else None,
+        'samples': samples
+    }
+
+
+# Combine the run logs of every robot into one report. plan, if given, adds the estimated run times.
+def combine_logs(logs, plan=None):
+    robots = []
+    for robot, paths in logs.items():
+        runs = []
+        for index, path in enumerate(paths):
+            summary = run_summary(read_log(path))
+            summary['log'] = path
+            if plan is not None and index < len(plan[robot]):
+                summary['estimatedSeconds'] = plan[robot][index]['estimatedSeconds']
+            runs.append(summary)
+        robots.append({
+            'robot': robot,
+            'runs': runs,
+            'samples': sum(len(summary['samples']) for summary in runs),
+            'estimatedSeconds': sum(summary.get('estimatedSeconds', 0.0) for summary in runs),
+            'complete': all(summary['status'] == 'complete' for summary in runs)
+        })
+    return {'robots': robots,
+            'samples': sum(robot['samples'] for robot in robots),
+            'complete': all(robot['complete'] for robot in robots)}
+
+
+def format_report(report):
+    lines = ['%-12s %4s %8s %9s %-10s %s' % ('robot', 'run', 'samples', 'estimate', 'status', 'log')]
+    for robot in report['robots']:
+        for number, summary in enumerate(robot['runs'], start=1):
+            lines.append('%-12s %4d %8d %9s %-10s %s' % (
+                robot['robot'], number, len(summary['samples']),
+                format_duration(summary.get('estimatedSeconds', 0.0)), summary['status'], summary['log']))
+        lines.append('%-12s %4s %8d %9s' % (robot['robot'], 'all', robot['samples'],
+                                            format_duration(robot['estimatedSeconds'])))
+    lines.append('%d samples on %d robots, %s' % (report['samples'], len(report['robots']),
+                                                  'complete' if report['complete'] else 'NOT complete'))
+    return '\n'.join(lines)
+
+# </editor-fold>
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Split a sample manifest over several OT-2s.')
+    parser.add_argument('manifest', help='sample names, one per line')
+    parser.add_argument('--robots', nargs='+', required=True, help='robot names')
+    parser.add_argument('--experiment', default='', help='experiment name')
+    parser.add_argument('--out', default='dispatch', help='directory for protocol files and run logs')
+    parser.add_argument('--simulate', action='store_true', help='run every robot against the simulation')
+    args = parser.parse_args(argv)
+
+    plan = dispatch_plan(read_manifest(args.manifest), args.robots, args.experiment)
+    for robot, paths in write_protocols(plan, os.path.join(args.out, 'protocols')).items():
+        for path, params in zip(paths, plan[robot]):
+            print('%s: %s (%d samples, %s)' % (robot, path, params['sample_count'],
+                                               format_duration(params['estimatedSeconds'])))
+    if args.simulate:
+        logs = run_plan(plan, {robot: RecordingContext for robot in args.robots}, os.path.join(args.out, 'logs'))
+        print(format_report(combine_logs(logs, plan)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import argparse
+
+from polartron.protocols.run_polartron import run
+from polartron.simulation import RecordingContext
+
+# Categories reported for every phase, in report column order.
+categories = ['motion', 'liquid', 'tips', 'delay', 'module', 'thermocycler']
+
+
+def record_run(sample_count=4, ctx=None, **run_kwargs):
+    ctx = ctx or RecordingContext()
+    run(ctx, sample_count=sample_count, **run_kwargs)
+    return ctx
+
+
+def estimate(sample_count=4, **run_kwargs):
+    return summarize(record_run(sample_count, **run_kwargs).trace)
+
+
+# Fold a recorded trace into wall-clock time per update_log phase. A message that is logged again later
+# in the run starts a new row, so the rows read in run order.
+def summarize(trace):
+    phases = []
+    current = None
+    for record in trace:
+        if current is None or record['phase'] != current['phase']:
+            current = {'phase': record['phase'], 'start': record['start'], 'seconds': 0.0, 'commands': 0,
+                       'slowZSeconds': 0.0, 'travel': 0.0}
+            current.update((category, 0.0) for category in categories)
+            phases.append(current)
+        # Commands run next to the protocol, like a thermocycler program, take no time of their own, in the
+        # phase total or in its categories.
+        if not record.get('background'):
+            current['seconds'] += record['seconds']
+            if record['category'] in categories:
+                current[record['category']] += record['seconds']
+        if record['category'] != 'comment':
+            current['commands'] += 1
+        current['slowZSeconds'] += record.get('slow_z_seconds', 0.0)
+        current['travel'] += record.get('travel', 0.0)
+
+    totals = {category: sum(phase[category] for phase in phases) for category in categories}
+    return {
+        'seconds': sum(phase['seconds'] for phase in phases),
+        'slowZSeconds': sum(phase['slowZSeconds'] for phase in phases),
+        'travel': sum(phase['travel'] for phase in phases),
+        'commands': sum(phase['commands'] for phase in phases),
+        'categories': totals,
+        'phases': phases
+    }
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '%d:%02d:%02d' % (hours, minutes, seconds)
+
+
+def format_report(report):
+    width = max([len(phase['phase']) for phase in report['phases']] + [5])
+    header = '%s %9s %9s' % ('phase'.ljust(width), 'start', 'duration') + \
+             ''.join(' %12s' % category for category in categories)
+    lines = [header, '-' * len(header)]
+    for phase in report['phases']:
+        if not phase['seconds']:
+            continue
+        lines.append('%s %9s %9s' % (phase['phase'].ljust(width), format_duration(phase['start']),
+                                     format_duration(phase['seconds'])) +
+                     ''.join(' %12s' % format_duration(phase[category]) for category in categories))
+    lines.append('-' * len(header))
+    lines.append('%s %9s %9s' % ('total'.ljust(width), '', format_duration(report['seconds'])) +
+                 ''.join(' %12s' % format_duration(report['categories'][category]) for category in categories))
+    lines.append('slow Z: %s, gantry travel: %.1f m, commands: %d' % (
+        format_duration(report['slowZSeconds']), report['travel'] / 1000.0, report['commands']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Estimate the wall-clock time of a POLARtron run.')
+    parser.add_argument('--samples', type=int, default=4, help='number of sample columns')
+    args = parser.parse_args(argv)
+    print(format_report(estimate(args.samples)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import numpy as np
+
+try:
+    from opentrons import types
+except ImportError:
+    from polartron.simulation import types
+
+
+# Well positions of one labware, read once when the labware is first used. Columns are numbered from the
+# labware's own ordering, so nothing is parsed out of well names or reprs.
+class LabwareGeometry:
+    def __init__(self, labware):
+        self.labware = labware
+        self.names = []
+        self.index = {}
+        columnNumbers = []
+        for column, wells in enumerate(labware.columns(), start=1):
+            for well in wells:
+                self.index[well.well_name] = len(self.names)
+                self.names.append(well.well_name)
+                columnNumbers.append(column)
+        wells = [labware[name] for name in self.names]
+        self.columns = np.array(columnNumbers)
+        self.bottoms = np.array([tuple(well.bottom().point) for well in wells], dtype=float)
+        self.tops = np.array([tuple(well.top().point) for well in wells], dtype=float)
+        self.centers = (self.bottoms + self.tops) / 2.0
+        # Beads are pulled to the right of odd columns and to the left of even ones.
+        self.beadSides = np.where(self.columns % 2 == 1, 1, -1)
+
+    def column(self, well):
+        return int(self.columns[self.index[well.well_name]])
+
+    def bead_side(self, well):
+        return int(self.beadSides[self.index[well.well_name]])
+
+
+# Geometry for every labware a run touches, plus the offset Locations the helpers ask for. Each
+# Location is built once and handed out again on later calls with the same well and offset.
+class GeometryIndex:
+    def __init__(self):
+        self.labware = {}
+        self.locations = {}
+
+    def __getitem__(self, labware):
+        key = id(labware)
+        if key not in self.labware:
+            self.labware[key] = LabwareGeometry(labware)
+        return self.labware[key]
+
+    def bead_side(self, well):
+        return self[well.parent].bead_side(well)
+
+    def bottom(self, well, z=0.0, x=0.0, y=0.0):
+        key = (id(well), 'bottom', x, y, z)
+        if key not in self.locations:
+            self.locations[key] = well.bottom().move(types.Point(x=x, y=y, z=z))
+        return self.locations[key]
+
+    def top(self, well, z=0.0, x=0.0, y=0.0):
+        key = (id(well), 'top', x, y, z)
+        if key not in self.locations:
+            self.locations[key] = well.top().move(types.Point(x=x, y=y, z=z))
+        return self.locations[key]
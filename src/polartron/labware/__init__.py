@@ -0,0 +1,86 @@
+import json
+from importlib import resources
+
+# Parts of a definition the protocol and the simulation rely on.
+requiredKeys = ['ordering', 'metadata', 'dimensions', 'wells', 'parameters', 'namespace', 'version',
+                'schemaVersion', 'cornerOffsetFromSlot']
+requiredWellKeys = ['depth', 'totalLiquidVolume', 'shape', 'x', 'y', 'z']
+
+
+class LabwareDefinitionError(ValueError):
+    pass
+
+
+def validate_definition(definition, load_name):
+    # Raises LabwareDefinitionError for a definition that is not a schema 2 labware definition of
+    # load_name with well geometry for every well it orders.
+    def fail(problem):
+        raise LabwareDefinitionError("%s: %s" % (load_name, problem))
+
+    for key in requiredKeys:
+        if key not in definition:
+            fail("missing %r" % key)
+    if definition['schemaVersion'] != 2:
+        fail("schema version %r is not supported" % definition['schemaVersion'])
+    if definition['parameters'].get('loadName') != load_name:
+        fail("load name is %r" % definition['parameters'].get('loadName'))
+    if 'displayName' not in definition['metadata'] or 'zDimension' not in definition['dimensions']:
+        fail("missing display name or height")
+    ordered = [name for column in definition['ordering'] for name in column]
+    if not ordered or len(set(ordered)) != len(ordered) or set(ordered) != set(definition['wells']):
+        fail("ordering does not list every well once")
+    for name, well in definition['wells'].items():
+        for key in requiredWellKeys:
+            if key not in well:
+                fail("well %s is missing %r" % (name, key))
+        if well['shape'] == 'circular' and 'diameter' not in well:
+            fail("circular well %s has no diameter" % name)
+        if well['shape'] == 'rectangular' and ('xDimension' not in well or 'yDimension' not in well):
+            fail("rectangular well %s has no x and y dimensions" % name)
+
+
+def read_resource(name):
+    if hasattr(resources, 'files'):
+        return resources.files(__name__).joinpath(name).read_bytes()
+    return resources.read_binary(__name__, name)
+
+
+def resource_names():
+    if hasattr(resources, 'files'):
+        return [entry.name for entry in resources.files(__name__).iterdir()]
+    return list(resources.contents(__name__))
+
+
+# Custom labware definitions bundled with the package. Each definition is read and validated the first
+# time it is asked for and kept in memory for the rest of the process.
+class LabwareRegistry:
+    def __init__(self):
+        self.definitions = {}
+
+    def names(self):
+        return sorted(name[:-len('.json')] for name in resource_names() if name.endswith('.json'))
+
+    def __contains__(self, load_name):
+        return load_name in self.names()
+
+    def definition(self, load_name):
+        # The parsed definition; shared between callers, so it must not be changed.
+        if load_name not in self.definitions:
+            try:
+                content = read_resource(load_name + '.json')
+            except (FileNotFoundError, IsADirectoryError):
+                raise KeyError("No bundled labware definition %r" % load_name)
+            self.definitions[load_name] = self.parse(load_name, content)
+        return self.definitions[load_name]
+
+    def parse(self, load_name, content):
+        definition = json.loads(content.decode('utf-8'))
+        validate_definition(definition, load_name)
+        return definition
+
+
+registry = LabwareRegistry()
+
+
+def custom_labware(load_name):
+    return registry.definition(load_name)
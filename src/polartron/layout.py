@@ -0,0 +1,181 @@
+import argparse
+import itertools
+import json
+import math
+
+from polartron.estimator import format_duration, record_run, summarize
+from polartron.planner import defaultLayout
+from polartron.simulation import timing
+from polartron.simulation.labware import slotOrigins
+
+# Slots labware may go in. Slot 12 holds the fixed trash and the thermocycler covers slots 7, 8, 10 and 11.
+deckSlots = ['1', '2', '3', '4', '5', '6', '9']
+
+# Slots under the thermocycler. The default layout, like the original protocol, has a tip rack in 8 and the
+# liquid trash in 11; items a layout already has there are left where they are, and nothing is moved there.
+thermocyclerSlots = ['7', '8', '10', '11']
+
+# Slots the magnetic and temperature modules may go in: the outer columns, where their cables reach.
+moduleSlots = ['1', '3', '4', '6', '9']
+modules = ['magneticModule', 'temperatureModule']
+
+
+def layout_items(layout):
+    # Every placed item of a layout, tip racks by their place in the order they are used.
+    items = [('p200TipRacks', index) for index in range(len(layout['p200TipRacks']))]
+    return items + [(name, None) for name in sorted(layout) if name != 'p200TipRacks']
+
+
+def item_slot(layout, item):
+    name, index = item
+    return layout[name][index] if index is not None else layout[name]
+
+
+def with_slots(layout, slots):
+    # The layout with each item moved to its slot in {item: slot}.
+    result = dict(layout, p200TipRacks=list(layout['p200TipRacks']))
+    for (name, index), slot in slots.items():
+        if index is None:
+            result[name] = slot
+        else:
+            result[name][index] = slot
+    return result
+
+
+def check_layout(layout):
+    # Raises ValueError unless every item has a slot of its own that it may go in.
+    slots = [item_slot(layout, item) for item in layout_items(layout)]
+    for slot in slots:
+        if slot not in deckSlots and slot not in thermocyclerSlots:
+            raise ValueError("Slot %s is not free for labware" % slot)
+    if len(set(slots)) != len(slots):
+        raise ValueError("Two items share a slot in %r" % (layout,))
+    for module in modules:
+        if layout[module] not in moduleSlots:
+            raise ValueError("The %s cannot go in slot %s" % (module, layout[module]))
+
+
+def location_slot(location):
+    # Slot of a recorded location: 'A1 of NEST 12 Well Reservoir 15 mL on 3' -> '3'.
+    return location.rsplit(' on ', 1)[-1]
+
+
+# <editor-fold desc="Re-costing">
+
+# Gantry moves between slots of a recorded run, grouped by the pair of slots, as points relative to their
+# slot. Moving labware to another slot moves every point of it by the same amount, so the run can be
+# re-costed for any layout without recording it again. Moves within a slot and all Z travel stay the same.
+class SlotMoves:
+    def __init__(self, trace):
+        self.groups = {}
+        previous = ('home', timing.homePoint)
+        for record in trace:
+            if record['command'] == 'home':
+                previous = ('home', timing.homePoint)
+            if 'point' not in record:
+                continue
+            slot = location_slot(record['location'])
+            origin = slotOrigins[slot]
+            point = (slot, (record['point'][0] - origin.x, record['point'][1] - origin.y))
+            if point[0] != previous[0]:
+                self.groups.setdefault((previous[0], slot), []).append((previous[1], point[1]))
+            previous = point
+        self.tables = {}
+
+    def cost(self, group, slots):
+        # Travel of one group of moves with its two slots placed at `slots`.
+        key = (group, slots)
+        if key not in self.tables:
+            offsets = [(0.0, 0.0) if slot == 'home' else (slotOrigins[slot].x, slotOrigins[slot].y)
+                       for slot in slots]
+            self.tables[key] = sum(math.hypot(end[0] + offsets[1][0] - start[0] - offsets[0][0],
+                                              end[1] + offsets[1][1] - start[1] - offsets[0][1])
+                                   for start, end in self.groups[group])
+        return self.tables[key]
+
+    def travel(self, moved):
+        # Travel between slots once every recorded slot in {slot: new slot} has moved.
+        return sum(self.cost(group, (moved.get(group[0], group[0]), moved.get(group[1], group[1])))
+                   for group in self.groups)
+
+# </editor-fold>
+
+
+def movable_items(layout):
+    # Items the optimizer may move: all but those the layout puts under the thermocycler.
+    return [item for item in layout_items(layout) if item_slot(layout, item) in deckSlots]
+
+
+def candidate_slots(layout):
+    # Every valid placement of the layout's movable items, as {item: slot}: the modules on module slots and
+    # the rest anywhere else on the free deck.
+    items = movable_items(layout)
+    others = [item for item in items if item[0] not in modules]
+    for moduleSlot in itertools.permutations(moduleSlots, len(modules)):
+        free = [slot for slot in deckSlots if slot not in moduleSlot]
+        for otherSlot in itertools.permutations(free, len(others)):
+            slots = dict(zip([(module, None) for module in modules], moduleSlot))
+            slots.update(zip(others, otherSlot))
+            yield slots
+
+
+# Search every valid layout for the one whose gantry travels least over the recorded run. The run is
+# recorded once with `layout`, re-costed for every candidate and recorded again with the best one, so
+# the report holds simulated travel and run time for both.
+def optimize_layout(sample_count=4, layout=None, trace=None, **run_kwargs):
+    layout = dict(defaultLayout, **(layout or {}))
+    check_layout(layout)
+    trace = trace or record_run(sample_count, layout=layout, **run_kwargs).trace
+    moves = SlotMoves(trace)
+    current = {item: item_slot(layout, item) for item in movable_items(layout)}
+    best = dict(current)
+    bestTravel = moves.travel({})
+    for slots in candidate_slots(layout):
+        travel = moves.travel({current[item]: slot for item, slot in slots.items()})
+        if travel < bestTravel - 1e-6:
+            best, bestTravel = slots, travel
+    optimized = with_slots(layout, best)
+
+    before = summarize(trace)
+    after = summarize(record_run(sample_count, layout=optimized, **run_kwargs).trace)
+    report = {
+        'layoutBefore': layout,
+        'layoutAfter': optimized,
+        'projectedTravelSaving': moves.travel({}) - bestTravel,
+        'travelBefore': before['travel'],
+        'travelAfter': after['travel'],
+        'secondsBefore': before['seconds'],
+        'secondsAfter': after['seconds']
+    }
+    return optimized, report
+
+
+def format_report(report):
+    lines = ['%-18s %-16s %s' % ('', 'before', 'after')]
+    for name in sorted(report['layoutBefore']):
+        lines.append('%-18s %-16s %s' % (name, report['layoutBefore'][name], report['layoutAfter'][name]))
+    lines.append('projected from the recorded run: %.1f m less travel between slots, about %.0f s' % (
+        report['projectedTravelSaving'] / 1000.0, report['projectedTravelSaving'] / timing.defaultGantrySpeed))
+    lines.append('gantry travel: %.1f m -> %.1f m (%.1f m saved)' % (
+        report['travelBefore'] / 1000.0, report['travelAfter'] / 1000.0,
+        (report['travelBefore'] - report['travelAfter']) / 1000.0))
+    lines.append('estimated run time: %s -> %s (%.0f s saved)' % (
+        format_duration(report['secondsBefore']), format_duration(report['secondsAfter']),
+        report['secondsBefore'] - report['secondsAfter']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Place labware and modules to minimise gantry travel.')
+    parser.add_argument('--samples', type=int, default=4, help='number of sample columns')
+    parser.add_argument('--out', help='write the layout to this JSON file, for run(layout=...)')
+    args = parser.parse_args(argv)
+    layout, report = optimize_layout(args.samples)
+    print(format_report(report))
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as output:
+            json.dump(layout, output, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+import math
+
+from polartron.motion import well_of
+
+# How far below the meniscus the tip is kept while following it down (mm).
+followSubmerge = 2.0
+
+# The meniscus drops by at most this much during one segment of a liquid following aspiration (mm).
+followStep = 2.0
+
+
+def cross_section(well):
+    # Horizontal area of a well (mm2). Round bottoms hold less than the cylinder above them, so heights
+    # worked out from this area are on the low side and a following tip stays under the surface.
+    if getattr(well, 'diameter', None):
+        return math.pi * (well.diameter / 2.0) ** 2
+    if getattr(well, 'length', None) and getattr(well, 'width', None):
+        return well.length * well.width
+    return well.max_volume / well.depth
+
+
+# <editor-fold desc="Liquid tracker">
+
+# Volume of liquid in every well of the labware it is given, kept up to date from the aspirates and
+# dispenses of the pipettes it watches. A multi-channel pipette draws from a trough with every channel, but
+# from a plate column one well per channel, so the top well of a column stands for the whole column.
+class LiquidTracker:
+    def __init__(self, labware):
+        self.labware = {id(item): item for item in labware}
+        self.rows = {id(item): len(item.columns()[0]) for item in labware}
+        self.volumes = {}
+
+    def tracks(self, well):
+        return well is not None and id(getattr(well, 'parent', None)) in self.labware
+
+    def load(self, well, volume):
+        if self.tracks(well):
+            self.volumes[id(well)] = float(volume)
+
+    def volume(self, well):
+        return self.volumes.get(id(well), 0.0)
+
+    def height(self, well):
+        # Height of the meniscus above the bottom of the well (mm).
+        return min(self.volume(well) / cross_section(well), well.depth)
+
+    def per_well(self, well, volume, channels):
+        # Volume that goes into or out of the well when every channel moves `volume`.
+        return volume * max(1, channels // self.rows[id(well.parent)])
+
+    def add(self, well, volume, channels=1):
+        if self.tracks(well):
+            self.volumes[id(well)] = self.volume(well) + self.per_well(well, volume, channels)
+
+    def remove(self, well, volume, channels=1):
+        # Pipettes are sent deeper than the liquid to take every last drop, so a well never goes below empty.
+        if self.tracks(well):
+            self.volumes[id(well)] = max(0.0, self.volume(well) - self.per_well(well, volume, channels))
+
+    def follow(self, well, volume, channels=1, clearance=1.0, submerge=followSubmerge, step=followStep):
+        # Splits an aspiration of `volume` per channel into (volume, height) segments that follow the meniscus
+        # down. Each segment is taken `submerge` below where the meniscus will be once it is done, and never
+        # closer to the bottom than `clearance`. Tracking is left to the pipette that aspirates.
+        perChannel = self.per_well(well, 1.0, channels)
+        stepVolume = step * cross_section(well) / perChannel
+        segments = []
+        left = self.volume(well) / perChannel
+        remaining = volume
+        while remaining > 1e-9:
+            part = min(remaining, stepVolume)
+            left = max(0.0, left - part)
+            height = max(clearance, min(left * perChannel / cross_section(well), well.depth) - submerge)
+            if segments and segments[-1][1] == height:
+                # The floor was reached; the rest is taken in one go.
+                segments[-1] = (segments[-1][0] + part, height)
+            else:
+                segments.append((part, height))
+            remaining -= part
+        return segments
+
+# </editor-fold>
+
+
+# <editor-fold desc="Tracked pipettes">
+
+# A pipette that reports what it aspirates and dispenses to a LiquidTracker. Everything else, including
+# speed and flow rate settings, goes straight through to the pipette.
+class TrackedPipette:
+    def __init__(self, pipette, tracker, ptx):
+        object.__setattr__(self, '_pipette', pipette)
+        object.__setattr__(self, '_tracker', tracker)
+        object.__setattr__(self, '_ptx', ptx)
+
+    def __getattr__(self, name):
+        return getattr(self._pipette, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._pipette, name, value)
+
+    def _liquid(self, args, kwargs):
+        # (volume, well) of an aspirate or dispense as the Protocol API reads its arguments. No location
+        # means where the pipette already is.
+        values = dict(zip(('volume', 'location'), args))
+        values.update(kwargs)
+        location = values.get('location')
+        if location is None:
+            location = self._ptx.location_cache
+        well = well_of(location) if hasattr(location, 'point') else location
+        return values.get('volume'), well
+
+    def aspirate(self, *args, **kwargs):
+        volume, well = self._liquid(args, kwargs)
+        if not volume:
+            volume = self._pipette.max_volume - self._pipette.current_volume
+        result = self._pipette.aspirate(*args, **kwargs)
+        self._tracker.remove(well, volume, self._pipette.channels)
+        return result
+
+    def dispense(self, *args, **kwargs):
+        volume, well = self._liquid(args, kwargs)
+        if not volume:
+            volume = self._pipette.current_volume
+        result = self._pipette.dispense(*args, **kwargs)
+        self._tracker.add(well, volume, self._pipette.channels)
+        return result
+
+# </editor-fold>
@@ -0,0 +1,82 @@
+from contextlib import contextmanager
+
+try:
+    from opentrons import types
+except ImportError:
+    from polartron.simulation import types
+
+# Named speed limits. 'z' caps the Z and A axes (mm/s) and 'speed' the straight line speed of the pipette
+# (mm/s); None leaves the robot default.
+profiles = {
+    # Tip below the meniscus: slow enough that liquid does not cling to the outside of the tip.
+    'in-liquid': {'z': 10, 'speed': 20},
+    # Tip in the well above the liquid, or moving along the well wall. The straight line speed alone keeps
+    # these moves gentle, so Z runs unlimited.
+    'near-meniscus': {'z': None, 'speed': 20},
+    'free-travel': {'z': None, 'speed': None}
+}
+
+# How far above the meniscus the in-liquid speed is kept when leaving a well (mm).
+meniscusClearance = 2
+
+
+def well_of(location):
+    # opentrons wraps the well of a Location in a LabwareLike; the simulation does not.
+    labware = location.labware
+    return getattr(labware, 'object', labware)
+
+
+# Applies motion profiles for a protocol. Speed settings are only sent when they change, and leaving a
+# well is split so that only the part of the move inside the well is slowed.
+class Motion:
+    def __init__(self, ptx, profiles=profiles):
+        self.ptx = ptx
+        self.profiles = profiles
+        self.zSpeed = None
+        self.changes = 0
+
+    def use(self, pipette, name):
+        profile = self.profiles[name]
+        if profile['z'] != self.zSpeed:
+            self.ptx.max_speeds['Z'] = self.ptx.max_speeds['A'] = profile['z']
+            self.zSpeed = profile['z']
+            self.changes += 1
+        if pipette.default_speed != profile['speed']:
+            pipette.default_speed = profile['speed']
+            self.changes += 1
+
+    @contextmanager
+    def profile(self, pipette, name):
+        # Use a profile for the moves in the block, then go back to free travel.
+        self.use(pipette, name)
+        try:
+            yield
+        finally:
+            self.use(pipette, 'free-travel')
+
+    def move(self, pipette, location, name='free-travel'):
+        self.use(pipette, name)
+        pipette.move_to(location)
+
+    def exit(self, pipette, well, height=0, liquid_height=None):
+        # Rise straight up to `height` above the top of the well. The part below the meniscus (all of the
+        # well when the liquid height is unknown) is run in-liquid, the rest of the well near-meniscus and
+        # anything above the well at full speed. Nothing is slowed when the tip is not in the well.
+        current = self.ptx.location_cache
+        top = well.top().point.z
+        target = top + height
+        if current is None or well_of(current) is not well or current.point.z >= min(top, target):
+            self.move(pipette, well.top(height))
+            self.use(pipette, 'free-travel')
+            return
+
+        bottom = well.bottom().point.z
+        offset = current.point - well.bottom().point
+        meniscus = top if liquid_height is None else bottom + liquid_height + meniscusClearance
+        z = current.point.z
+        for limit, name in ((meniscus, 'in-liquid'), (top, 'near-meniscus'), (target, 'free-travel')):
+            stop = min(limit, target)
+            if stop > z:
+                self.move(pipette, well.bottom(stop - bottom).move(types.Point(x=offset.x, y=offset.y)), name)
+                z = stop
+        self.use(pipette, 'free-travel')
@@ -0,0 +1,258 @@
+import argparse
+
+from polartron.plancache import PlanCache, cached_plan, defaultCacheDirectory
+
+# Calls that never move the gantry and never use a flow rate or speed.
+stillCalls = {('ctx', 'comment'), ('ctx', 'delay'), ('ctx', 'pause'), ('ctx', 'set_rail_lights'),
+              ('ctx', 'is_simulating')}
+
+# Settings that only matter when a command uses them: pipette speeds, everything under a pipette's
+# flow_rate and the axis speed limits in ctx.max_speeds.
+speedSettings = {'default_speed'}
+flowRateSuffix = '.flow_rate'
+maxSpeedsKey = 'ctx.max_speeds'
+
+# Instrument calls that leave the pipette somewhere the plan cannot name.
+untrackedMoves = {'pick_up_tip', 'return_tip', 'drop_tip', 'touch_tip', 'home'}
+
+
+class OptimizationError(RuntimeError):
+    pass
+
+
+def instrument_of(key):
+    # 'instrument:1.flow_rate' -> 'instrument:1'
+    return key.split('.')[0] if key.startswith('instrument:') else None
+
+
+def call_location(call):
+    # The encoded Location a call moves to, or None if it does not name one.
+    for value in list(call['args']) + list(call['kwargs'].values()):
+        if isinstance(value, dict) and 'location' in value:
+            return value
+    return None
+
+
+def moves(call):
+    if 'call' not in call:
+        return False
+    if (call['call'], call['name']) in stillCalls:
+        return False
+    return not call['call'].startswith('module:') or call['name'] in ('open_lid', 'close_lid')
+
+
+# <editor-fold desc="Positions">
+
+# Tracks where each pipette is after every call of a plan. A pipette's position is only known after a
+# call that named a Location and while no other pipette, lid or home has moved the gantry since.
+class Positions:
+    def __init__(self):
+        self.positions = {}
+
+    def get(self, instrument):
+        return self.positions.get(instrument)
+
+    def update(self, call):
+        if 'call' not in call or not moves(call):
+            return
+        instrument = instrument_of(call['call'])
+        if instrument is None:
+            self.positions = {}
+            return
+        location = call_location(call)
+        known = self.positions.get(instrument)
+        self.positions = {}
+        # A Well stands for a point the plan does not spell out (its bottom plus the pipette's clearance).
+        wells = [value for value in list(call['args']) + list(call['kwargs'].values())
+                 if isinstance(value, dict) and 'well' in value]
+        if call['name'] in untrackedMoves or wells:
+            return
+        self.positions[instrument] = location if location is not None else known
+
+# </editor-fold>
+
+
+# <editor-fold desc="Passes">
+
+def drop_duplicate_moves(calls):
+    # A move_to to where the pipette already is does not move it.
+    positions = Positions()
+    result = []
+    for call in calls:
+        if 'call' in call and call['name'] == 'move_to':
+            instrument = instrument_of(call['call'])
+            if instrument is not None and positions.get(instrument) == call_location(call):
+                continue
+        positions.update(call)
+        result.append(call)
+    return result
+
+
+def settings_used_by(call):
+    # Setting keys (object, name) whose value a call depends on; None means all of them.
+    if 'call' not in call:
+        return set()
+    if not moves(call) and call['call'].startswith('module:'):
+        return set()
+    if (call['call'], call['name']) in stillCalls:
+        return set()
+    instrument = instrument_of(call['call'])
+    if instrument is None:
+        return None
+    return {instrument, maxSpeedsKey}
+
+
+def setting(call):
+    # (object, name) of a flow rate, pipette speed or axis speed limit change, else None.
+    if 'setitem' in call and call['setitem'] == maxSpeedsKey:
+        return call['setitem'], call['name']
+    if 'set' in call and (call['set'].endswith(flowRateSuffix) or call['name'] in speedSettings):
+        return call['set'], call['name']
+    return None
+
+
+def sink_settings(calls):
+    # Speed and flow rate changes are held back until a command uses them and are then only issued if
+    # they change the value in force. Changes that are overwritten before they are used, or that set the
+    # value already in force, are dropped. Axis limits start at their defaults (None).
+    result = []
+    pending = {}
+    current = {}
+
+    def flush(keys):
+        for key in [key for key in pending if keys is None or key[0].split('.')[0] in keys or key[0] in keys]:
+            call = pending.pop(key)
+            if key in current and current[key] == call['value']:
+                continue
+            if key not in current and key[0] == maxSpeedsKey and call['value'] is None:
+                continue
+            current[key] = call['value']
+            result.append(call)
+
+    for call in calls:
+        key = setting(call)
+        if key is not None:
+            # A new value for the same setting replaces the held back one, keeping their order stable.
+            pending.pop(key, None)
+            pending[key] = call
+            continue
+        used = settings_used_by(call)
+        if used is None or used:
+            flush(used)
+        result.append(call)
+    return result
+
+# </editor-fold>
+
+
+# <editor-fold desc="Checking">
+
+def liquid_arguments(call):
+    # (volume, location, rate) of an aspirate or dispense call as the Protocol API reads them.
+    names = ('volume', 'location', 'rate')
+    values = dict(zip(names, call['args']))
+    values.update(call['kwargs'])
+    return values.get('volume'), values.get('location'), values.get('rate', 1.0)
+
+
+def liquid_events(calls):
+    # What each pipette does with liquid and where, with the flow rates and speeds in force. Two plans with
+    # the same events handle liquid the same way.
+    settings = {}
+    positions = Positions()
+    events = []
+    for call in calls:
+        key = setting(call)
+        if key is not None:
+            settings[key] = call['value']
+            continue
+        if 'call' not in call:
+            continue
+        instrument = instrument_of(call['call'])
+        before = positions.get(instrument) if instrument is not None else None
+        positions.update(call)
+        if instrument is None:
+            events.append((call['call'], call['name'], repr(call['args']), repr(call['kwargs'])))
+            continue
+        # Axis limits set back to None are the same as never set.
+        state = tuple(sorted((target, name, repr(value)) for (target, name), value in settings.items()
+                             if target.split('.')[0] in (instrument, 'ctx') and
+                             not (target == maxSpeedsKey and value is None)))
+        if call['name'] in ('aspirate', 'dispense'):
+            volume, location, rate = liquid_arguments(call)
+            events.append((instrument, call['name'], round(volume, 6), repr(location or before), rate, state))
+        elif call['name'] == 'move_to' and before == call_location(call):
+            continue
+        else:
+            events.append((instrument, call['name'], repr(call['args']), repr(call['kwargs']), state))
+    return events
+
+
+def check_equivalent(original, optimized):
+    before = liquid_events(original)
+    after = liquid_events(optimized)
+    for index, (old, new) in enumerate(zip(before, after)):
+        if old != new:
+            raise OptimizationError("Command %d changed: %r became %r" % (index, old, new))
+    if len(before) != len(after):
+        raise OptimizationError("%d commands became %d" % (len(before), len(after)))
+
+# </editor-fold>
+
+
+def count(calls):
+    return {
+        'settings': sum(1 for call in calls if setting(call) is not None),
+        'moves': sum(1 for call in calls if call.get('name') == 'move_to' and 'call' in call),
+        'liquid': sum(1 for call in calls if call.get('name') in ('aspirate', 'dispense', 'mix') and 'call' in call),
+        'total': len(calls)
+    }
+
+
+# Optimise a compiled command plan (see polartron.plancache). Returns the new plan and a report of what
+# each pass removed. The passes never change what happens to liquid: the result is checked against the
+# original, command by command, and OptimizationError is raised if anything differs.
+def optimize_plan(plan, verify=True):
+    calls = plan['calls']
+    report = {'before': count(calls)}
+    passes = [('duplicateMoves', drop_duplicate_moves), ('settings', sink_settings)]
+    optimized = calls
+    for name, optimize in passes:
+        size = len(optimized)
+        optimized = optimize(optimized)
+        report[name] = size - len(optimized)
+    report['after'] = count(optimized)
+    if verify:
+        check_equivalent(calls, optimized)
+    return dict(plan, calls=optimized, optimized=report), report
+
+
+def format_report(report):
+    lines = ['%-16s %8s %8s' % ('', 'before', 'after')]
+    for kind in ('settings', 'moves', 'liquid', 'total'):
+        lines.append('%-16s %8d %8d' % (kind, report['before'][kind], report['after'][kind]))
+    lines.append('removed: %d duplicate moves, %d speed and flow rate changes' %
+                 (report['duplicateMoves'], report['settings']))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Remove redundant commands from a compiled POLARtron plan.')
+    parser.add_argument('--samples', type=int, default=4, help='number of sample columns')
+    parser.add_argument('--cache', default=defaultCacheDirectory, help='cache directory')
+    parser.add_argument('--replay', action='store_true', help='compare simulated run times of both plans')
+    args = parser.parse_args(argv)
+
+    plan, hit = cached_plan(PlanCache(args.cache), sample_count=args.samples)
+    optimized, report = optimize_plan(plan)
+    print(format_report(report))
+    if args.replay:
+        from polartron.estimator import format_duration, summarize
+        from polartron.plancache import replay
+        from polartron.simulation import RecordingContext
+        for name, commands in (('original', plan), ('optimized', optimized)):
+            print('%s: %s' % (name, format_duration(summarize(replay(RecordingContext(), commands).trace)['seconds'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# Timing, speed and mix settings of a run, with the range each has to stay in. run() takes a dict of any
+# of these as `parameters`; the rest keep their defaults. Rates are flow rates (uL/s), heights are mm.
+#
+# name: (default, minimum, maximum, type)
+parameterSpecs = {
+    # Pipettes
+    'p20DefaultRate': (7.56, 0.5, 24.0, float),
+    'p300DefaultRate': (92.86, 5.0, 400.0, float),
+    'resuspendAspirateRate': (400, 5.0, 400.0, float),
+    'resuspendDispenseRate': (400, 5.0, 400.0, float),
+    'sideAspirateRate': (50, 5.0, 400.0, float),
+    'sideDispenseRate': (50, 5.0, 400.0, float),
+    'followAspirateRate': (60, 5.0, 400.0, float),
+    'followSettleSeconds': (1, 0.0, 60.0, float),
+    # Magnet
+    'lobindEngageHeight': (7.4, 0.0, 20.0, float),
+    # Mix repetitions
+    'masterMixMixes': (30, 1, 100, int),
+    'proteinaseKMixes': (30, 1, 100, int),
+    'beadResuspensionMixes': (60, 1, 200, int),
+    'bindingMixes': (30, 1, 100, int),
+    'washMixes': (20, 1, 100, int),
+    'elutionMixes': (20, 1, 100, int),
+    # Incubations (minutes)
+    'proteinaseKMinutes': (10, 0, 120, float),
+    'bindingMinutes': (10, 0, 120, float),
+    'pelletMinutes': (12, 0, 120, float),
+    'washPelletMinutes': (5, 0, 120, float),
+    'dryMinutes': (5, 0, 120, float),
+    'elutionPelletMinutes': (3, 0, 120, float),
+    # HackFlex library prep
+    'bltBeadResuspensionMixes': (20, 1, 100, int),
+    'tagmentationMixes': (5, 1, 100, int),
+    'stopMixes': (10, 1, 100, int),
+    'tagmentationMinutes': (5, 0, 120, float),
+    'stopMinutes': (5, 0, 120, float),
+    'gapFillMinutes': (3, 0, 120, float),
+    'indexPcrCycles': (12, 1, 40, int)
+}
+
+defaultParameters = {name: spec[0] for name, spec in parameterSpecs.items()}
+
+
+class ParameterError(ValueError):
+    pass
+
+
+def check_value(name, value, minimum=None, maximum=None):
+    default, lowest, highest, kind = parameterSpecs[name]
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ParameterError("%s must be a number, got %r" % (name, value))
+    if kind is int and value != int(value):
+        raise ParameterError("%s must be a whole number, got %r" % (name, value))
+    lowest = lowest if minimum is None else max(lowest, minimum)
+    highest = highest if maximum is None else min(highest, maximum)
+    if not lowest <= value <= highest:
+        raise ParameterError("%s must be between %g and %g, got %r" % (name, lowest, highest, value))
+    return int(value) if kind is int else value
+
+
+# The full parameter set for a run: the defaults, overridden by `parameters`. Raises ParameterError for an
+# unknown name or a value out of range.
+def resolve_parameters(parameters=None):
+    resolved = dict(defaultParameters)
+    for name, value in (parameters or {}).items():
+        if name not in parameterSpecs:
+            raise ParameterError("Unknown parameter %r" % (name,))
+        resolved[name] = check_value(name, value)
+    return resolved
+
+
+def check_constraints(parameters, constraints):
+    # Raises ParameterError unless every parameter is within the {name: {'min': ..., 'max': ...}} bounds.
+    resolved = resolve_parameters(parameters)
+    for name, bounds in constraints.items():
+        if name not in parameterSpecs:
+            raise ParameterError("Unknown parameter %r" % (name,))
+        check_value(name, resolved[name], bounds.get('min'), bounds.get('max'))
+    return resolved
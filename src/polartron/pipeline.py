@@ -0,0 +1,10 @@
+def split_batches(samples, batches=1):
+    # Consecutive runs of samples, as even as possible, with any extra samples in the first batches.
+    if not isinstance(batches, int) or not 1 <= batches <= len(samples):
+        raise ValueError("batches must be between 1 and %d, got %r" % (len(samples), batches))
+    size, extra = divmod(len(samples), batches)
+    result = []
+    for batch in range(batches):
+        start = batch * size + min(batch, extra)
+        result.append(list(samples[start:start + size + (batch < extra)]))
+    return result
@@ -0,0 +1,325 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import time
+
+try:
+    from opentrons import types
+except ImportError:
+    from polartron.simulation import types
+
+# Bumped whenever the command plan format changes, so that old cache entries are never replayed.
+planFormat = 2
+
+defaultCacheDirectory = os.path.join(os.path.expanduser('~'), '.cache', 'polartron', 'plans')
+
+# Sources that decide which commands a run issues. A change to any of them changes every cache key. The
+# simulation a plan is compiled against counts too: the scheduler orders tasks by its clock.
+protocolSources = ['protocols/run_polartron.py', 'planner.py', 'motion.py', 'scheduler.py', 'geometry.py',
+                   'liquids.py', 'tipreuse.py', 'parameters.py', 'labware/__init__.py',
+                   'labware/eppendorf_96_well_lobind_plate_500ul.json', 'simulation/__init__.py',
+                   'simulation/context.py', 'simulation/labware.py', 'simulation/timing.py', 'simulation/types.py']
+
+# Calls that only read state; they are passed through and never recorded.
+readOnlyCalls = {'is_simulating', 'commands', 'now', 'get', 'wells', 'wells_by_name', 'columns'}
+
+# Calls the scheduler makes on a context that keeps time for incubations (see polartron.scheduler).
+incubationCalls = {'start_incubation', 'await_incubation'}
+
+# Attributes that are objects the protocol writes to (pipette.flow_rate.aspirate = ...).
+writableAttributes = {'flow_rate', 'max_speeds'}
+
+
+# <editor-fold desc="Compiling">
+
+class Recorder:
+    # Wraps a protocol context, module or pipette and logs every call, attribute and item assignment in a
+    # form that can be replayed against another context.
+    def __init__(self, target, key, compiler):
+        object.__setattr__(self, '_target', target)
+        object.__setattr__(self, '_key', key)
+        object.__setattr__(self, '_compiler', compiler)
+
+    def __getattr__(self, name):
+        if name in incubationCalls:
+            return self._compiler.incubation(self._key, self._target, name)
+        if name in readOnlyCalls:
+            return self._compiler.read(self._key, self._target, name)
+        value = getattr(self._target, name)
+        if name in writableAttributes:
+            return self._compiler.wrap(value, self._key + '.' + name)
+        if not callable(value):
+            return value
+
+        def call(*args, **kwargs):
+            result = value(*args, **kwargs)
+            return self._compiler.record(self._key, name, args, kwargs, result)
+
+        return call
+
+    def __setattr__(self, name, value):
+        setattr(self._target, name, value)
+        self._compiler.emit({'set': self._key, 'name': name, 'value': self._compiler.encode(value)})
+
+    def __getitem__(self, item):
+        return self._target[item]
+
+    def __setitem__(self, item, value):
+        self._target[item] = value
+        self._compiler.emit({'setitem': self._key, 'name': item, 'value': self._compiler.encode(value)})
+
+
+class Compiler:
+    def __init__(self):
+        self.calls = []
+        self.labware = {}
+        self.recorders = {}
+        self.deadlines = {}
+
+    def wrap(self, target, key):
+        if key not in self.recorders:
+            self.recorders[key] = Recorder(target, key, self)
+        return self.recorders[key]
+
+    def read(self, key, target, name):
+        return getattr(target, name)
+
+    def incubation(self, key, target, name):
+        # An incubation is recorded as a deadline, {'incubate': task, 'seconds': ...} when it starts and
+        # {'await': task} where the scheduler resumes the task, and waited out on the simulation in between.
+        if key != 'ctx':
+            raise AttributeError(name)
+        if name == 'start_incubation':
+            def start(task, seconds):
+                self.deadlines[task] = target.now() + seconds
+                self.emit({'incubate': task, 'seconds': seconds})
+            return start
+
+        def wait(task):
+            remaining = self.deadlines.pop(task) - target.now()
+            if remaining > 0:
+                target.delay(seconds=remaining)
+            self.emit({'await': task})
+        return wait
+
+    def emit(self, call):
+        self.calls.append(call)
+
+    def record(self, key, name, args, kwargs, result):
+        call = {'call': key, 'name': name, 'args': [self.encode(arg) for arg in args],
+                'kwargs': {keyword: self.encode(arg) for keyword, arg in kwargs.items()}}
+        if name in ('load_labware', 'load_labware_from_definition'):
+            call['returns'] = 'labware:%d' % len(self.labware)
+            self.labware[id(result)] = call['returns']
+        elif name in ('load_instrument', 'load_module'):
+            call['returns'] = '%s:%d' % (name[5:], len(self.recorders))
+            result = self.wrap(result, call['returns'])
+        self.emit(call)
+        return result
+
+    def encode(self, value):
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        if isinstance(value, (list, tuple)):
+            return [self.encode(item) for item in value]
+        if isinstance(value, dict):
+            return {'dict': {key: self.encode(item) for key, item in value.items()}}
+        if hasattr(value, 'point') and hasattr(value, 'labware'):
+            well = value.labware
+            offset = value.point - well.bottom().point
+            return {'location': [self.labware[id(well.parent)], well.well_name, [offset.x, offset.y, offset.z]]}
+        if hasattr(value, 'well_name'):
+            return {'well': [self.labware[id(value.parent)], value.well_name]}
+        if id(value) in self.labware:
+            return {'labware': self.labware[id(value)]}
+        raise TypeError("Cannot record %r in a command plan" % (value,))
+
+
+def protocol_digest():
+    digest = hashlib.sha256()
+    root = os.path.dirname(os.path.abspath(__file__))
+    for source in protocolSources:
+        with open(os.path.join(root, source), 'rb') as sourceFile:
+            digest.update(source.encode('utf-8') + b'\0' + sourceFile.read() + b'\0')
+    return digest.hexdigest()
+
+
+def plan_key(params):
+    text = json.dumps({'format': planFormat, 'params': params, 'protocol': protocol_digest()}, sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+# Run the protocol once against the simulation and keep the Protocol API calls it made. params are the
+# keyword arguments of run() and have to be JSON serialisable. A plan is meant to be replayed on the robot,
+# one call after another, so it holds no simulation-only state: the simulation's background timeline is
+# never used, and incubations are kept as deadlines rather than delays. The robot pipettes at its own pace,
+# so the work the simulation fitted into an incubation may take it longer or shorter; a replay waits for
+# each incubation on its own clock, from where it started, and never cuts one short.
+def compile_plan(**params):
+    from polartron.protocols.run_polartron import run
+    from polartron.simulation import RecordingContext
+    compiler = Compiler()
+    run(compiler.wrap(RecordingContext(), 'ctx'), **params)
+    return {'format': planFormat, 'key': plan_key(params), 'params': params, 'calls': compiler.calls}
+
+# </editor-fold>
+
+
+# <editor-fold desc="Replaying">
+
+def decode(value, objects):
+    if isinstance(value, list):
+        return [decode(item, objects) for item in value]
+    if isinstance(value, dict):
+        if 'dict' in value:
+            return {key: decode(item, objects) for key, item in value['dict'].items()}
+        if 'location' in value:
+            labware, well, offset = value['location']
+            return objects[labware][well].bottom().move(types.Point(*offset))
+        if 'well' in value:
+            labware, well = value['well']
+            return objects[labware][well]
+        if 'labware' in value:
+            return objects[value['labware']]
+    return value
+
+
+def resolve(key, objects):
+    if key not in objects:
+        parent, name = key.rsplit('.', 1)
+        objects[key] = getattr(resolve(parent, objects), name)
+    return objects[key]
+
+
+# Issue the calls of a command plan against a protocol context. Only Protocol API calls are replayed;
+# the run log, alerts and profiling of run() do not take part.
+def replay(ptx, plan):
+    if plan.get('format') != planFormat:
+        raise ValueError("Command plan format %r is not supported" % plan.get('format'))
+    objects = {'ctx': ptx}
+    for call in plan['calls']:
+        replay_call(call, objects)
+    return ptx
+
+
+def replay_call(call, objects):
+    if 'incubate' in call or 'await' in call:
+        replay_incubation(call, objects)
+        return None
+    if 'call' in call:
+        target = resolve(call['call'], objects)
+        result = getattr(target, call['name'])(*decode(call['args'], objects),
+                                               **{key: decode(value, objects) for key, value in call['kwargs'].items()})
+        if 'returns' in call:
+            objects[call['returns']] = result
+        return result
+    if 'set' in call:
+        setattr(resolve(call['set'], objects), call['name'], decode(call['value'], objects))
+    else:
+        resolve(call['setitem'], objects)[call['name']] = decode(call['value'], objects)
+
+
+def replay_incubation(call, objects):
+    # Incubations are timed on the clock of the context the plan is replayed on: the simulation's, or the
+    # wall clock on the robot.
+    ptx = objects['ctx']
+    clock = getattr(ptx, 'now', time.monotonic)
+    deadlines = objects.setdefault('deadlines', {})
+    if 'incubate' in call:
+        deadlines[call['incubate']] = clock() + call['seconds']
+        return
+    # A resumed run never saw incubations that started in a phase it skipped; those are long over.
+    deadline = deadlines.pop(call['await'], None)
+    if deadline is not None and deadline > clock():
+        ptx.delay(seconds=deadline - clock())
+
+# </editor-fold>
+
+
+# <editor-fold desc="Cache">
+
+# Content addressed store of compiled command plans, one gzip compressed JSON file per key. Reading an
+# entry marks it as recently used; the least recently used entries are removed once there are more than
+# max_entries or they take more than max_bytes.
+class PlanCache:
+    def __init__(self, directory=defaultCacheDirectory, max_entries=32, max_bytes=64 * 1024 * 1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.json.gz')
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as entry:
+                plan = json.load(entry)
+        except (OSError, ValueError):
+            return None
+        os.utime(path)
+        return plan
+
+    def put(self, key, plan):
+        path = self.path(key)
+        temporary = path + '.tmp'
+        with gzip.open(temporary, 'wt', encoding='utf-8') as entry:
+            json.dump(plan, entry, separators=(',', ':'))
+        os.replace(temporary, path)
+        self.evict()
+
+    def entries(self):
+        # (last used, size, path) of every entry, least recently used first.
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json.gz'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(self.directory, name)))
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        size = sum(entry[1] for entry in entries)
+        while entries and (len(entries) > self.max_entries or size > self.max_bytes):
+            used, entrySize, path = entries.pop(0)
+            os.remove(path)
+            size -= entrySize
+
+
+def cached_plan(cache=None, **params):
+    # Returns the command plan for these run() parameters and whether it came from the cache.
+    cache = cache or PlanCache()
+    key = plan_key(params)
+    plan = cache.get(key)
+    if plan is not None:
+        return plan, True
+    plan = compile_plan(**params)
+    cache.put(key, plan)
+    return plan, False
+
+# </editor-fold>
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compile a POLARtron run to a cached command plan.')
+    parser.add_argument('--samples', type=int, default=4, help='number of sample columns')
+    parser.add_argument('--cache', default=defaultCacheDirectory, help='cache directory')
+    parser.add_argument('--replay', action='store_true', help='replay the plan against the simulation')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    plan, hit = cached_plan(PlanCache(args.cache), sample_count=args.samples)
+    print('%s %s: %d calls in %.3f s' % ('hit' if hit else 'compiled', plan['key'][:16], len(plan['calls']),
+                                         time.perf_counter() - started))
+    if args.replay:
+        from polartron.simulation import RecordingContext
+        started = time.perf_counter()
+        ctx = replay(RecordingContext(), plan)
+        print('replayed %d commands in %.3f s' % (len(ctx.trace), time.perf_counter() - started))
+
+
+if __name__ == '__main__':
+    main()
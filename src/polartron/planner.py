@@ -0,0 +1,334 @@
+import math
+
+# <editor-fold desc="Deck layout">
+
+# Slots used by the protocol. Tip racks are consumed in the order listed.
+defaultLayout = {
+    'p200TipRacks': ['9', '6', '5', '8'],
+    'p20TipRack': '2',
+    'reagentResevoir': '3',
+    'trash': '11',
+    'magneticModule': '4',
+    'temperatureModule': '1'
+}
+
+plateColumns = 12
+plateRows = 'ABCDEFGH'
+
+# </editor-fold>
+
+# <editor-fold desc="Per sample needs">
+
+# List of p200 tips needed for each sample
+p200TipNeeds = [
+    'mixTip',
+    'viralBufferTip1',
+    'viralBufferTip2',
+    'magbeadBufferTip1',
+    'magbeadBufferTip2',
+    'ethanolTip1',
+    'ethanolTip2',
+    'ethanolTip3',
+    'elutionTip',
+    'stopTip',
+    'bltBeadsWashTip',
+    'bltBeadsWashTip2',
+    'pcrTip'
+]
+
+# List of p20 tips needed for each sample
+p20TipNeeds = [
+    'rtPcrPool1Tip',
+    'rtPcrPool2Tip',
+    'bltBeadTip'
+]
+
+# Magnetic module plate wells needed for each sample
+lobindWellNeeds = [
+    'extractionWell',
+    'bltBeadxWashWell',
+    'sampleTipWashWell'
+]
+
+# Thermocycler plate wells needed for each sample
+rtPcrWellNeeds = ['rtPcrPool1', 'rtPcrPool2']
+indexPcrWellNeeds = ['indexPcrWell']
+
+# Cold reagent plate wells needed for each sample
+coldWellNeeds = ['pcrWithIndex']
+
+# Needs and reagents that only matter when the HackFlex library prep or tip washing runs. The second BLT
+# bead wash takes tips of its own (bltBeadsWashTip2): the first wash tips have been in the sample wells and
+# may not go back into the shared wash buffer. With these, library prep fits 3 samples on the default deck,
+# with or without tip washing; max_samples() gives the limit for any layout.
+libraryPrepNeeds = {'stopTip', 'bltBeadsWashTip2', 'pcrTip', 'bltBeadTip', 'bltBeadxWashWell', 'indexPcrWell',
+                    'pcrWithIndex', 'bltBeads', 'stopBuffer', 'bltBeadWashBuffer'}
+tipWashNeeds = {'sampleTipWashWell', 'wash_well'}
+
+# In tip washing runs these roles reuse the tip of the role they map to, which serves the same sample and
+# reagent in an earlier step and is washed in between. The RT-PCR pool tips are never shared: a wash in water
+# would leave Pool 1 primers on the tip for the Pool 2 reaction.
+reusedTipRoles = {
+    'viralBufferTip2': 'viralBufferTip1',
+    'ethanolTip3': 'ethanolTip2'
+}
+
+# Column preference for each plate. RT-PCR reactions take the middle of the thermocycler plate and
+# index PCR wells the outside columns; index primers sit at the end of the cold plate, away from the
+# Protinase K (column 1) and RT-PCR (column 4) master mixes.
+rtPcrColumns = [3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 1, 2]
+indexPcrColumns = [1, 2, 11, 12, 10, 9, 8, 7, 6, 5, 4, 3]
+coldIndexColumns = [9, 10, 11, 12, 5, 6, 7, 8, 2, 3]
+
+# RT-PCR master mixes are plated with half a column of p20 tips each. Pool 1 picks up rows E to H of a
+# column first, which leaves rows A to D of the same column for pool 2.
+rtPcrPlatingTips = [('rtPcrPool1PlatingTip', 'E'), ('rtPcrPool2PlatingTip', 'A')]
+
+# </editor-fold>
+
+# <editor-fold desc="Reagents">
+
+# Reservoir well and volume drawn per sample (per channel, uL) for each room temperature reagent.
+reagentWells = {
+    'viralBufferBeads': ('A1', 125),
+    'viralBuffer': ('A2', 125),
+    'magbeadBuffer1': ('A3', 150),
+    'magbeadBuffer2': ('A4', 150),
+    'ethanol1': ('A5', 175),
+    'ethanol2': ('A6', 175),
+    'elutionBuffer': ('A7', 20),
+    'mineralOil': ('A8', 65),
+    'stopBuffer': ('A9', 20),
+    'bltBeadWashBuffer': ('A10', 200),
+    'wash_well': ('A11', 50),
+    'bltBeads': ('A12', 20)
+}
+
+# Cold plate well, volume drawn per sample and volume mixed before use (uL).
+coldReagentWells = {
+    'protinaseKMasterMix': ('A1', 25, 100),
+    'rtPcrPool1MasterMix': ('A4', 25, 80),
+    'rtPcrPool2MasterMix': ('E4', 25, 80)
+}
+
+reservoirWellVolume = 15000
+reservoirDeadVolume = 1000
+pcrWellVolume = 200
+pcrDeadVolume = 10
+
+# Index PCR master mix, with the indexes of its sample, drawn from each pcrWithIndex well (uL).
+indexPcrMixVolume = 40
+
+# Water in each sample's tip wash well (uL).
+tipWashWellVolume = 300
+
+# What the operator loads into the wells of each sample, with the volume (uL).
+sampleLoadingVolumes = {
+    'pcrWithIndex': ('index mix', indexPcrMixVolume + pcrDeadVolume),
+    'sampleTipWashWell': ('tip wash', tipWashWellVolume)
+}
+
+# </editor-fold>
+
+
+class CapacityError(ValueError):
+    def __init__(self, sample_count, report, limit=None):
+        message = "%d samples do not fit on the deck" % sample_count
+        if limit is not None:
+            message += "; at most %d do with this layout and these options, on one plate per module" % limit
+        super().__init__("%s.\n%s" % (message, report))
+        self.sample_count = sample_count
+        self.report = report
+        self.limit = limit
+
+
+def sample_names(sample_count):
+    return ['Sample #' + str(column) for column in range(1, sample_count + 1)]
+
+
+def active_needs(needs, library_prep=False, tip_wash=False):
+    active = []
+    for need in needs:
+        if need in libraryPrepNeeds and not library_prep:
+            continue
+        if need in tipWashNeeds and not tip_wash:
+            continue
+        active.append(need)
+    return active
+
+
+def tip_needs(needs, library_prep=False, tip_wash=False):
+    # The tip roles that take a tip of their own.
+    return [need for need in active_needs(needs, library_prep, tip_wash) if not (tip_wash and need in reusedTipRoles)]
+
+
+def p200_tip_columns(layout):
+    # Each rack is walked from column 12 down to column 1.
+    return [(rack, 'A' + str(i)) for rack in p200_rack_names(layout) for i in reversed(range(1, 13))]
+
+
+def p200_rack_names(layout):
+    return ['p200TipRack' + str(slot) for slot in layout['p200TipRacks']]
+
+
+def capacity_needs(sample_count, layout=None, library_prep=False, tip_wash=False):
+    layout = layout or defaultLayout
+    p200 = tip_needs(p200TipNeeds, library_prep, tip_wash)
+    p20 = tip_needs(p20TipNeeds, library_prep, tip_wash)
+    lobind = active_needs(lobindWellNeeds, library_prep, tip_wash)
+    indexPcr = active_needs(indexPcrWellNeeds, library_prep, tip_wash)
+    cold = active_needs(coldWellNeeds, library_prep, tip_wash)
+
+    rows = [
+        ('p300 tip columns', sample_count * len(p200), len(layout['p200TipRacks']) * plateColumns),
+        ('p20 tip columns', sample_count * len(p20) + 1, plateColumns),
+        ('magnetic plate columns', sample_count * len(lobind), plateColumns),
+        ('thermocycler plate columns', sample_count * (len(rtPcrWellNeeds) + len(indexPcr)), plateColumns),
+        ('cold plate index columns', sample_count * len(cold), len(coldIndexColumns))
+    ]
+    for reagent in active_needs(reagentWells, library_prep, tip_wash):
+        well, volume = reagentWells[reagent]
+        if volume:
+            rows.append(('reservoir ' + well + ' ' + reagent + ' (uL)',
+                         reagent_volume(reagent, sample_count), reservoirWellVolume))
+    for reagent, (well, volume, mixVolume) in coldReagentWells.items():
+        rows.append(('cold plate ' + well + ' ' + reagent + ' (uL)',
+                     cold_reagent_volume(reagent, sample_count), pcrWellVolume))
+    return rows
+
+
+def reagent_volume(reagent, sample_count):
+    # Volume to load into a reservoir trough; every sample draws with all 8 channels.
+    well, volume = reagentWells[reagent]
+    if not volume:
+        return 0
+    return sample_count * volume * len(plateRows) + reservoirDeadVolume
+
+
+def cold_reagent_volume(reagent, sample_count):
+    # Volume to load into each well of a cold plate master mix column. The well has to hold enough to
+    # be mixed before plating even when only a few samples are run.
+    well, volume, mixVolume = coldReagentWells[reagent]
+    return max(sample_count * volume, mixVolume) + pcrDeadVolume
+
+
+def capacity_report(sample_count, layout=None, library_prep=False, tip_wash=False):
+    rows = capacity_needs(sample_count, layout, library_prep, tip_wash)
+    width = max(len(name) for name, needed, available in rows)
+    lines = ["Capacity report for %d sample(s):" % sample_count,
+             "  %s %9s %9s" % ('resource'.ljust(width), 'needed', 'available')]
+    for name, needed, available in rows:
+        flag = '  <-- over capacity' if needed > available else ''
+        lines.append("  %s %9g %9g%s" % (name.ljust(width), needed, available, flag))
+    lines.append("Plates are not swapped during a run: each module holds one plate, so no run takes more than %d "
+                 "samples. Split larger manifests over runs (see polartron.dispatch)." % plateColumns)
+    return '\n'.join(lines)
+
+
+def max_samples(layout=None, library_prep=False, tip_wash=False):
+    # One plate per module: a sample takes at least one column of each, so no layout goes past a plate.
+    count = 0
+    while count < plateColumns and fits(count + 1, layout, library_prep, tip_wash):
+        count += 1
+    return count
+
+
+def fits(sample_count, layout=None, library_prep=False, tip_wash=False):
+    return all(needed <= available for name, needed, available in
+               capacity_needs(sample_count, layout, library_prep, tip_wash))
+
+
+# Assign tips, wells and reagents for a run. Raises CapacityError before anything moves if the run does
+# not fit on the deck.
+def plan_run(sample_count=4, layout=None, library_prep=False, tip_wash=False, names=None):
+    layout = dict(defaultLayout, **(layout or {}))
+    if not isinstance(sample_count, int) or sample_count < 1:
+        raise ValueError("sample_count must be a positive integer, got %r" % (sample_count,))
+    if not fits(sample_count, layout, library_prep, tip_wash):
+        raise CapacityError(sample_count, capacity_report(sample_count, layout, library_prep, tip_wash),
+                            max_samples(layout, library_prep, tip_wash))
+
+    samples = list(names) if names else sample_names(sample_count)
+    if len(samples) != sample_count or len(set(samples)) != sample_count:
+        raise ValueError("names must hold %d unique sample names" % sample_count)
+    polar = {sample: {} for sample in samples}
+
+    # Tips are handed out role by role so that one role for all samples sits together in a rack.
+    p200Tips = p200_tip_columns(layout)
+    tipCounter = 0
+    for tip in tip_needs(p200TipNeeds, library_prep, tip_wash):
+        for sample in samples:
+            polar[sample][tip] = p200Tips[tipCounter]
+            tipCounter += 1
+
+    p20Columns = list(range(1, plateColumns + 1))
+    for tip in tip_needs(p20TipNeeds, library_prep, tip_wash):
+        for sample in samples:
+            polar[sample][tip] = ('p20TipRack', 'A' + str(p20Columns.pop(0)))
+    if tip_wash:
+        for tip in active_needs(reusedTipRoles, library_prep, tip_wash):
+            for sample in samples:
+                polar[sample][tip] = polar[sample][reusedTipRoles[tip]]
+    shared = {}
+    platingColumn = str(p20Columns.pop(0))
+    for tip, row in rtPcrPlatingTips:
+        shared[tip] = ('p20TipRack', row + platingColumn)
+
+    # Wells are handed out sample by sample so that each sample's wells are neighbours.
+    lobindColumns = list(range(1, plateColumns + 1))
+    for sample in samples:
+        for well in active_needs(lobindWellNeeds, library_prep, tip_wash):
+            polar[sample][well] = ('magneticModulePlate', 'A' + str(lobindColumns.pop(0)))
+
+    thermocyclerColumns = list(rtPcrColumns)
+    for sample in samples:
+        for well in rtPcrWellNeeds:
+            polar[sample][well] = ('thermocyclerPlate', 'A' + str(thermocyclerColumns.pop(0)))
+    indexColumns = [column for column in indexPcrColumns if column in thermocyclerColumns]
+    coldColumns = list(coldIndexColumns)
+    for sample in samples:
+        for well in active_needs(indexPcrWellNeeds, library_prep, tip_wash):
+            polar[sample][well] = ('thermocyclerPlate', 'A' + str(indexColumns.pop(0)))
+        for well in active_needs(coldWellNeeds, library_prep, tip_wash):
+            polar[sample][well] = ('coldReagentsPlate', 'A' + str(coldColumns.pop(0)))
+
+    reagents = {}
+    for reagent, (well, volume) in reagentWells.items():
+        reagents[reagent] = ('reagentResevoir', well)
+    for reagent, (well, volume, mixVolume) in coldReagentWells.items():
+        reagents[reagent] = ('coldReagentsPlate', well)
+
+    loading = {}
+    for reagent in active_needs(reagentWells, library_prep, tip_wash):
+        well, volume = reagentWells[reagent]
+        if volume:
+            loading[reagent] = reagent_volume(reagent, sample_count)
+    for reagent, (well, volume, mixVolume) in coldReagentWells.items():
+        loading[reagent] = cold_reagent_volume(reagent, sample_count)
+
+    return {
+        'sampleCount': sample_count,
+        'samples': samples,
+        'layout': layout,
+        'libraryPrep': library_prep,
+        'tipWash': tip_wash,
+        'polar': polar,
+        'shared': shared,
+        'reagents': reagents,
+        'loadingVolumes': loading
+    }
+
+
+def loading_sheet(plan):
+    # Operator facing list of what to load where before pressing resume.
+    lines = ["Reagent loading for %d sample(s):" % plan['sampleCount']]
+    for reagent, volume in plan['loadingVolumes'].items():
+        labware, well = plan['reagents'][reagent]
+        perWell = ' per well' if labware == 'coldReagentsPlate' else ''
+        lines.append("  %-22s %-18s %-4s %7.0f uL%s" % (reagent, labware, well, math.ceil(volume), perWell))
+    for sample in plan['samples']:
+        for need, (name, volume) in sampleLoadingVolumes.items():
+            if need in plan['polar'][sample]:
+                labware, well = plan['polar'][sample][need]
+                lines.append("  %-22s %-18s %-4s %7.0f uL per well" % (sample + ' ' + name, labware, well, volume))
+    return '\n'.join(lines)
@@ -0,0 +1,145 @@
+import argparse
+import functools
+import time
+import types
+
+
+class HelperStats:
+    def __init__(self):
+        self.calls = 0
+        self.commands = 0
+        self.seconds = 0.0
+        self.selfSeconds = 0.0
+
+
+# Opt-in instrumentation for the protocol helpers. Wrapped helpers record call counts, the protocol
+# commands they issue and their elapsed time, estimated by the simulation clock (ptx.now) or measured with
+# time.monotonic on the robot. Totals are kept per update_log phase, per sample and per helper, along with
+# the self time of every helper call stack for flame graphs. Helpers that are generators are only timed
+# while they run, not while they are suspended in an incubation.
+class Profiler:
+    def __init__(self, ptx=None, clock=None):
+        self.ptx = ptx
+        self.clock = clock or getattr(ptx, 'now', time.monotonic)
+        self.phase_name = None
+        self.sample_name = None
+        self.stats = {}
+        self.stacks = {}
+        self.stack = []
+
+    def phase(self, message):
+        self.phase_name = message
+        self.sample_name = None
+
+    def sample(self, sample):
+        self.sample_name = sample
+
+    def command_count(self):
+        if self.ptx is None or not hasattr(self.ptx, 'commands'):
+            return 0
+        return len(self.ptx.commands())
+
+    def wrap(self, helper, name=None):
+        name = name or helper.__name__
+
+        @functools.wraps(helper)
+        def profiled(*args, **kwargs):
+            frame = self.enter(name)
+            try:
+                result = helper(*args, **kwargs)
+            finally:
+                self.leave(frame)
+            if isinstance(result, types.GeneratorType):
+                return self.resume(name, result)
+            return result
+
+        return profiled
+
+    def resume(self, name, steps):
+        # Time each stretch of a generator helper between its yields.
+        while True:
+            frame = self.enter(name, call=False)
+            try:
+                incubation = next(steps)
+            except StopIteration:
+                return
+            finally:
+                self.leave(frame)
+            yield incubation
+
+    def enter(self, name, call=True):
+        frame = {'name': name, 'call': call, 'start': self.clock(), 'commands': self.command_count(),
+                 'child': 0.0, 'phase': self.phase_name, 'sample': self.sample_name}
+        self.stack.append(frame)
+        return frame
+
+    def leave(self, frame):
+        # Frames of identical calls compare equal, so the frame is found by identity, innermost first.
+        index = max(position for position, entry in enumerate(self.stack) if entry is frame)
+        del self.stack[index]
+        seconds = self.clock() - frame['start']
+        key = (frame['phase'], frame['sample'], frame['name'])
+        stats = self.stats.setdefault(key, HelperStats())
+        stats.calls += frame['call']
+        stats.seconds += seconds
+        stats.selfSeconds += seconds - frame['child']
+        stats.commands += self.command_count() - frame['commands']
+        if self.stack:
+            self.stack[-1]['child'] += seconds
+        path = tuple(part for part in (frame['phase'], frame['sample']) if part) + \
+            tuple(parent['name'] for parent in self.stack) + (frame['name'],)
+        self.stacks[path] = self.stacks.get(path, 0.0) + seconds - frame['child']
+
+    def rows(self, by=('phase', 'helper')):
+        # Totals grouped by any of 'phase', 'sample' and 'helper', largest total time first.
+        fields = ('phase', 'sample', 'helper')
+        totals = {}
+        for key, stats in self.stats.items():
+            group = tuple(value for field, value in zip(fields, key) if field in by)
+            total = totals.setdefault(group, HelperStats())
+            total.calls += stats.calls
+            total.commands += stats.commands
+            total.seconds += stats.seconds
+            total.selfSeconds += stats.selfSeconds
+        return sorted(totals.items(), key=lambda item: -item[1].selfSeconds)
+
+    def format_table(self, by=('phase', 'helper')):
+        rows = self.rows(by)
+        labels = [' / '.join('-' if value is None else str(value) for value in group) for group, stats in rows]
+        width = max([len(label) for label in labels] + [len(' / '.join(by))])
+        lines = ['%s %7s %9s %10s %10s' % (' / '.join(by).ljust(width), 'calls', 'commands', 'seconds', 'self'),
+                 '-' * (width + 40)]
+        for label, (group, stats) in zip(labels, rows):
+            lines.append('%s %7d %9d %10.1f %10.1f' % (label.ljust(width), stats.calls, stats.commands,
+                                                       stats.seconds, stats.selfSeconds))
+        return '\n'.join(lines)
+
+    def collapsed(self):
+        # Brendan Gregg's collapsed stack format (frame;frame;frame value), with self time in milliseconds.
+        return '\n'.join('%s %d' % (';'.join(frame.replace(';', ',') for frame in path), round(seconds * 1000))
+                         for path, seconds in sorted(self.stacks.items()) if round(seconds * 1000) > 0)
+
+    def write_collapsed(self, path):
+        with open(path, 'w', encoding='utf-8') as output:
+            output.write(self.collapsed() + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Profile the protocol helpers of a simulated POLARtron run.')
+    parser.add_argument('--samples', type=int, default=4, help='number of sample columns')
+    parser.add_argument('--by', default='phase,helper', help='comma separated grouping: phase, sample, helper')
+    parser.add_argument('--collapsed', help='write collapsed stacks for flame graph tools to this file')
+    args = parser.parse_args(argv)
+
+    from polartron.estimator import record_run
+    from polartron.simulation import RecordingContext
+    ctx = RecordingContext()
+    profiler = Profiler(ctx)
+    record_run(args.samples, ctx=ctx, profiler=profiler)
+    print(profiler.format_table(tuple(args.by.split(','))))
+    if args.collapsed:
+        profiler.write_collapsed(args.collapsed)
+
+
+if __name__ == '__main__':
+    main()
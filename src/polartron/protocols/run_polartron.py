@@ -1,8 +1,23 @@
-from opentrons import types
-from datetime import datetime
-import subprocess
 import os
-import os.path
+
+try:
+    from opentrons import types
+except ImportError:
+    # Without opentrons the protocol runs against the bundled simulation (python -m polartron.simulation).
+    from polartron.simulation import types
+
+from polartron.alerts import AlertWorker, FakePlayer, Mpg123Player
+from polartron.checkpoint import Checkpoint
+from polartron.geometry import GeometryIndex
+from polartron.labware import custom_labware
+from polartron.liquids import LiquidTracker, TrackedPipette
+from polartron.parameters import resolve_parameters
+from polartron.motion import Motion
+from polartron.planner import plan_run, p200_rack_names, loading_sheet, sampleLoadingVolumes
+from polartron.runlog import RunLogger
+from polartron.scheduler import Scheduler, incubate
+from polartron.simulation import RecordingContext
+from polartron.tipreuse import GuardedPipette, TipTracker
 
 metadata = {
     'protocolName': 'POLARtron: Nucleic Acid Extraction & Split Pool RT-PCR Modules',
@@ -10,32 +25,64 @@ metadata = {
     'apiLevel': '2.10'
 }
 
-def run(ptx, experiment_name=""):
-    run_log_directory = "/var/lib/jupyter/notebooks/run_logs"
+def run(ptx, experiment_name="", sample_count=4, plan=None, alerts=None, distribute=False, profiler=None,
+        checkpoint=None, precondition=False, liquid_following=False, log_directory=None,
+        parameters=None, layout=None, telemetry=None, library_prep=False, tip_wash=False):
+    # Opt-in changes to the validated liquid handling: distribute gives reagents added before the sample is
+    # touched from one shared tip, side dispensed (see distribute_reagent), and liquid_following draws
+    # supernatant from under the tracked meniscus.
+
+    # Run logs are only written on the robot, unless a directory is given.
+    run_log_directory = log_directory or "/var/lib/jupyter/notebooks/run_logs"
+
+    # Timing, speed and mix settings (see polartron.parameters), checked before anything moves.
+    settings = resolve_parameters(parameters)
+
+    # <editor-fold desc="Plan run">
+    # Tips, wells and reagents are assigned up front so that a run that does not fit on the deck fails
+    # here rather than part way through.
+    if plan is None:
+        plan = plan_run(sample_count, layout=layout, library_prep=library_prep, tip_wash=tip_wash)
+    layout = plan['layout']
+    samples = plan['samples']
+    library_prep = plan['libraryPrep']
+    # With tip washing, some roles reuse the tip of an earlier role of their sample (see polartron.tipreuse).
+    tip_wash = plan['tipWash']
 
-    # <editor-fold desc="Create sample dictionary">
-    # Dynamically create sample list for run based on the number of samples.
-    polar = dict()
-    samples = []
-    for column in range(1, 5):
-        polar['Sample #' + str(column)] = {}
-        samples.append('Sample #' + str(column))
+    # </editor-fold>
+
+    # <editor-fold desc="Checkpoint">
+    # Opt-in: given a checkpoint file (or True, for one next to the run logs), the run saves its progress at
+    # every phase so that an interrupted run can be picked up again with polartron.checkpoint.resume. The
+    # protocol then runs against a simulated copy of the deck and every command is passed on to the robot,
+    # except those of phases an earlier run already did. A disagreement between the copy and the robot
+    # stops the run with a SimulationError, so checkpointing is off unless asked for.
+    if checkpoint is True:
+        checkpoint = os.path.join(run_log_directory, (experiment_name + "_" if experiment_name else "") +
+                                  "checkpoint.json")
+    if isinstance(checkpoint, str):
+        checkpoint = Checkpoint(checkpoint)
+    if not checkpoint:
+        checkpoint = None
+    if checkpoint is not None:
+        ptx = checkpoint.context(ptx)
+
+    # </editor-fold>
+
+    # <editor-fold desc="Operator alerts">
+    # Sounds play on a worker thread started with the run (see Run); nothing is played when simulating.
+    if alerts is None:
+        alerts = AlertWorker(FakePlayer() if ptx.is_simulating() else Mpg123Player())
 
     # </editor-fold>
 
     # <editor-fold desc="Define tips">
 
     # p200 dynamic tip box alloc
-    p200TipRack = [ptx.load_labware('opentrons_96_tiprack_300ul', s) for s in ['9', '6', '5', '8']]
-
-    # p200 tip enumeration
-    p200Tips = [tr['A' + str(i)] for tr in p200TipRack for i in reversed(range(1, 13))]
+    p200TipRack = [ptx.load_labware('opentrons_96_tiprack_300ul', s) for s in layout['p200TipRacks']]
 
     # p20 tip box alloc
-    p20TipRack = ptx.load_labware('opentrons_96_tiprack_20ul', '2')
-
-    # p20 tip enumeration
-    p20Tips = [p20TipRack['A' + str(i)] for i in range(1, 13)]
+    p20TipRack = ptx.load_labware('opentrons_96_tiprack_20ul', layout['p20TipRack'])
 
     # </editor-fold>
 
@@ -46,11 +93,11 @@ def run(ptx, experiment_name=""):
     p20 = ptx.load_instrument('p20_multi_gen2', 'right')
 
     # Trash bin.
-    trash = ptx.load_labware('agilent_1_reservoir_290ml', 11)['A1']
+    trash = ptx.load_labware('agilent_1_reservoir_290ml', layout['trash'])['A1']
 
     # Load modules
-    magneticModule = ptx.load_module('magnetic module gen2', '4')
-    temperatureModule = ptx.load_module('temperature module gen2', '1')
+    magneticModule = ptx.load_module('magnetic module gen2', layout['magneticModule'])
+    temperatureModule = ptx.load_module('temperature module gen2', layout['temperatureModule'])
     thermocyclerModule = ptx.load_module('thermocycler')
 
     # </editor-fold>
@@ -58,148 +105,163 @@ def run(ptx, experiment_name=""):
     # <editor-fold desc="Define plates, reservoirs and trash">
 
     # Plates & reservoirs
-    reagentResevoir = ptx.load_labware('nest_12_reservoir_15ml', '3')
+    reagentResevoir = ptx.load_labware('nest_12_reservoir_15ml', layout['reagentResevoir'])
     thermocyclerPlate = thermocyclerModule.load_labware('biorad_96_wellplate_200ul_pcr')
     coldReagentsPlate = temperatureModule.load_labware('biorad_96_wellplate_200ul_pcr')
-    magneticModulePlate = magneticModule.load_labware('eppendorf_96_well_lobind_plate_500ul')
-
-    # </editor-fold>
-
-    # <editor-fold desc="Tip assignments">
-
-    # List of p200 tips needed for each s
-    p200TipNeeds = [
-        'mixTip',  # Tip 1 (Box 1)
-        'viralBufferTip1',  # Tip 2 (Box 1)
-        'viralBufferTip2',  # Tip 3 (Box 1)
-        'magbeadBufferTip1',  # Tip 4 (Box 2)
-        'magbeadBufferTip2',  # Tip 5 (Box 2)
-        'ethanolTip1',  # Tip 6 (Box 2)
-        'ethanolTip2',  # Tip 7 (Box 3)
-        'ethanolTip3',  # Tip 8 (Box 3)
-        'elutionTip',  # Tip 9 (Box 3)
-        'stopTip',  # Tip 10 (Box 4)
-        'bltBeadsWashTip',  # Tip 11 (Box 4)
-        'pcrTip'  # Tip 12 (Box 4)
-    ]
-
-    # List of p20 tips needed for each s
-    p20TipNeeds = [
-        'rtPcrPool1Tip',  # Tip 1
-        'rtPcrPool2Tip',  # Tip 2
-        'bltBeadTip'  # Tip 3
-    ]
-
-    # Dynamic tip assignment based on needs listed above
-    tipCounter = 0
-    for tip in p20TipNeeds:
-        for sample in polar:
-            polar[sample][tip] = p20Tips[tipCounter]
-            tipCounter += 1
-
-    tipCounter = 0
-    for tip in p200TipNeeds:
-        for sample in polar:
-            polar[sample][tip] = p200Tips[tipCounter]
-            tipCounter += 1
+    magneticModulePlate = magneticModule.load_labware_from_definition(
+        custom_labware('eppendorf_96_well_lobind_plate_500ul'))
+
+    # </editor-fold>
+
+    # <editor-fold desc="Tip and well assignments">
+
+    labware = {
+        'p20TipRack': p20TipRack,
+        'reagentResevoir': reagentResevoir,
+        'thermocyclerPlate': thermocyclerPlate,
+        'coldReagentsPlate': coldReagentsPlate,
+        'magneticModulePlate': magneticModulePlate
+    }
+    for name, rack in zip(p200_rack_names(layout), p200TipRack):
+        labware[name] = rack
+    if checkpoint is not None:
+        checkpoint.start({'experiment_name': experiment_name, 'sample_count': sample_count, 'plan': plan,
+                          'distribute': distribute, 'precondition': precondition,
+                          'liquid_following': liquid_following, 'log_directory': log_directory,
+                          'parameters': parameters, 'layout': layout, 'library_prep': library_prep,
+                          'tip_wash': tip_wash},
+                         labware)
+
+    # Resolve the planned (labware, well) pairs into wells.
+    polar = dict()
+    for sample in samples:
+        polar[sample] = {need: labware[name][well] for need, (name, well) in plan['polar'][sample].items()}
+    shared = {need: labware[name][well] for need, (name, well) in plan['shared'].items()}
+    extractionWells = [polar[sample]['extractionWell'] for sample in samples]
 
     tipForMixingAccukitProtinaseK = polar[samples[0]]['viralBufferTip1']
     tipForMixingRtPcr = polar[samples[0]]['ethanolTip1']
     tipForMixingViralBuffer = polar[samples[0]]['viralBufferTip1']
-    tipForMixingHackflex = polar[samples[0]]['stopTip']
-    tipForAddStopBuffer = polar[samples[0]]['stopTip']
+    tipForMixingHackflex = polar[samples[0]].get('stopTip')
+    tipForAddStopBuffer = polar[samples[0]].get('stopTip')
 
     # </editor-fold>
 
     # <editor-fold desc="Reagents">
 
+    reagents = {reagent: labware[name][well] for reagent, (name, well) in plan['reagents'].items()}
+
     # room temperature reagents
-    viralBufferBeads = reagentResevoir['A1']
-    viralBuffer = reagentResevoir['A2']
-    magbeadBuffer1 = reagentResevoir['A3']
-    magbeadBuffer2 = reagentResevoir['A4']
-    ethanolWells = reagentResevoir['A5'], reagentResevoir['A6']
-    elutionBuffer = reagentResevoir['A7']
-    mineralOil = reagentResevoir['A8']
-    stopBuffer = reagentResevoir['A9']
-    bltBeadWashBuffer = reagentResevoir['A10']
-    wash_well = reagentResevoir['A11']
-
-    index_list = []
-    for num in range(9, 13):
-        index_list.append('A' + str(num))
-
-    index_counter = 0
-    for sample in samples:
-        polar[sample]['pcrWithIndex'] = coldReagentsPlate[index_list[index_counter]]
-        index_counter += 1
+    viralBufferBeads = reagents['viralBufferBeads']
+    viralBuffer = reagents['viralBuffer']
+    magbeadBuffer1 = reagents['magbeadBuffer1']
+    magbeadBuffer2 = reagents['magbeadBuffer2']
+    ethanolWells = reagents['ethanol1'], reagents['ethanol2']
+    elutionBuffer = reagents['elutionBuffer']
+    mineralOil = reagents['mineralOil']
+    stopBuffer = reagents['stopBuffer']
+    bltBeadWashBuffer = reagents['bltBeadWashBuffer']
+    bltBeads = reagents['bltBeads']
+    wash_well = reagents['wash_well']
+
+    # cold reagents
+    protinaseKMasterMix = reagents['protinaseKMasterMix']
+    rtPcrPool1MasterMix = reagents['rtPcrPool1MasterMix']
+    rtPcrPool2MasterMix = reagents['rtPcrPool2MasterMix']
 
     # </editor-fold>
 
     # <editor-fold desc="Protocol variables">
 
     # volume
+    sampleVolume = 100
     rtpcrVolume = 20
     hackflexVolume = 7.5
-
-    # time
-    hacklexBeadBindTiime = 5
+    bltBeadsVolume = 20
+    stopBufferVolume = 20
+    bltWashVolume = 100
+    indexPcrVolume = 40
+    tipWashVolume = 150
+
+    # The most liquid each kind of sample well ever holds: the walls are wet with sample up to its level.
+    # Lysate is the sample with Protinase K and both viral buffers; the BLT wells peak once stop buffer is in.
+    wettedVolumes = {
+        'extractionWell': sampleVolume + 25 + 125 + 125,
+        'bltBeadxWashWell': bltBeadsVolume + 2 * hackflexVolume + stopBufferVolume
+    }
 
     # offsets/adjusts/def
     wellFillRate = 0.032
-    p20DefaultRate = 7.56
-    p300DefaultRate = 92.86
-    lobindEngageHeight = 7.4
-
-    # </editor-fold>
+    p20DefaultRate = settings['p20DefaultRate']
+    p300DefaultRate = settings['p300DefaultRate']
+    lobindEngageHeight = settings['lobindEngageHeight']
 
-    # <editor-fold desc="Well assignments">
+    # Supernatant taken by following the meniscus down is drawn faster and settles for less time, as the tip
+    # stays near the surface, away from the pellet.
+    followAspirateRate = settings['followAspirateRate']
+    followSettleSeconds = settings['followSettleSeconds']
 
-    # Magnetic module plate wells
-    # Create empty list for extraction, library preparation and tip washing
-    magModList = []
-    for num in range(1, 13):
-        magModList.append('A' + str(num))
+    # Speed limits for moves in and out of wells.
+    motion = Motion(ptx)
 
-    wellCounter = 0
-    lobindWellNeeds = ['extractionWell',
-                       'bltBeadxWashWell',
-                       'sampleTipWashWell']
+    # Well positions and offset Locations, computed once per labware and well.
+    geometry = GeometryIndex()
 
-    for sample in samples:
-        for well in lobindWellNeeds:
-            polar[sample][well] = magneticModulePlate[magModList[wellCounter]]
-            wellCounter += 1
+    # </editor-fold>
 
-    # Thermocycler plate wells
+    # <editor-fold desc="Telemetry">
+    # Opt-in live progress (see polartron.telemetry), started with the run: every phase and sample is
+    # reported with the module temperatures and the time left according to the plan.
+    def module_temperatures():
+        return {
+            'temperatureModule': temperatureModule.temperature,
+            'thermocyclerBlock': thermocyclerModule.block_temperature,
+            'thermocyclerLid': thermocyclerModule.lid_temperature,
+            'thermocyclerLidPosition': thermocyclerModule.lid_position,
+            'magneticModule': magneticModule.status
+        }
 
-    # Thermocycler plate wells
-    # Create empty list for RT PCR
-    rtPcrWells = []
-    for num in (3, 4, 5, 6, 7, 8, 9, 10):
-        rtPcrWells.append('A' + str(num))
+    # </editor-fold>
 
-    wellCounter = 0
-    thermocyclerWellNeeds = ['rtPcrPool1',
-                             'rtPcrPool2']
+    # <editor-fold desc="Liquid tracking">
+    # With liquid following, the pipettes report every aspirate and dispense so that the volume in each
+    # well of the mag plate and the reservoir is known and supernatant can be drawn from just under the
+    # meniscus. The reservoir starts with the loading volumes and the extraction wells with the samples.
+    # Tip washing needs the plates too, to tell whether a dispense reaches into the liquid.
+    liquids = None
+    if liquid_following or tip_wash:
+        trackedLabware = [magneticModulePlate, reagentResevoir]
+        if tip_wash:
+            trackedLabware += [thermocyclerPlate, coldReagentsPlate]
+        liquids = LiquidTracker(trackedLabware)
+        for reagent, volume in plan['loadingVolumes'].items():
+            liquids.load(reagents[reagent], volume)
+        for sample in plan['samples']:
+            liquids.load(polar[sample]['extractionWell'], sampleVolume)
+            for need, (name, volume) in sampleLoadingVolumes.items():
+                if need in polar[sample]:
+                    liquids.load(polar[sample][need], volume)
+        p300 = TrackedPipette(p300, liquids, ptx)
+        p20 = TrackedPipette(p20, liquids, ptx)
 
-    for sample in samples:
-        for well in thermocyclerWellNeeds:
-            polar[sample][well] = thermocyclerPlate[rtPcrWells[wellCounter]]
-            wellCounter += 1
+    # </editor-fold>
 
-    # Create empty list for final PCR
-    pcrWells = []
-    for num in [1, 2, 11, 12]:
-        pcrWells.append('A' + str(num))
+    # <editor-fold desc="Tip washing">
+    # Every liquid command is checked against the samples each tip and well has been in contact with, so a
+    # tip never carries one sample into another's wells or a shared reagent, and a reused tip is washed in
+    # its sample's tip wash well when it is picked up again for another liquid (see polartron.tipreuse).
+    if tip_wash:
+        owners = {id(well): sample for sample in plan['samples'] for well in polar[sample].values()}
+        tipTracker = TipTracker(
+            owners, {id(polar[sample]['extractionWell']): sample for sample in plan['samples']},
+            {sample: polar[sample]['sampleTipWashWell'] for sample in plan['samples']}, wash_well,
+            exempt=[trash], reagents={id(well): reagent for reagent, well in reagents.items()})
 
-    wellCounter = 0
-    thermocyclerWellNeeds = ['indexPcrWell']
+        def wash_reused_tip(pipette, well):
+            wash_tip(pipette, well, min(tipWashVolume, 0.75 * pipette.max_volume))
 
-    for sample in samples:
-        for well in thermocyclerWellNeeds:
-            polar[sample][well] = thermocyclerPlate[pcrWells[wellCounter]]
-            wellCounter += 1
+        p300 = GuardedPipette(p300, tipTracker, ptx, liquids, wash_reused_tip)
+        p20 = GuardedPipette(p20, tipTracker, ptx, liquids, wash_reused_tip)
 
     # </editor-fold>
 
@@ -210,45 +272,36 @@ def run(ptx, experiment_name=""):
             instrament.blow_out(wash_well.bottom(5))
         set_speeds(instrament)
         instrament.mix(5, volume, wash_well.bottom())
-        ptx.max_speeds['Z'] = ptx.max_speeds['A'] = 10
-        instrament.blow_out(well.top(-10))
-        ptx.max_speeds['Z'] = ptx.max_speeds['A'] = None
-
-    def make_directory(directory_path):
-        if not os.path.exists(directory_path):
-            try:
-                os.makedirs(directory_path)
-            except Exception:
-                pass
-
-    def return_protocol_object(protocol_object):
-        protocolObjectString = str(protocol_object).split()[3][:-1]
-        return protocolObjectString
-
-    def play_alert_sound(sound="alert"):
-        if not ptx.is_simulating():
-            soundsPath = 'sounds/'
-            # packagePath = return_path_to_package_data()
-            playlist = {
-                "alert": "alert_sound_1.mp3",
-                "stop" : "alert_sound_2.mp3"
-            }
-            # soundsPath = packagePath + soundsPath + playlist[sound]
-            soundsPath = '/var/lib/jupyter/notebooks/' + soundsPath + playlist[sound]
-            subprocess.run(['mpg123', soundsPath], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-    def update_log(update="", experiment=experiment_name):
-        protocolString = return_protocol_object(ptx)
-        make_directory(run_log_directory)
+        with motion.profile(instrament, 'in-liquid'):
+            instrament.blow_out(wash_well.top(-10))
+
+    def play_alert_sound(sound="alert", repeat=False):
+        alerts.alert(sound, repeat=repeat)
+
+    def update_log(update=""):
+        if checkpoint is not None:
+            checkpoint.phase(update)
+        # Reaching the next phase means any pause has been resumed, so repeating alerts can stop.
+        alerts.acknowledge()
         ptx.comment(update)
-        if not ptx.is_simulating():
-            when = datetime.now().strftime("%y_%m_%d_%H_%M_%S")
-            if not experiment == "":
-                experiment = experiment + "_"
-            logName = experiment + "run_log_" + "_" + protocolString + ".txt"
-            runLog = open("/var/lib/jupyter/notebooks/run_logs/" + logName, "a")
-            runLog.write(when + ' > ' + update + '\n')
-            runLog.close()
+        runLog.phase(update)
+        if profiler is not None:
+            profiler.phase(update)
+        if telemetry is not None:
+            telemetry.phase(update)
+
+    def each_sample():
+        for index, sample in enumerate(samples):
+            runLog.sample(sample)
+            if profiler is not None:
+                profiler.sample(sample)
+            if telemetry is not None:
+                telemetry.sample(sample, index, len(samples))
+            yield sample
+        if profiler is not None:
+            profiler.sample(None)
+        if telemetry is not None:
+            telemetry.sample(None, len(samples), len(samples))
 
     def trash_tip():
         if p300.has_tip:
@@ -281,66 +334,107 @@ def run(ptx, experiment_name=""):
         pipette.aspirate(volume, location.bottom(height))
         ptx.delay(seconds=1)
 
-    def slow_exit(pipette, location, height=0):
-        ptx.max_speeds['Z'] = ptx.max_speeds['A'] = 10
-        pipette.move_to(location.top(height))
-        ptx.max_speeds['Z'] = ptx.max_speeds['A'] = None
+    def follow_aspirate(pipette, volume, location, x=0, clearance=1):
+        # Aspirates in segments that follow the tracked meniscus down, no lower than clearance. The tip goes
+        # into the well as for any aspirate; only the steps down in the liquid are slowed.
+        segments = liquids.follow(location, volume, pipette.channels, clearance)
+        for index, (part, height) in enumerate(segments):
+            if index == 1:
+                motion.use(pipette, 'in-liquid')
+            pipette.aspirate(part, geometry.bottom(location, z=height, x=x))
+        motion.use(pipette, 'free-travel')
+
+    def slow_exit(pipette, location, height=0, liquidHeight=None):
+        motion.exit(pipette, location, height, liquidHeight)
 
     def bead_side(well):
-        column = int("".join(filter(str.isdigit, str(well).split()[0])))
-        if (column % 2) == 0:
-            return -1
-        else:
-            return 1
+        return geometry.bead_side(well)
 
     def remove_supernatant(pipette, volume, location):
         side = bead_side(location)
+        if liquid_following:
+            pipette.flow_rate.aspirate = followAspirateRate
+            follow_aspirate(pipette, volume * 0.7, location, x=(-1.5 * side), clearance=((0.3 * volume) * wellFillRate))
+            ptx.delay(seconds=followSettleSeconds)
+        else:
+            pipette.flow_rate.aspirate = 10
+            pipette.aspirate((volume * 0.7), geometry.bottom(location, z=((0.3 * volume) * wellFillRate),
+                                                            x=(-1.5 * side)))
+            ptx.delay(seconds=5)
         pipette.flow_rate.aspirate = 10
-        pipette.aspirate((volume * 0.7), location.bottom().move(
-            types.Point(z=((0.3 * volume) * wellFillRate), x=(-1.5 * side))))
-        ptx.delay(seconds=5)
-        pipette.flow_rate.aspirate = 10
-        pipette.aspirate((volume * 0.30), location.bottom().move(types.Point(z=1, x=(-1.5 * side))))
+        pipette.aspirate((volume * 0.30), geometry.bottom(location, z=1, x=(-1.5 * side)))
         set_speeds(p300)
 
-    def resuspend_beads(pipette, reps, volume, location, aspirate=400, dispense=400):
+    def resuspend_beads(pipette, reps, volume, location, aspirate=settings['resuspendAspirateRate'],
+                        dispense=settings['resuspendDispenseRate']):
         side = bead_side(location)
         pipette.flow_rate.aspirate = aspirate
         pipette.flow_rate.dispense = dispense
         for i in range(reps):
-            pipette.aspirate((volume * 0.8), location.bottom(1))
-            pipette.dispense((volume * 0.8), location.bottom(3).move(types.Point(x=1.5 * side)))
+            pipette.aspirate((volume * 0.8), geometry.bottom(location, 1))
+            pipette.dispense((volume * 0.8), geometry.bottom(location, 3, x=1.5 * side))
 
-    def side_dispense(pipette, location, volume=0, dispense=50, aspirate=50, blowOut=True):
+    def side_dispense(pipette, location, volume=0, dispense=settings['sideDispenseRate'],
+                      aspirate=settings['sideAspirateRate'], blowOut=True, height=-5):
         set_speeds(pipette, aspirate, dispense)
         if volume == 0:
             volume = pipette.current_volume
         pipette.move_to(location.top())
-        pipette.default_speed = 25
-        pipette.dispense(volume, location.top().move(types.Point(y=4.5, z=-5)))
-        ptx.delay(seconds=1)
-        if blowOut:
-            pipette.blow_out(location.top().move(types.Point(y=4.5, z=-5)))
+        with motion.profile(pipette, 'near-meniscus'):
+            pipette.dispense(volume, geometry.top(location, height, y=4.5))
             ptx.delay(seconds=1)
-        pipette.move_to(location.top())
-        pipette.default_speed = None
+            if blowOut:
+                pipette.blow_out(geometry.top(location, height, y=4.5))
+                ptx.delay(seconds=1)
+            pipette.move_to(location.top())
+        set_speeds(pipette)
+
+    def distribute_reagent(pipette, volume, source, wells, tip, finalVolume, aspirate=100, dispense=50, height=-5,
+                           conditioning=10, disposal=10, wettedVolume=0):
+        # One tip serves every well. Each aspiration carries as many doses as fit alongside the conditioning
+        # and disposal volumes; the conditioning volume goes straight back to the source and the disposal
+        # volume is blown back after the last dose. Doses are side dispensed at the given height below the
+        # top of the well, which must stay above the liquid once every dose is in, and above the highest
+        # level the wells have held before (wettedVolume), where the wall is wet with sample, so the tip
+        # never touches sample and can be returned to the rack.
+        for well in wells:
+            if liquid_level(max(finalVolume, wettedVolume)) >= well.depth + height:
+                raise ValueError("Dispensing %s uL at %s mm from the top of %s would reach sample." %
+                                 (volume, height, well))
+        dosesPerAspiration = int((pipette.max_volume - conditioning - disposal) // volume)
+        if dosesPerAspiration < 1:
+            raise ValueError("%s uL doses do not fit in a %s uL tip." % (volume, pipette.max_volume))
+
+        pipette.pick_up_tip(tip)
+        for first in range(0, len(wells), dosesPerAspiration):
+            doses = wells[first:first + dosesPerAspiration]
+            set_speeds(pipette, aspirate, dispense)
+            aspirate_fluid(pipette, conditioning + volume * len(doses) + disposal, source)
+            pipette.dispense(conditioning, source.bottom(1))
+            slow_exit(pipette, source)
+            for well in doses:
+                side_dispense(pipette, well, volume=volume, dispense=dispense, aspirate=aspirate, blowOut=False,
+                              height=height)
+                slow_exit(pipette, well)
+            pipette.dispense(pipette.current_volume, source.top(-2))
+            pipette.blow_out(source.top(-2))
         set_speeds(pipette)
+        pipette.return_tip()
 
     def well_wash(pipette, location):
         volume = pipette.current_volume / 4
         pipette.flow_rate.aspirate = 50
         pipette.flow_rate.dispense = 50
         pipette.move_to(location.top(-3))
-        pipette.default_speed = 20
-        for side in (1, -1):
-            pipette.move_to(location.top().move(types.Point(x=(side * 3), z=-3)))
-            pipette.dispense(volume, location.top().move(types.Point(x=(side * 3), z=-3)))
-            pipette.move_to(location.top().move(types.Point(y=(side * 3), z=-3)))
-            pipette.dispense(volume, location.top().move(types.Point(y=(side * 3), z=-3)))
-        pipette.blow_out()
-        ptx.delay(seconds=1)
-        pipette.move_to(location.top().move(types.Point(z=0)))
-        pipette.default_speed = None
+        with motion.profile(pipette, 'near-meniscus'):
+            for side in (1, -1):
+                pipette.move_to(geometry.top(location, -3, x=side * 3))
+                pipette.dispense(volume, geometry.top(location, -3, x=side * 3))
+                pipette.move_to(geometry.top(location, -3, y=side * 3))
+                pipette.dispense(volume, geometry.top(location, -3, y=side * 3))
+            pipette.blow_out()
+            ptx.delay(seconds=1)
+            pipette.move_to(geometry.top(location))
 
     def engage_magnet_module(minutes=0):
         magneticModule.engage(lobindEngageHeight)
@@ -349,16 +443,15 @@ def run(ptx, experiment_name=""):
     def collect_dispense_touch(pipette, volume, location, aspirate=0, dispense=0,
                                blow_out=False, touch_tip=True):
         set_speeds(pipette, aspirate, dispense)
-        pipette.aspirate(volume, location.bottom())
+        pipette.aspirate(volume, geometry.bottom(location))
         ptx.delay(seconds=1)
-        pipette.dispense(pipette.current_volume, location.bottom(wellFillRate * volume))
+        pipette.dispense(pipette.current_volume, geometry.bottom(location, wellFillRate * volume))
         ptx.delay(seconds=1)
         if blow_out:
-            slow_exit(pipette, location, height=-10)
+            slow_exit(pipette, location, height=-10, liquidHeight=liquid_level(volume))
             pipette.flow_rate.blow_out = 10
-            pipette.blow_out(location.top().move(types.Point(z=-10)))
+            pipette.blow_out(geometry.top(location, -10))
             ptx.delay(seconds=5)
-            pipette.default_speed = None
         if touch_tip:
             well_touch_tip(pipette, location)
         slow_exit(pipette, location)
@@ -366,14 +459,14 @@ def run(ptx, experiment_name=""):
 
     def well_touch_tip(pipette, location, height=-5):
         slow_exit(pipette, location, height=height)
-        pipette.default_speed = 20
-        for side in (1, -1):
-            pipette.move_to(location.top().move(types.Point(z=height, x=(side * 4.5))))
-            pipette.move_to(location.top().move(types.Point(z=height, y=(side * 4.5))))
-        pipette.move_to(location.top(height))
-        pipette.default_speed = None
+        with motion.profile(pipette, 'near-meniscus'):
+            for side in (1, -1):
+                pipette.move_to(geometry.top(location, height, x=side * 4.5))
+                pipette.move_to(geometry.top(location, height, y=side * 4.5))
+            pipette.move_to(location.top(height))
 
-    def wash_beads(pipette, volume, buffer, well, tip, reps=15, time=5, is_detergent=False, resuspend=True):
+    def wash_beads(pipette, volume, buffer, well, tip, reps=15, time=settings['washPelletMinutes'], is_detergent=False,
+                   resuspend=True):
 
         if not resuspend:
             reps = 0
@@ -389,346 +482,692 @@ def run(ptx, experiment_name=""):
         if resuspend:
             magneticModule.disengage()
 
-        for sample in samples:
-            pipette.pick_up_tip(polar[sample][tip])
-            aspirate_fluid(pipette, volume, buffer)
-            if buffer in ethanolWells:
-                well_wash(pipette, polar[sample][well])
-            elif not resuspend:
-                set_speeds(pipette, 100, 10)
-                pipette.dispense(pipette.current_volume, polar[sample][well].bottom())
-                slow_exit(pipette, polar[sample][well])
-            else:
-                side_dispense(pipette, polar[sample][well], dispense=dispense)
-                slow_exit(pipette, polar[sample][well])
-            pipette.return_tip()
+        # Ethanol is sprayed around the well walls, and without resuspension the buffer goes to the bottom, so
+        # only side dispensed buffers can be distributed.
+        if distribute and resuspend and buffer not in ethanolWells:
+            distribute_reagent(pipette, volume, buffer, [polar[sample][well] for sample in samples],
+                               polar[samples[0]][tip], volume, dispense=dispense, wettedVolume=wettedVolumes[well])
+        else:
+            for sample in each_sample():
+                pipette.pick_up_tip(polar[sample][tip])
+                aspirate_fluid(pipette, volume, buffer)
+                if buffer in ethanolWells:
+                    well_wash(pipette, polar[sample][well])
+                elif not resuspend:
+                    set_speeds(pipette, 100, 10)
+                    pipette.dispense(pipette.current_volume, polar[sample][well].bottom())
+                    slow_exit(pipette, polar[sample][well])
+                else:
+                    side_dispense(pipette, polar[sample][well], dispense=dispense)
+                    slow_exit(pipette, polar[sample][well])
+                pipette.return_tip()
 
         if resuspend:
-            for sample in samples:
+            for sample in each_sample():
                 pipette.pick_up_tip(polar[sample][tip])
                 resuspend_beads(pipette, reps, volume, polar[sample][well])
                 collect_dispense_touch(pipette, volume, polar[sample][well], aspirate=aspirate, dispense=dispense,
                                        blow_out=True)
                 pipette.return_tip()
 
-        engage_magnet_module(time)
+        engage_magnet_module()
+        yield incubate(minutes=time)
 
-        for sample in samples:
+        for sample in each_sample():
             pipette.pick_up_tip(polar[sample][tip])
             remove_supernatant(pipette, volume, polar[sample][well])
-            slow_exit(p300, polar[sample][well])
+            slow_exit(p300, polar[sample][well], liquidHeight=0)
             trash_tip()
 
     def pause_protocol(comment="", sound='default', play_sound=True, required_stop=False):
         if required_stop:
+            # Nothing to ask of the operator for a phase a resumed run skips.
+            if checkpoint is not None and checkpoint.skipping:
+                return
             if play_sound:
                 if sound == 'default':
-                    play_alert_sound()
+                    play_alert_sound(repeat=True)
                 else:
-                    play_alert_sound(sound)
+                    play_alert_sound(sound, repeat=True)
             ptx.pause(comment)
 
     def liquid_level(well_volume):
         height = well_volume * wellFillRate
         return height
 
+    # With precondition, the temperature module ramps in the background and is only waited for where the cold
+    # plate is needed, so it cools while the operator loads samples. API 2.10 has no such call for the
+    # thermocycler, and driving it from another thread is not safe, so its block is cooled and its lid heated
+    # from tasks of their own (see below). Those block the protocol until the module is there, and the
+    # scheduler runs them while samples incubate rather than when the modules are set up.
+    def start_cold_plate(celsius):
+        if precondition:
+            temperatureModule.start_set_temperature(celsius)
+        else:
+            temperatureModule.set_temperature(celsius)
+
+    def cold_plate_ready(celsius):
+        if precondition:
+            temperatureModule.await_temperature(celsius)
+
+    # Opt-in per helper call counts, commands and time (see polartron.profiling). The helpers call each
+    # other through these names, so nested calls are profiled too.
+    if profiler is not None:
+        aspirate_fluid = profiler.wrap(aspirate_fluid)
+        slow_exit = profiler.wrap(slow_exit)
+        side_dispense = profiler.wrap(side_dispense)
+        well_wash = profiler.wrap(well_wash)
+        collect_dispense_touch = profiler.wrap(collect_dispense_touch)
+        resuspend_beads = profiler.wrap(resuspend_beads)
+        remove_supernatant = profiler.wrap(remove_supernatant)
+        wash_beads = profiler.wrap(wash_beads)
+        trash_tip = profiler.wrap(trash_tip)
+        distribute_reagent = profiler.wrap(distribute_reagent)
+        well_touch_tip = profiler.wrap(well_touch_tip)
+
     # </editor-fold>
 
-    """
-    Protocol starts below.
-    """
+    # <editor-fold desc="Protocol phases">
+    # Each phase is a task for the scheduler below. Phases that wait yield incubate(...) so that independent
+    # phases can run in the meantime.
 
     # <editor-fold desc="Set up OT2 and modules for run.">
-    update_log("ʕ·ᴥ·ʔ : OT-2 module set up started.")
+    def set_up_modules():
+        update_log("ʕ·ᴥ·ʔ : OT-2 module set up started.")
+
+        ptx.set_rail_lights(True)
+        thermocyclerModule.open_lid()
+        engage_magnet_module()
+        if not precondition:
+            update_log("ʕ·ᴥ·ʔ : Cooling thermocycler plate to 4°C.")
+            thermocyclerModule.set_block_temperature(4)
+        update_log("ʕ·ᴥ·ʔ : Cooling temperature module to 4°C.")
+        start_cold_plate(4)
+
+        update_log("ʕ·ᴥ·ʔ : OT-2 module set up complete.")
+
+    # </editor-fold>
 
-    ptx.set_rail_lights(True)
-    thermocyclerModule.open_lid()
-    engage_magnet_module()
-    update_log("ʕ·ᴥ·ʔ : Cooling thermocycler plate to 4°C.")
-    thermocyclerModule.set_block_temperature(4)
-    update_log("ʕ·ᴥ·ʔ : Cooling temperature module to 4°C.")
-    temperatureModule.set_temperature(4)
+    # <editor-fold desc="Precondition thermocycler.">
+    def cool_thermocycler():
+        update_log("ʕ·ᴥ·ʔ : Cooling thermocycler plate to 4°C.")
+        thermocyclerModule.set_block_temperature(4)
 
-    update_log("ʕ·ᴥ·ʔ : OT-2 module set up complete.")
-    # </editor-fold> #
+    def preheat_lid():
+        update_log("ʕ·ᴥ·ʔ : Pre-heating thermocycler lid.")
+        thermocyclerModule.set_lid_temperature(105)
+
+    # </editor-fold>
 
     # <editor-fold desc="Place samples onto OT-2.">
-    update_log("ʕ·ᴥ·ʔ : Awaiting samples to be loaded.")
+    def load_samples():
+        update_log("ʕ·ᴥ·ʔ : Awaiting samples to be loaded.")
 
-    pause_protocol("Place sample plate onto magnetic module and press resume to begin.", required_stop=True)
-    magneticModule.disengage()
+        for line in loading_sheet(plan).splitlines():
+            ptx.comment(line)
+        pause_protocol("Place sample plate onto magnetic module and press resume to begin.", required_stop=True)
+        magneticModule.disengage()
 
-    update_log("ʕ·ᴥ·ʔ : Samples loaded, protocol started.")
-    # </editor-fold> #
+        update_log("ʕ·ᴥ·ʔ : Samples loaded, protocol started.")
+
+    # </editor-fold>
 
     # <editor-fold desc="Add extraction control and Protinase K.">
-    update_log("ʕ·ᴥ·ʔ : Adding extraction control and Protinase K.")
-
-    update_log("ʕ·ᴥ·ʔ : Mixing Protinase K & Accukit master mix.")
-    p300.pick_up_tip(tipForMixingAccukitProtinaseK)
-    set_speeds(p300)
-    p300.mix(30, 100, coldReagentsPlate['A1'].bottom(1.5))
-    slow_exit(p300, coldReagentsPlate['A1'], -2.5)
-    p300.flow_rate.blow_out = 10
-    p300.blow_out()
-    well_touch_tip(p300, coldReagentsPlate['A1'], -2.5)
-    p300.return_tip()
-
-    update_log("ʕ·ᴥ·ʔ : Adding Protinase K & Accukit master mix to each sample.")
-    for sample in samples:
-        p300.pick_up_tip(polar[sample]['mixTip'])
+    def add_proteinase_k():
+        update_log("ʕ·ᴥ·ʔ : Adding extraction control and Protinase K.")
+        cold_plate_ready(4)
+
+        update_log("ʕ·ᴥ·ʔ : Mixing Protinase K & Accukit master mix.")
+        p300.pick_up_tip(tipForMixingAccukitProtinaseK)
         set_speeds(p300)
-        aspirate_fluid(p300, 25, coldReagentsPlate['A1'])
-        slow_exit(p300, coldReagentsPlate['A1'])
-        p300.dispense(p300.current_volume, polar[sample]['extractionWell'].bottom())
-        set_speeds(p300, 400, 400)
-        p300.mix(30, 90)
-        collect_dispense_touch(p300, 90, polar[sample]['extractionWell'])
+        p300.mix(settings['masterMixMixes'], 100, protinaseKMasterMix.bottom(1.5))
+        slow_exit(p300, protinaseKMasterMix, -2.5)
+        p300.flow_rate.blow_out = 10
+        p300.blow_out()
+        well_touch_tip(p300, protinaseKMasterMix, -2.5)
         p300.return_tip()
 
-    update_log("ʕ·ᴥ·ʔ : Incubating sample with Protinase K.")
-    ptx.delay(minutes=10)
+        update_log("ʕ·ᴥ·ʔ : Adding Protinase K & Accukit master mix to each sample.")
+        for sample in each_sample():
+            p300.pick_up_tip(polar[sample]['mixTip'])
+            set_speeds(p300)
+            aspirate_fluid(p300, 25, protinaseKMasterMix)
+            slow_exit(p300, protinaseKMasterMix)
+            p300.dispense(p300.current_volume, polar[sample]['extractionWell'].bottom())
+            set_speeds(p300, 400, 400)
+            p300.mix(settings['proteinaseKMixes'], 90)
+            collect_dispense_touch(p300, 90, polar[sample]['extractionWell'])
+            p300.return_tip()
 
-    update_log("ʕ·ᴥ·ʔ : Extraction control added and Protinase K treatment complete")
-    # </editor-fold> #
+        update_log("ʕ·ᴥ·ʔ : Incubating sample with Protinase K.")
+        yield incubate(minutes=settings['proteinaseKMinutes'], msg="ʕ·ᴥ·ʔ : Incubating sample with Protinase K.")
+
+        update_log("ʕ·ᴥ·ʔ : Extraction control added and Protinase K treatment complete")
 
-    # <editor-fold desc="Plate RT-PCR reactions.">
-    update_log("ʕ·ᴥ·ʔ : Plating RT-PCR reactions.")
-
-    update_log("ʕ·ᴥ·ʔ : Mixing RT-PCR master mixes.")
-    p300.pick_up_tip(tipForMixingRtPcr)
-    set_speeds(p300)
-    p300.mix(30, 80, coldReagentsPlate['A4'].bottom(1.5))
-    slow_exit(p300, coldReagentsPlate['A4'], -2.5)
-    p300.flow_rate.blow_out = 10
-    p300.blow_out()
-    well_touch_tip(p300, coldReagentsPlate['A4'], -2.5)
-    p300.return_tip()
-
-    for pool in ('rtPcrPool1', 'rtPcrPool2'):
-        if pool == 'rtPcrPool1':
-            msg = "ʕ·ᴥ·ʔ : Plating Pool 1 RT-PCR master mix."
-            rtPcrPoolMix = coldReagentsPlate['A4']
-            p20.pick_up_tip(p20TipRack['E4'])
-        if pool == 'rtPcrPool2':
-            msg = "ʕ·ᴥ·ʔ : Plating Pool 2 RT-PCR master mix."
-            rtPcrPoolMix = coldReagentsPlate['E4']
-            p20.pick_up_tip(p20TipRack['E5'])
-
-        update_log(msg)
-        for sample in samples:
-            aspirate_fluid(p20, 12.5, rtPcrPoolMix, height=0.5)
-            slow_exit(p20, rtPcrPoolMix)
-            p20.dispense(12.5, polar[sample][pool].bottom(1).move(types.Point(y=-36)))
-            ptx.max_speeds['Z'] = ptx.max_speeds['A'] = 10
-            p20.move_to(polar[sample][pool].top().move(types.Point(y=-36)))
-            ptx.max_speeds['Z'] = ptx.max_speeds['A'] = None
-            aspirate_fluid(p20, 12.5, rtPcrPoolMix, height=0.5)
-            slow_exit(p20, rtPcrPoolMix)
-            p20.move_to(polar[sample][pool].top())
-            p20.dispense(12.5, polar[sample][pool].bottom())
-            slow_exit(p20, polar[sample][pool])
-
-        p20.return_tip()
-
-    update_log("ʕ·ᴥ·ʔ : Closing thermocycler lid and deactivating temperature module.")
-    temperatureModule.deactivate()
-    thermocyclerModule.close_lid()
-    ptx.home()
-
-    update_log("ʕ·ᴥ·ʔ : RT-PCR reaction plated.")
     # </editor-fold>
 
-    # <editor-fold desc="Binding DNA/RNA to MagBeads.">
-    update_log("ʕ·ᴥ·ʔ : Bind DNA/RNA to MagBeads.")
-
-    update_log("ʕ·ᴥ·ʔ : Resuspending MagBeads in Viral DNA/RNA Buffer.")
-    p300.pick_up_tip(tipForMixingViralBuffer)
-    set_speeds(p300, 400, 400)
-    for _ in range(60):
-        p300.aspirate(180, viralBufferBeads.bottom())
-        p300.dispense(p300.current_volume, viralBufferBeads.bottom(5))
-    slow_exit(p300, viralBufferBeads)  # TODO Add blow out and touch wall of well.
-    p300.return_tip()
-
-    update_log("ʕ·ᴥ·ʔ : Adding Viral DNA/RNA Buffer with MagBeads to all samples..")
-    for sample in samples:
-        set_speeds(p300, 100, 5)
-        p300.pick_up_tip(polar[sample]['viralBufferTip1'])
-        aspirate_fluid(p300, 125, viralBufferBeads)
-        slow_exit(p300, viralBufferBeads)
-        p300.dispense(p300.current_volume, polar[sample]['extractionWell'].bottom(liquid_level(250)))
-        slow_exit(p300, polar[sample]['extractionWell'])
-        p300.return_tip()
+    # <editor-fold desc="Plate RT-PCR reactions.">
+    def plate_rt_pcr():
+        update_log("ʕ·ᴥ·ʔ : Plating RT-PCR reactions.")
+        cold_plate_ready(4)
 
-    update_log("ʕ·ᴥ·ʔ : Adding Viral DNA/RNA Buffer to all samples..")
-    for sample in samples:
-        set_speeds(p300, 100, 5)
-        p300.pick_up_tip(polar[sample]['viralBufferTip2'])
-        aspirate_fluid(p300, 125, viralBuffer)
-        slow_exit(p300, viralBuffer)
-        p300.dispense(p300.current_volume, polar[sample]['extractionWell'].bottom(liquid_level(375)))
-        slow_exit(p300, polar[sample]['extractionWell'])
+        update_log("ʕ·ᴥ·ʔ : Mixing RT-PCR master mixes.")
+        p300.pick_up_tip(tipForMixingRtPcr)
+        set_speeds(p300)
+        p300.mix(settings['masterMixMixes'], 80, rtPcrPool1MasterMix.bottom(1.5))
+        slow_exit(p300, rtPcrPool1MasterMix, -2.5)
+        p300.flow_rate.blow_out = 10
+        p300.blow_out()
+        well_touch_tip(p300, rtPcrPool1MasterMix, -2.5)
         p300.return_tip()
 
-    update_log("ʕ·ᴥ·ʔ : Mixing Viral DNA/RNA Buffer with MagBeads into all samples.")
-    for sample in samples:
-        p300.pick_up_tip(polar[sample]['viralBufferTip1'])
-        set_speeds(p300)
-        for _ in range(30):
-            p300.aspirate(180, polar[sample]['extractionWell'].bottom())
-            p300.dispense(p300.current_volume, polar[sample]['extractionWell'].bottom(5))
-        collect_dispense_touch(p300, 180, polar[sample]['extractionWell'], dispense=5, blow_out=True)
-        slow_exit(p300, polar[sample]['extractionWell'])
+        for pool in ('rtPcrPool1', 'rtPcrPool2'):
+            if pool == 'rtPcrPool1':
+                msg = "ʕ·ᴥ·ʔ : Plating Pool 1 RT-PCR master mix."
+                rtPcrPoolMix = rtPcrPool1MasterMix
+                p20.pick_up_tip(shared['rtPcrPool1PlatingTip'])
+            if pool == 'rtPcrPool2':
+                msg = "ʕ·ᴥ·ʔ : Plating Pool 2 RT-PCR master mix."
+                rtPcrPoolMix = rtPcrPool2MasterMix
+                p20.pick_up_tip(shared['rtPcrPool2PlatingTip'])
+
+            update_log(msg)
+            for sample in each_sample():
+                aspirate_fluid(p20, 12.5, rtPcrPoolMix, height=0.5)
+                slow_exit(p20, rtPcrPoolMix)
+                p20.dispense(12.5, geometry.bottom(polar[sample][pool], 1, y=-36))
+                slow_exit(p20, polar[sample][pool])
+                aspirate_fluid(p20, 12.5, rtPcrPoolMix, height=0.5)
+                slow_exit(p20, rtPcrPoolMix)
+                p20.move_to(polar[sample][pool].top())
+                p20.dispense(12.5, polar[sample][pool].bottom())
+                slow_exit(p20, polar[sample][pool])
+
+            p20.return_tip()
+
+        if not library_prep:
+            update_log("ʕ·ᴥ·ʔ : Closing thermocycler lid and deactivating temperature module.")
+            temperatureModule.deactivate()
+        else:
+            # The index PCR mixes stay cold for library prep.
+            update_log("ʕ·ᴥ·ʔ : Closing thermocycler lid.")
+        thermocyclerModule.close_lid()
+        ptx.home()
+
+        update_log("ʕ·ᴥ·ʔ : RT-PCR reaction plated.")
+
+    # </editor-fold>
+
+    # <editor-fold desc="Binding DNA/RNA to MagBeads.">
+    def bind_to_beads():
+        update_log("ʕ·ᴥ·ʔ : Bind DNA/RNA to MagBeads.")
+
+        update_log("ʕ·ᴥ·ʔ : Resuspending MagBeads in Viral DNA/RNA Buffer.")
+        p300.pick_up_tip(tipForMixingViralBuffer)
+        set_speeds(p300, 400, 400)
+        for _ in range(settings['beadResuspensionMixes']):
+            p300.aspirate(180, geometry.bottom(viralBufferBeads))
+            p300.dispense(p300.current_volume, geometry.bottom(viralBufferBeads, 5))
+        slow_exit(p300, viralBufferBeads)  # TODO Add blow out and touch wall of well.
         p300.return_tip()
 
-    update_log("ʕ·ᴥ·ʔ : Allow DNA/RNA to bind to MagBeads.")
-    ptx.delay(minutes=10)
-
-    update_log("ʕ·ᴥ·ʔ : Pelleting MagBeads.")
-    engage_magnet_module(minutes=12)
-
-    update_log("ʕ·ᴥ·ʔ : Remove Viral DNA/RNA Buffer.")
-    for tip in ['viralBufferTip1', 'viralBufferTip2']:
-        for sample in samples:
-            side = bead_side(polar[sample]['extractionWell'])
-            p300.pick_up_tip(polar[sample][tip])
-            p300.flow_rate.aspirate = 50
-            p300.move_to(polar[sample]['extractionWell'].top())
-            p300.aspirate(180, polar[sample]['extractionWell'].bottom().move(
-                types.Point(z=1, x=(-2 * side))))
-            p300.aspirate(20, polar[sample]['extractionWell'].bottom().move(
-                types.Point(z=0.5, x=(-2 * side))))
-            ptx.delay(seconds=1)
+        update_log("ʕ·ᴥ·ʔ : Adding Viral DNA/RNA Buffer with MagBeads to all samples..")
+        if distribute:
+            distribute_reagent(p300, 125, viralBufferBeads, extractionWells, polar[samples[0]]['viralBufferTip1'],
+                               250, dispense=5)
+        else:
+            for sample in each_sample():
+                set_speeds(p300, 100, 5)
+                p300.pick_up_tip(polar[sample]['viralBufferTip1'])
+                aspirate_fluid(p300, 125, viralBufferBeads)
+                slow_exit(p300, viralBufferBeads)
+                p300.dispense(p300.current_volume, polar[sample]['extractionWell'].bottom(liquid_level(250)))
+                slow_exit(p300, polar[sample]['extractionWell'])
+                p300.return_tip()
+
+        update_log("ʕ·ᴥ·ʔ : Adding Viral DNA/RNA Buffer to all samples..")
+        if distribute:
+            distribute_reagent(p300, 125, viralBuffer, extractionWells, polar[samples[0]]['viralBufferTip2'], 375,
+                               dispense=5)
+        else:
+            for sample in each_sample():
+                set_speeds(p300, 100, 5)
+                p300.pick_up_tip(polar[sample]['viralBufferTip2'])
+                aspirate_fluid(p300, 125, viralBuffer)
+                slow_exit(p300, viralBuffer)
+                p300.dispense(p300.current_volume, polar[sample]['extractionWell'].bottom(liquid_level(375)))
+                slow_exit(p300, polar[sample]['extractionWell'])
+                p300.return_tip()
+
+        update_log("ʕ·ᴥ·ʔ : Mixing Viral DNA/RNA Buffer with MagBeads into all samples.")
+        for sample in each_sample():
+            p300.pick_up_tip(polar[sample]['viralBufferTip1'])
+            set_speeds(p300)
+            for _ in range(settings['bindingMixes']):
+                p300.aspirate(180, geometry.bottom(polar[sample]['extractionWell']))
+                p300.dispense(p300.current_volume, geometry.bottom(polar[sample]['extractionWell'], 5))
+            collect_dispense_touch(p300, 180, polar[sample]['extractionWell'], dispense=5, blow_out=True)
             slow_exit(p300, polar[sample]['extractionWell'])
-            trash_tip()
+            p300.return_tip()
+
+        update_log("ʕ·ᴥ·ʔ : Allow DNA/RNA to bind to MagBeads.")
+        yield incubate(minutes=settings['bindingMinutes'], msg="ʕ·ᴥ·ʔ : Allow DNA/RNA to bind to MagBeads.")
+
+        update_log("ʕ·ᴥ·ʔ : Pelleting MagBeads.")
+        engage_magnet_module()
+        yield incubate(minutes=settings['pelletMinutes'], msg="ʕ·ᴥ·ʔ : Pelleting MagBeads.")
+
+        update_log("ʕ·ᴥ·ʔ : Remove Viral DNA/RNA Buffer.")
+        for tip in ['viralBufferTip1', 'viralBufferTip2']:
+            for sample in each_sample():
+                side = bead_side(polar[sample]['extractionWell'])
+                p300.pick_up_tip(polar[sample][tip])
+                p300.flow_rate.aspirate = 50
+                p300.move_to(polar[sample]['extractionWell'].top())
+                if liquid_following:
+                    p300.flow_rate.aspirate = followAspirateRate
+                    follow_aspirate(p300, 180, polar[sample]['extractionWell'], x=(-2 * side))
+                    p300.flow_rate.aspirate = 50
+                else:
+                    p300.aspirate(180, geometry.bottom(polar[sample]['extractionWell'], 1, x=(-2 * side)))
+                p300.aspirate(20, geometry.bottom(polar[sample]['extractionWell'], 0.5, x=(-2 * side)))
+                ptx.delay(seconds=1)
+                slow_exit(p300, polar[sample]['extractionWell'])
+                trash_tip()
+
+        update_log("ʕ·ᴥ·ʔ : DNA/RNA bound to MagBeads.")
 
-    update_log("ʕ·ᴥ·ʔ : DNA/RNA bound to MagBeads.")
     # </editor-fold>
 
     # <editor-fold desc="Wash MagBeads with MagBead Wash Buffers 1 & 2.">
-    update_log("ʕ·ᴥ·ʔ : Washing MagBeads with MagBead Wash Buffers 1 & 2.")
+    def wash_with_magbead_buffers():
+        update_log("ʕ·ᴥ·ʔ : Washing MagBeads with MagBead Wash Buffers 1 & 2.")
 
-    # Wash beads in Magbead Buffer 1 and Magbead Buffer 2.
-    magbeadBuffersTips = ('magbeadBufferTip1', 'magbeadBufferTip2')
-    magbeadBuffers = (magbeadBuffer1, magbeadBuffer2)
-    for tip, buffer in zip(magbeadBuffersTips, magbeadBuffers):
-        wash_beads(p300, 150, buffer, 'extractionWell', tip, 20, is_detergent=True)
+        # Wash beads in Magbead Buffer 1 and Magbead Buffer 2.
+        magbeadBuffersTips = ('magbeadBufferTip1', 'magbeadBufferTip2')
+        magbeadBuffers = (magbeadBuffer1, magbeadBuffer2)
+        for tip, buffer in zip(magbeadBuffersTips, magbeadBuffers):
+            yield from wash_beads(p300, 150, buffer, 'extractionWell', tip, settings['washMixes'], is_detergent=True)
+
+        update_log("ʕ·ᴥ·ʔ : MagBeads washed with MagBead Wash Buffers 1 & 2.")
 
-    update_log("ʕ·ᴥ·ʔ : MagBeads washed with MagBead Wash Buffers 1 & 2.")
     # </editor-fold>
 
     # <editor-fold desc="Wash MagBeads with ethanol.">
-    update_log("ʕ·ᴥ·ʔ : Washing MagBeads with ethanol.")
+    def wash_with_ethanol():
+        update_log("ʕ·ᴥ·ʔ : Washing MagBeads with ethanol.")
+
+        # Wash MagBeads with ethanol.
+        ethanolTips = ['ethanolTip1', 'ethanolTip2']
+        for tip, buffer in zip(ethanolTips, ethanolWells):
+            yield from wash_beads(p300, 175, buffer, 'extractionWell', tip, settings['washMixes'])
+
+        update_log("ʕ·ᴥ·ʔ : Removing residual amounts of ethanol left in well.")
+        for sample in each_sample():
+            p300.pick_up_tip(polar[sample]['ethanolTip3'])
+            p300.aspirate(50, polar[sample]['extractionWell'].bottom())
+            p300.aspirate(50, polar[sample]['extractionWell'].bottom(-1))
+            slow_exit(p300, polar[sample]['extractionWell'], height=-15, liquidHeight=0)
+            p300.return_tip()
+
+    # </editor-fold>
 
-    # Wash MagBeads with ethanol.
-    ethanolTips = ['ethanolTip1', 'ethanolTip2']
-    for tip, buffer in zip(ethanolTips, ethanolWells):
-        wash_beads(p300, 175, buffer, 'extractionWell', tip, 20)
+    # <editor-fold desc="Dry MagBeads.">
+    def dry_beads():
+        update_log("ʕ·ᴥ·ʔ : Allowing MagBeads to dry.")
+        magneticModule.disengage()
+        yield incubate(minutes=settings['dryMinutes'], msg="ʕ·ᴥ·ʔ : Allowing MagBeads to dry.")
 
-    update_log("ʕ·ᴥ·ʔ : Removing residual amounts of ethanol left in well.")
-    for sample in samples:
-        p300.pick_up_tip(polar[sample]['ethanolTip3'])
-        p300.aspirate(50, polar[sample]['extractionWell'].bottom())
-        p300.aspirate(50, polar[sample]['extractionWell'].bottom(-1))
-        slow_exit(p300, polar[sample]['extractionWell'], height=-15)
-        p300.return_tip()
+        update_log("ʕ·ᴥ·ʔ : MagBeads washed with ethanol.")
+
+    # </editor-fold>
 
-    update_log("ʕ·ᴥ·ʔ : Allowing MagBeads to dry.")
-    magneticModule.disengage()
-    ptx.delay(minutes=5)
+    # <editor-fold desc="Open thermocycler lid.">
+    def open_thermocycler_lid():
+        update_log("ʕ·ᴥ·ʔ : Opening thermocycler lid.")
+        thermocyclerModule.open_lid()
 
-    update_log("ʕ·ᴥ·ʔ : MagBeads washed with ethanol.")
     # </editor-fold>
 
     # <editor-fold desc="Elute DNA/RNA from MagBeads.">
-    update_log("ʕ·ᴥ·ʔ : Eluting DNA/RNA from MagBeads.")
-
-    update_log("ʕ·ᴥ·ʔ : Opening thermocycler lid.")
-    thermocyclerModule.open_lid()
+    def elute():
+        update_log("ʕ·ᴥ·ʔ : Eluting DNA/RNA from MagBeads.")
+
+        # Elution buffer has to reach the dry beads, below where the lysate wet the walls, so it is never
+        # distributed from one tip: every sample gets its own.
+        update_log("ʕ·ᴥ·ʔ : Adding Elution Buffer to all wells.")
+        for sample in each_sample():
+            p300.pick_up_tip(polar[sample]['elutionTip'])
+            aspirate_fluid(p300, 20, elutionBuffer)
+            slow_exit(p300, elutionBuffer)
+            p300.dispense(p300.current_volume, polar[sample]['extractionWell'].bottom())
+            slow_exit(p300, polar[sample]['extractionWell'])
+            p300.return_tip()
 
-    update_log("ʕ·ᴥ·ʔ : Adding Elution Buffer to all wells.")
-    for sample in samples:
-        p300.pick_up_tip(polar[sample]['elutionTip'])
-        aspirate_fluid(p300, 20, elutionBuffer)
-        slow_exit(p300, elutionBuffer)
-        p300.dispense(p300.current_volume, polar[sample]['extractionWell'].bottom())
-        slow_exit(p300, polar[sample]['extractionWell'])
-        p300.return_tip()
+        update_log("ʕ·ᴥ·ʔ : Mixing MagBeads into Elution Buffer.")
+        for sample in each_sample():
+            p300.pick_up_tip(polar[sample]['elutionTip'])
+            set_speeds(p300, 400, 400)
+            p300.mix(settings['elutionMixes'], 16, polar[sample]['extractionWell'].bottom())
+            slow_exit(p300, polar[sample]['extractionWell'], liquidHeight=liquid_level(20))
+            p300.return_tip()
 
-    update_log("ʕ·ᴥ·ʔ : Mixing MagBeads into Elution Buffer.")
-    for sample in samples:
-        p300.pick_up_tip(polar[sample]['elutionTip'])
-        set_speeds(p300, 400, 400)
-        p300.mix(20, 16, polar[sample]['extractionWell'].bottom())
-        slow_exit(p300, polar[sample]['extractionWell'])
-        p300.return_tip()
+        update_log("ʕ·ᴥ·ʔ : Pelleting MagBeads.")
+        engage_magnet_module()
+        yield incubate(minutes=settings['elutionPelletMinutes'], msg="ʕ·ᴥ·ʔ : Pelleting MagBeads.")
 
-    update_log("ʕ·ᴥ·ʔ : Pelleting MagBeads.")
-    engage_magnet_module(minutes=3)
+        update_log("ʕ·ᴥ·ʔ : DNA/RNA eluted from MagBeads.")
 
-    update_log("ʕ·ᴥ·ʔ : DNA/RNA eluted from MagBeads.")
     # </editor-fold>
 
     # <editor-fold desc="Transfer eluent to thermocycler.">
-    update_log("ʕ·ᴥ·ʔ : Transfering eluent to thermocycler.")
-
-    # Transfer sample needed for RT-PCR into thermocycler.
-    pools = ('rtPcrPool1', 'rtPcrPool2')
-    poolTips = ('rtPcrPool1Tip', 'rtPcrPool2Tip')
-    for tip, pool in zip(poolTips, pools):
-        for sample in samples:
-            p20.pick_up_tip(polar[sample][tip])
-            side = bead_side(polar[sample]['extractionWell'])
-            p20.move_to(polar[sample]['extractionWell'].top(-10))
+    def transfer_eluent():
+        update_log("ʕ·ᴥ·ʔ : Transfering eluent to thermocycler.")
+
+        # Transfer sample needed for RT-PCR into thermocycler.
+        pools = ('rtPcrPool1', 'rtPcrPool2')
+        poolTips = ('rtPcrPool1Tip', 'rtPcrPool2Tip')
+        for tip, pool in zip(poolTips, pools):
+            for sample in each_sample():
+                p20.pick_up_tip(polar[sample][tip])
+                side = bead_side(polar[sample]['extractionWell'])
+                p20.move_to(polar[sample]['extractionWell'].top(-10))
+                p20.flow_rate.aspirate = 5
+                p20.aspirate(7.5, geometry.bottom(polar[sample]['extractionWell'], x=(-3 * side)))
+                slow_exit(p20, polar[sample]['extractionWell'])
+                p20.dispense(p20.current_volume, polar[sample][pool].bottom())
+                set_speeds(p20, 20, 20)
+                p20.mix(5, 15, polar[sample][pool].bottom())
+                slow_exit(p20, polar[sample][pool])
+                p20.return_tip()
+
+        update_log("ʕ·ᴥ·ʔ : Eluent transfer to thermocycler complete.")
+
+    # </editor-fold>
+
+    # <editor-fold desc="Add mineral oil overlay to RT-PCR reactions.">
+    def add_oil_overlay():
+        update_log("ʕ·ᴥ·ʔ : Adding mineral oil overlay to RT-PCR reactions.")
+        for sample in each_sample():
+            p300.pick_up_tip(polar[sample]['bltBeadsWashTip'])
+            p300.aspirate(65, mineralOil.bottom())
+            slow_exit(p300, mineralOil)
+            for pool in ('rtPcrPool1', 'rtPcrPool2'):
+                side_dispense(p300, polar[sample][pool], volume=30, blowOut=False)
+                slow_exit(p300, polar[sample][pool])
+            p300.return_tip()
+
+        magneticModule.disengage()
+        update_log("ʕ·ᴥ·ʔ : Mineral oil overlay added to RT-PCR reactions.")
+
+    # </editor-fold>
+
+    # <editor-fold desc="RT-PCR">
+    def run_rt_pcr():
+        update_log("ʕ·ᴥ·ʔ : Performing RT-PCR.")
+
+        update_log("ʕ·ᴥ·ʔ : Closing thermocycler lid.")
+        thermocyclerModule.close_lid()
+        ptx.home()
+
+        pcr_profile = [
+            {'temperature': 95, 'hold_time_seconds': 15},
+            {'temperature': 63, 'hold_time_seconds': 180}]
+        # (log message, thermocycler method, arguments)
+        program = [
+            (None, 'set_lid_temperature', {'temperature': 105}),
+            ("ʕ·ᴥ·ʔ : Performing uracil DNA glycosylase sample pre-treatment.", 'set_block_temperature',
+             {'temperature': 25, 'block_max_volume': 50, 'hold_time_minutes': 3}),
+            ("ʕ·ᴥ·ʔ : Performing reverse transcription.", 'set_block_temperature',
+             {'temperature': 55, 'block_max_volume': 50, 'hold_time_minutes': 15}),
+            ("ʕ·ᴥ·ʔ : Performing reverse transcription.", 'set_block_temperature',
+             {'temperature': 95, 'block_max_volume': 50, 'hold_time_minutes': 2}),
+            ("ʕ·ᴥ·ʔ : Performing amplicon generation.", 'execute_profile',
+             {'steps': pcr_profile, 'repetitions': 30, 'block_max_volume': 50}),
+            (None, 'set_block_temperature', {'temperature': 4, 'block_max_volume': 50})
+        ]
+        for msg, method, kwargs in program:
+            if msg:
+                update_log(msg)
+            getattr(thermocyclerModule, method)(**kwargs)
+        update_log("ʕ·ᴥ·ʔ : RT-PCR complete.")
+
+    # </editor-fold>
+
+    # <editor-fold desc="Tagment RT-PCR amplicons.">
+    def tagment():
+        update_log("ʕ·ᴥ·ʔ : Tagmenting RT-PCR amplicons with BLT beads.")
+        thermocyclerModule.open_lid()
+        magneticModule.disengage()
+        bltWells = [polar[sample]['bltBeadxWashWell'] for sample in samples]
+
+        update_log("ʕ·ᴥ·ʔ : Resuspending BLT beads.")
+        p300.pick_up_tip(tipForMixingHackflex)
+        set_speeds(p300, 400, 400)
+        for _ in range(settings['bltBeadResuspensionMixes']):
+            p300.aspirate(180, geometry.bottom(bltBeads))
+            p300.dispense(p300.current_volume, geometry.bottom(bltBeads, 5))
+        slow_exit(p300, bltBeads)
+        p300.return_tip()
+
+        # The beads go to the bottom of each well, where the amplicons are mixed in, so they are never
+        # distributed: a side dispense would leave them on the wall. The stop buffer tips used here are
+        # taken for every sample anyway.
+        update_log("ʕ·ᴥ·ʔ : Adding BLT beads to all samples.")
+        for sample in each_sample():
+            set_speeds(p300, 100, 5)
+            p300.pick_up_tip(polar[sample]['stopTip'])
+            aspirate_fluid(p300, bltBeadsVolume, bltBeads)
+            slow_exit(p300, bltBeads)
+            p300.dispense(p300.current_volume, polar[sample]['bltBeadxWashWell'].bottom())
+            slow_exit(p300, polar[sample]['bltBeadxWashWell'])
+            p300.return_tip()
+
+        # Both RT-PCR pools of a sample go into one tagmentation, drawn from under the oil overlay.
+        update_log("ʕ·ᴥ·ʔ : Adding RT-PCR amplicons to BLT beads.")
+        for sample in each_sample():
+            p20.pick_up_tip(polar[sample]['bltBeadTip'])
             p20.flow_rate.aspirate = 5
-            p20.aspirate(7.5, polar[sample]['extractionWell'].bottom().move(types.Point(z=0, x=(-3 * side))))
-            slow_exit(p20, polar[sample]['extractionWell'])
-            p20.dispense(p20.current_volume, polar[sample][pool].bottom())
+            for pool in ('rtPcrPool1', 'rtPcrPool2'):
+                p20.move_to(polar[sample][pool].top())
+                p20.aspirate(hackflexVolume, polar[sample][pool].bottom(0.5))
+                ptx.delay(seconds=1)
+                slow_exit(p20, polar[sample][pool])
+            p20.dispense(p20.current_volume, polar[sample]['bltBeadxWashWell'].bottom())
             set_speeds(p20, 20, 20)
-            p20.mix(5, 15, polar[sample][pool].bottom())
-            slow_exit(p20, polar[sample][pool])
+            p20.mix(settings['tagmentationMixes'], 15, polar[sample]['bltBeadxWashWell'].bottom())
+            slow_exit(p20, polar[sample]['bltBeadxWashWell'])
             p20.return_tip()
 
-    update_log("ʕ·ᴥ·ʔ : Eluent transfer to thermocycler complete.")
+        update_log("ʕ·ᴥ·ʔ : Tagmenting amplicons.")
+        yield incubate(minutes=settings['tagmentationMinutes'], msg="ʕ·ᴥ·ʔ : Tagmenting amplicons.")
+
+        update_log("ʕ·ᴥ·ʔ : Adding stop buffer to all samples.")
+        tagmentationVolume = bltBeadsVolume + 2 * hackflexVolume
+        if distribute:
+            distribute_reagent(p300, stopBufferVolume, stopBuffer, bltWells, tipForAddStopBuffer,
+                               tagmentationVolume + stopBufferVolume, dispense=5)
+        else:
+            for sample in each_sample():
+                set_speeds(p300, 100, 5)
+                p300.pick_up_tip(polar[sample]['stopTip'])
+                aspirate_fluid(p300, stopBufferVolume, stopBuffer)
+                slow_exit(p300, stopBuffer)
+                side_dispense(p300, polar[sample]['bltBeadxWashWell'], dispense=5)
+                slow_exit(p300, polar[sample]['bltBeadxWashWell'])
+                p300.return_tip()
+
+        update_log("ʕ·ᴥ·ʔ : Mixing stop buffer into all samples.")
+        for sample in each_sample():
+            p300.pick_up_tip(polar[sample]['stopTip'])
+            set_speeds(p300)
+            p300.mix(settings['stopMixes'], 40, polar[sample]['bltBeadxWashWell'].bottom())
+            collect_dispense_touch(p300, 40, polar[sample]['bltBeadxWashWell'])
+            p300.return_tip()
+
+        update_log("ʕ·ᴥ·ʔ : Stopping tagmentation.")
+        yield incubate(minutes=settings['stopMinutes'], msg="ʕ·ᴥ·ʔ : Stopping tagmentation.")
+
+        update_log("ʕ·ᴥ·ʔ : Amplicons tagmented.")
+
     # </editor-fold>
 
-    # <editor-fold desc="Add mineral oil overlay to RT-PCR reactions.">
-    update_log("ʕ·ᴥ·ʔ : Adding mineral oil overlay to RT-PCR reactions.")
-    for sample in samples:
-        p300.pick_up_tip(polar[sample]['bltBeadsWashTip'])
-        p300.aspirate(65, mineralOil.bottom())
-        slow_exit(p300, mineralOil)
-        for pool in pools:
-            side_dispense(p300, polar[sample][pool], volume=30, blowOut=False)
-            slow_exit(p300, polar[sample][pool])
-        p300.return_tip()
+    # <editor-fold desc="Wash BLT beads.">
+    def wash_blt_beads():
+        update_log("ʕ·ᴥ·ʔ : Washing BLT beads.")
+
+        update_log("ʕ·ᴥ·ʔ : Pelleting BLT beads.")
+        engage_magnet_module()
+        yield incubate(minutes=settings['washPelletMinutes'], msg="ʕ·ᴥ·ʔ : Pelleting BLT beads.")
+
+        update_log("ʕ·ᴥ·ʔ : Removing stop buffer.")
+        for sample in each_sample():
+            p300.pick_up_tip(polar[sample]['stopTip'])
+            remove_supernatant(p300, bltBeadsVolume + 2 * hackflexVolume + stopBufferVolume,
+                               polar[sample]['bltBeadxWashWell'])
+            slow_exit(p300, polar[sample]['bltBeadxWashWell'], liquidHeight=0)
+            trash_tip()
+
+        # Two washes in BLT bead wash buffer, as for the MagBead washes. The tips of the first wash have been in
+        # the sample, so the second takes fresh ones before it goes back into the buffer.
+        for tip in ('bltBeadsWashTip', 'bltBeadsWashTip2'):
+            update_log("ʕ·ᴥ·ʔ : Washing BLT beads with BLT bead wash buffer.")
+            yield from wash_beads(p300, bltWashVolume, bltBeadWashBuffer, 'bltBeadxWashWell', tip,
+                                  settings['washMixes'], is_detergent=True)
+
+        update_log("ʕ·ᴥ·ʔ : BLT beads washed.")
 
-    magneticModule.disengage()
-    update_log("ʕ·ᴥ·ʔ : Mineral oil overlay added to RT-PCR reactions.")
     # </editor-fold>
 
-    # <editor-fold desc="RT-PCR">
-    update_log("ʕ·ᴥ·ʔ : Performing RT-PCR.")
-
-    update_log("ʕ·ᴥ·ʔ : Closing thermocycler lid.")
-    thermocyclerModule.close_lid()
-    ptx.home()
-    thermocyclerModule.set_lid_temperature(105)
-
-    update_log("ʕ·ᴥ·ʔ : Performing uracil DNA glycosylase sample pre-treatment.")
-    thermocyclerModule.set_block_temperature(25, block_max_volume=50, hold_time_minutes=3)
-    update_log("ʕ·ᴥ·ʔ : Performing reverse transcription.")
-    thermocyclerModule.set_block_temperature(55, block_max_volume=50, hold_time_minutes=15)
-    update_log("ʕ·ᴥ·ʔ : Performing reverse transcription.")
-    thermocyclerModule.set_block_temperature(95, block_max_volume=50, hold_time_minutes=2)
-    update_log("ʕ·ᴥ·ʔ : Performing amplicon generation.")
-    pcr_profile = [
-        {'temperature': 95, 'hold_time_seconds': 15},
-        {'temperature': 63, 'hold_time_seconds': 180}]
-    thermocyclerModule.execute_profile(steps=pcr_profile, repetitions=30, block_max_volume=50)
-
-    thermocyclerModule.set_block_temperature(4, block_max_volume=50)
-    update_log("ʕ·ᴥ·ʔ : RT-PCR complete.")
-
-    # </editor-fold>
\ No newline at end of file
+    # <editor-fold desc="Index PCR">
+    def run_index_pcr():
+        update_log("ʕ·ᴥ·ʔ : Plating index PCR reactions.")
+        cold_plate_ready(4)
+        magneticModule.disengage()
+
+        # The washed beads are taken up in the index PCR mix of their sample and go to the thermocycler with it.
+        for sample in each_sample():
+            well = polar[sample]['bltBeadxWashWell']
+            p300.pick_up_tip(polar[sample]['pcrTip'])
+            set_speeds(p300)
+            aspirate_fluid(p300, indexPcrVolume, polar[sample]['pcrWithIndex'], height=0.5)
+            slow_exit(p300, polar[sample]['pcrWithIndex'])
+            p300.dispense(p300.current_volume, well.bottom())
+            resuspend_beads(p300, 10, indexPcrVolume, well)
+            set_speeds(p300, 20, 20)
+            p300.aspirate(indexPcrVolume, geometry.bottom(well, 0.5))
+            ptx.delay(seconds=1)
+            slow_exit(p300, well)
+            p300.dispense(p300.current_volume, polar[sample]['indexPcrWell'].bottom())
+            p300.blow_out(polar[sample]['indexPcrWell'].top(-2))
+            slow_exit(p300, polar[sample]['indexPcrWell'])
+            p300.return_tip()
+            set_speeds(p300)
+
+        update_log("ʕ·ᴥ·ʔ : Closing thermocycler lid and deactivating temperature module.")
+        temperatureModule.deactivate()
+        thermocyclerModule.close_lid()
+        ptx.home()
+
+        update_log("ʕ·ᴥ·ʔ : Performing index PCR.")
+        pcr_profile = [
+            {'temperature': 98, 'hold_time_seconds': 45},
+            {'temperature': 62, 'hold_time_seconds': 30},
+            {'temperature': 72, 'hold_time_seconds': 120}]
+        # (log message, thermocycler method, arguments)
+        program = [
+            (None, 'set_lid_temperature', {'temperature': 105}),
+            ("ʕ·ᴥ·ʔ : Filling tagmentation gaps.", 'set_block_temperature',
+             {'temperature': 72, 'block_max_volume': 50, 'hold_time_minutes': settings['gapFillMinutes']}),
+            ("ʕ·ᴥ·ʔ : Performing index PCR denaturation.", 'set_block_temperature',
+             {'temperature': 98, 'block_max_volume': 50, 'hold_time_minutes': 3}),
+            ("ʕ·ᴥ·ʔ : Performing index PCR amplification.", 'execute_profile',
+             {'steps': pcr_profile, 'repetitions': settings['indexPcrCycles'], 'block_max_volume': 50}),
+            ("ʕ·ᴥ·ʔ : Performing index PCR final extension.", 'set_block_temperature',
+             {'temperature': 72, 'block_max_volume': 50, 'hold_time_minutes': 1}),
+            (None, 'set_block_temperature', {'temperature': 4, 'block_max_volume': 50})
+        ]
+        for msg, method, kwargs in program:
+            if msg:
+                update_log(msg)
+            getattr(thermocyclerModule, method)(**kwargs)
+        update_log("ʕ·ᴥ·ʔ : Index PCR complete, indexed libraries ready.")
+
+    # </editor-fold>
+
+    # </editor-fold>
+
+    """
+    Protocol starts below.
+    """
+
+    # RT-PCR plating only needs the cold plate and the thermocycler, so it runs while the samples incubate
+    # with Protinase K. The thermocycler lid stays closed over the plated reactions until the ethanol washes
+    # are done and is opened while the beads dry.
+    #
+    # With precondition the thermocycler block is cooled once Protinase K is incubating, and the lid is
+    # heated while the beads dry: each task is listed right after the one whose wait it fills.
+    #
+    # Which task goes next is decided on the simulated timeline. A context without one, the robot or the app's
+    # analysis, which does not wait out delays, takes the steps the simulation took and only waits on the
+    # wall clock for incubations that are not over yet, so every run of the same arguments runs the same
+    # commands in the same order.
+    steps = None
+    if getattr(ptx, 'now', None) is None:
+        steps = planned_steps(sample_count=sample_count, plan=plan, distribute=distribute, precondition=precondition,
+                              liquid_following=liquid_following, parameters=parameters, layout=layout,
+                              library_prep=library_prep, tip_wash=tip_wash)
+    scheduler = Scheduler(ptx, log=update_log, steps=steps)
+    scheduler.add('setUp', set_up_modules)
+    scheduler.add('loadSamples', load_samples, after=['setUp'])
+    scheduler.add('proteinaseK', add_proteinase_k, after=['loadSamples'])
+    if precondition:
+        scheduler.add('coolThermocycler', cool_thermocycler, after=['loadSamples'])
+    scheduler.add('rtPcrPlating', plate_rt_pcr, after=['loadSamples'] + (['coolThermocycler'] if precondition else []))
+    scheduler.add('binding', bind_to_beads, after=['proteinaseK'])
+    scheduler.add('magbeadWash', wash_with_magbead_buffers, after=['binding'])
+    scheduler.add('ethanolWash', wash_with_ethanol, after=['magbeadWash'])
+    scheduler.add('dryBeads', dry_beads, after=['ethanolWash'])
+    scheduler.add('openLid', open_thermocycler_lid, after=['ethanolWash', 'rtPcrPlating'])
+    if precondition:
+        scheduler.add('preheatLid', preheat_lid, after=['openLid'])
+    scheduler.add('elution', elute, after=['dryBeads', 'openLid'])
+    scheduler.add('transfer', transfer_eluent, after=['elution', 'rtPcrPlating'])
+    scheduler.add('oilOverlay', add_oil_overlay, after=['transfer'])
+    scheduler.add('rtPcr', run_rt_pcr, after=['oilOverlay'] + (['preheatLid'] if precondition else []))
+    if library_prep:
+        # HackFlex library prep carries on from the RT-PCR plate.
+        scheduler.add('tagmentation', tagment, after=['rtPcr'])
+        scheduler.add('bltWash', wash_blt_beads, after=['tagmentation'])
+        scheduler.add('indexPcr', run_index_pcr, after=['bltWash'])
+    if checkpoint is not None:
+        checkpoint.attach(scheduler)
+
+    # <editor-fold desc="Run">
+    # The run log, alert thread and telemetry are only started once the deck is set up, so that a run that
+    # fails to set up leaves no open log file or thread behind, and are always closed again.
+    runLog = RunLogger(run_log_directory, experiment_name, enabled=not ptx.is_simulating() or log_directory is not None,
+                       commands=ptx.commands)
+    try:
+        alerts.start()
+        if telemetry is not None:
+            telemetry.start(clock=getattr(ptx, 'now', None), temperatures=module_temperatures)
+        scheduler.run()
+    except BaseException:
+        runLog.close(status='failed')
+        if telemetry is not None:
+            telemetry.done(status='failed')
+        raise
+    finally:
+        alerts.stop()
+    runLog.close()
+    if telemetry is not None:
+        telemetry.done()
+    return scheduler.steps
+
+    # </editor-fold>
+
+
+def planned_steps(**params):
+    # The scheduler steps of a run with these arguments of run(), taken on the simulated timeline.
+    return run(RecordingContext(), **params)
@@ -0,0 +1,75 @@
+import json
+import os
+from datetime import datetime
+
+
+# Structured run log. Records are buffered in memory and written as JSON lines when a new phase starts
+# and when the run ends, so pipetting never waits on the file system. The file is opened once per run.
+class RunLogger:
+    def __init__(self, directory, experiment="", enabled=True, commands=None, started=None):
+        self.started = started or datetime.now()
+        self.phase_name = None
+        self.sample_name = None
+        self.buffer = []
+        self.commands = commands
+        self.phaseStartCommands = 0
+        self.file = None
+        self.path = None
+        if enabled:
+            os.makedirs(directory, exist_ok=True)
+            prefix = experiment + "_" if experiment else ""
+            self.path = os.path.join(directory, prefix + "run_log_" + self.started.strftime("%y_%m_%d_%H_%M_%S") +
+                                     ".jsonl")
+            self.file = open(self.path, "a", encoding="utf-8")
+
+    def command_count(self):
+        return len(self.commands()) if self.commands is not None else None
+
+    def record(self, event, **fields):
+        commands = self.command_count()
+        entry = {
+            'time': datetime.now().isoformat(timespec='milliseconds'),
+            'event': event,
+            'phase': self.phase_name,
+            'sample': self.sample_name,
+            'commands': commands,
+            'phaseCommands': commands - self.phaseStartCommands if commands is not None else None
+        }
+        entry.update(fields)
+        self.buffer.append(entry)
+        return entry
+
+    def phase(self, message):
+        # A phase boundary: close out the previous phase and write everything buffered so far.
+        if self.phase_name is not None:
+            self.record('phase_end')
+        self.flush()
+        self.phase_name = message
+        self.sample_name = None
+        commands = self.command_count()
+        self.phaseStartCommands = commands if commands is not None else 0
+        return self.record('phase', message=message)
+
+    def sample(self, sample):
+        self.sample_name = sample
+        return self.record('sample')
+
+    def flush(self):
+        if self.file is not None and self.buffer:
+            self.file.write(''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in self.buffer))
+            self.file.flush()
+        self.buffer = []
+
+    def close(self, status='complete'):
+        if self.phase_name is not None:
+            self.record('phase_end')
+        self.record('run_end', status=status)
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def read_log(path):
+    with open(path, encoding="utf-8") as log:
+        return [json.loads(line) for line in log if line.strip()]
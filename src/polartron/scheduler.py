@@ -0,0 +1,163 @@
+import time
+import types
+
+
+class Incubation:
+    def __init__(self, seconds, msg=None):
+        self.seconds = seconds
+        self.msg = msg
+
+
+def incubate(minutes=0, seconds=0, msg=None):
+    # Yielded by a task to hand the robot over while its wells sit for at least this long.
+    return Incubation(seconds + 60 * minutes, msg)
+
+
+class Task:
+    def __init__(self, name, action, after=()):
+        self.name = name
+        self.action = action
+        self.after = list(after)
+        self.state = 'pending'
+        self.steps = None
+        self.incubation = None
+        self.wake = None
+        self.interrupted = False
+
+
+class SchedulingError(RuntimeError):
+    pass
+
+
+# Runs protocol phases as tasks with explicit dependencies. A task is a function; if it is a generator it
+# may yield incubate(...) to wait, and the scheduler runs other ready tasks in the meantime. A task only
+# resumes once its incubation has fully elapsed, so waits are never shortened, only filled.
+#
+# Which task goes next depends on the clock, so it is only decided on a deterministic one, such as the
+# simulation's. Every step is kept in steps, [task name, whether the robot idled for it], and a run given
+# those steps takes them in the same order, whatever its clock says: it only waits on its clock for
+# incubations that are not over yet.
+#
+# A context that keeps time for incubations itself, such as the one a command plan is compiled against (see
+# polartron.plancache), has start_incubation(name, seconds) and await_incubation(name); the scheduler
+# then tells it when each incubation starts and lets it do the waiting.
+class Scheduler:
+    def __init__(self, ptx, log=None, clock=None, on_step=None, on_done=None, steps=None):
+        self.ptx = ptx
+        self.log = log or ptx.comment
+        self.clock = clock or getattr(ptx, 'now', time.monotonic)
+        # Called with a task before it is (re)started and once it has finished.
+        self.on_step = on_step
+        self.on_done = on_done
+        self.planned = steps
+        self.running = None
+        self.tasks = []
+        self.order = []
+        self.steps = []
+
+    def add(self, name, action, after=()):
+        if name in self.names():
+            raise SchedulingError("Task %r is already scheduled" % name)
+        for dependency in after:
+            if dependency not in self.names():
+                raise SchedulingError("Task %r depends on unknown task %r" % (name, dependency))
+        self.tasks.append(Task(name, action, after))
+
+    def names(self):
+        return [task.name for task in self.tasks]
+
+    def task(self, name):
+        for task in self.tasks:
+            if task.name == name:
+                return task
+        raise KeyError(name)
+
+    def ready(self, task):
+        return task.state == 'pending' and all(self.task(name).state == 'done' for name in task.after)
+
+    def next_task(self, now):
+        # Incubated tasks that are due come first so that their waits run over as little as possible.
+        due = [task for task in self.tasks if task.state == 'incubating' and task.wake <= now]
+        if due:
+            return min(due, key=lambda task: task.wake)
+        for task in self.tasks:
+            if self.ready(task):
+                return task
+        return None
+
+    def run(self):
+        if self.planned is not None:
+            return self.run_planned()
+        while any(task.state != 'done' for task in self.tasks):
+            task = self.next_task(self.clock())
+            idle = task is None
+            if idle:
+                incubating = [task for task in self.tasks if task.state == 'incubating']
+                if not incubating:
+                    pending = [task.name for task in self.tasks if task.state == 'pending']
+                    raise SchedulingError("Tasks can never start: %s" % ', '.join(pending))
+                task = min(incubating, key=lambda task: task.wake)
+            self.resume(task, idle)
+        return self.order
+
+    def run_planned(self):
+        for name, idle in self.planned:
+            task = self.task(name)
+            if task.state == 'done' or (task.state == 'pending' and not self.ready(task)):
+                raise SchedulingError("Task %r cannot take its planned step" % name)
+            self.resume(task, idle)
+        unfinished = [task.name for task in self.tasks if task.state != 'done']
+        if unfinished:
+            raise SchedulingError("Tasks left unfinished by the planned steps: %s" % ', '.join(unfinished))
+        return self.order
+
+    def resume(self, task, idle):
+        # Take the next step of the task, once what is left of its incubation has been waited out. idle: the
+        # robot has nothing else to do meanwhile, which is worth telling the operator.
+        self.steps.append([task.name, idle])
+        if self.on_step is not None:
+            self.on_step(task)
+        if task.state == 'incubating':
+            if idle and task.interrupted and task.incubation.msg:
+                self.log(task.incubation.msg)
+            wait = getattr(self.ptx, 'await_incubation', None)
+            if wait is not None:
+                wait(task.name)
+            else:
+                remaining = task.wake - self.clock()
+                if remaining > 0:
+                    self.ptx.delay(seconds=remaining)
+        self.step(task)
+        for other in self.tasks:
+            if other is not task and other.state == 'incubating':
+                other.interrupted = True
+
+    def step(self, task):
+        self.running = task
+        try:
+            if task.state == 'pending':
+                self.order.append(task.name)
+                result = task.action()
+                if not isinstance(result, types.GeneratorType):
+                    self.finish(task)
+                    return
+                task.steps = result
+            try:
+                incubation = next(task.steps)
+            except StopIteration:
+                self.finish(task)
+                return
+        finally:
+            self.running = None
+        task.state = 'incubating'
+        task.incubation = incubation
+        task.wake = self.clock() + incubation.seconds
+        task.interrupted = False
+        start = getattr(self.ptx, 'start_incubation', None)
+        if start is not None:
+            start(task.name, incubation.seconds)
+
+    def finish(self, task):
+        task.state = 'done'
+        if self.on_done is not None:
+            self.on_done(task)
@@ -0,0 +1,2 @@
+from polartron.simulation.context import RecordingContext, SimulationError, phaseMarker
+from polartron.simulation.types import Point, Location
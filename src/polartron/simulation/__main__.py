@@ -0,0 +1,44 @@
+import argparse
+import hashlib
+import json
+import time
+
+from polartron.simulation.context import RecordingContext
+
+
+def trace_lines(trace):
+    # One line per command with its details, keys sorted and numbers rounded, so identical runs give
+    # identical text.
+    lines = []
+    for record in trace:
+        fields = {key: round(value, 3) if isinstance(value, float) else value for key, value in record.items()}
+        lines.append(json.dumps(fields, sort_keys=True, ensure_ascii=False, default=repr))
+    return lines
+
+
+def simulate(sample_count=4, **run_kwargs):
+    from polartron.protocols.run_polartron import run
+    ctx = RecordingContext()
+    run(ctx, sample_count=sample_count, **run_kwargs)
+    return ctx
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the POLARtron protocol against the bundled simulation.')
+    parser.add_argument('--samples', type=int, default=4, help='number of sample columns')
+    parser.add_argument('--trace', help='write the command trace to this file, one JSON object per line')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    ctx = simulate(args.samples)
+    elapsed = time.perf_counter() - started
+    lines = trace_lines(ctx.trace)
+    if args.trace:
+        with open(args.trace, 'w', encoding='utf-8') as output:
+            output.write('\n'.join(lines) + '\n')
+    digest = hashlib.sha256('\n'.join(lines).encode('utf-8')).hexdigest()
+    print('%d commands simulated in %.2f s, trace sha256 %s' % (len(lines), elapsed, digest[:16]))
+
+
+if __name__ == '__main__':
+    main()
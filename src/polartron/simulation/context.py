@@ -0,0 +1,490 @@
+from polartron.simulation import timing
+from polartron.simulation.labware import load_labware, load_labware_from_definition
+from polartron.simulation.types import Point, Location
+
+# Comments written by update_log start with this marker and open a new phase.
+phaseMarker = 'ʕ·ᴥ·ʔ'
+
+pipetteSpecs = {
+    'p300_multi_gen2': {'maxVolume': 300, 'channels': 8, 'aspirate': 94.0, 'dispense': 94.0, 'blowOut': 94.0},
+    'p20_multi_gen2': {'maxVolume': 20, 'channels': 8, 'aspirate': 7.6, 'dispense': 7.6, 'blowOut': 7.6}
+}
+
+moduleSpecs = {
+    'magnetic module gen2': {'displayName': 'Magnetic Module GEN2', 'offset': Point(-1.175, -0.125, 82.25)},
+    'temperature module gen2': {'displayName': 'Temperature Module GEN2', 'offset': Point(-1.45, -0.15, 80.09)},
+    'thermocycler': {'displayName': 'Thermocycler Module', 'slot': '7', 'offset': Point(0.0, 82.56, 97.8),
+                     'lidHeight': 37.7}
+}
+
+
+# Volumes closer than this are treated as equal, so that float arithmetic in the protocol never fails a run.
+volumeTolerance = 1e-6
+
+
+class SimulationError(RuntimeError):
+    pass
+
+
+class MaxSpeeds(dict):
+    # Mirrors ProtocolContext.max_speeds: assigning None restores the default for that axis.
+    def __setitem__(self, axis, value):
+        if value is None:
+            self.pop(axis, None)
+        else:
+            dict.__setitem__(self, axis, value)
+
+
+class FlowRates:
+    def __init__(self, aspirate, dispense, blow_out):
+        self.aspirate = aspirate
+        self.dispense = dispense
+        self.blow_out = blow_out
+
+
+class RecordingInstrument:
+    def __init__(self, ctx, name, mount):
+        spec = pipetteSpecs[name]
+        self._ctx = ctx
+        self.name = name
+        self.mount = mount
+        self.max_volume = spec['maxVolume']
+        self.channels = spec['channels']
+        self.flow_rate = FlowRates(spec['aspirate'], spec['dispense'], spec['blowOut'])
+        self.default_speed = None
+        self.current_volume = 0.0
+        self._tip = None
+
+    @property
+    def has_tip(self):
+        return self._tip is not None
+
+    def _location(self, location):
+        return location if location is not None else self._ctx._positions.get(self.mount)
+
+    def move_to(self, location, force_direct=False, minimum_z_height=None, speed=None):
+        self._ctx._move(self, location, 'move_to')
+        return self
+
+    def _require_tip(self, command):
+        if self._tip is None:
+            raise SimulationError("Cannot %s without a tip on the %s" % (command, self))
+
+    def pick_up_tip(self, location=None):
+        well = location.labware if isinstance(location, Location) else location
+        if self._tip is not None:
+            raise SimulationError("%s already has a tip from %r" % (self, self._tip))
+        if not well.has_tip:
+            raise SimulationError("There is no tip at %r" % well)
+        self._ctx._move(self, well.top(), 'move_to')
+        self._tip = well
+        well.has_tip = False
+        self._ctx._record('pick_up_tip', timing.pickUpTipSeconds, 'tips', self, location=well)
+        return self
+
+    def return_tip(self):
+        self._require_tip('return a tip')
+        well = self._tip
+        self._ctx._move(self, well.top(), 'move_to')
+        self._tip = None
+        self.current_volume = 0.0
+        well.has_tip = True
+        self._ctx._record('return_tip', timing.dropTipSeconds, 'tips', self, location=well)
+        return self
+
+    def drop_tip(self, location=None):
+        self._require_tip('drop a tip')
+        if location is not None:
+            self._ctx._move(self, location, 'move_to')
+        self._tip = None
+        self.current_volume = 0.0
+        self._ctx._record('drop_tip', timing.dropTipSeconds, 'tips', self, location=location)
+        return self
+
+    def aspirate(self, volume=None, location=None, rate=1.0):
+        self._require_tip('aspirate')
+        if volume is None:
+            volume = self.max_volume - self.current_volume
+        if self.current_volume + volume > self.max_volume + volumeTolerance:
+            raise SimulationError("Cannot aspirate %s uL into %s holding %s uL (max %s uL)" %
+                                  (volume, self, self.current_volume, self.max_volume))
+        if location is not None:
+            self._ctx._move(self, location, 'move_to')
+        self.current_volume += volume
+        self._ctx._record('aspirate', timing.plunger_seconds(volume, self.flow_rate.aspirate * rate), 'liquid',
+                          self, location=self._location(location), volume=volume)
+        return self
+
+    def dispense(self, volume=None, location=None, rate=1.0):
+        self._require_tip('dispense')
+        if volume is None:
+            volume = self.current_volume
+        if volume > self.current_volume + volumeTolerance:
+            raise SimulationError("Cannot dispense %s uL from %s holding %s uL" % (volume, self, self.current_volume))
+        if location is not None:
+            self._ctx._move(self, location, 'move_to')
+        self.current_volume = max(self.current_volume - volume, 0.0)
+        self._ctx._record('dispense', timing.plunger_seconds(volume, self.flow_rate.dispense * rate), 'liquid',
+                          self, location=self._location(location), volume=volume)
+        return self
+
+    def mix(self, repetitions=1, volume=None, location=None, rate=1.0):
+        self._require_tip('mix')
+        if volume is None:
+            volume = self.max_volume
+        if self.current_volume + volume > self.max_volume + volumeTolerance:
+            raise SimulationError("Cannot mix %s uL in %s holding %s uL (max %s uL)" %
+                                  (volume, self, self.current_volume, self.max_volume))
+        if location is not None:
+            self._ctx._move(self, location, 'move_to')
+        seconds = repetitions * (timing.plunger_seconds(volume, self.flow_rate.aspirate * rate) +
+                                 timing.plunger_seconds(volume, self.flow_rate.dispense * rate))
+        self._ctx._record('mix', seconds, 'liquid', self, location=self._location(location), volume=volume,
+                          repetitions=repetitions)
+        return self
+
+    def blow_out(self, location=None):
+        self._require_tip('blow out')
+        if location is not None:
+            self._ctx._move(self, location, 'move_to')
+        self.current_volume = 0.0
+        self._ctx._record('blow_out', timing.blowOutSeconds, 'liquid', self, location=self._location(location))
+        return self
+
+    def __repr__(self):
+        return '%s on %s mount' % (self.name, self.mount)
+
+
+class RecordingModule:
+    def __init__(self, ctx, name, slot):
+        spec = moduleSpecs[name]
+        self._ctx = ctx
+        self.name = name
+        self.slot = slot
+        self.labware = None
+        self._offset = spec['offset']
+        self._displayName = spec['displayName']
+
+    def load_labware(self, name, label=None):
+        self.labware = load_labware(name, self.slot, self._offset, label)
+        self._ctx._labware.append(self.labware)
+        return self.labware
+
+    def load_labware_from_definition(self, definition, label=None):
+        self.labware = load_labware_from_definition(definition, self.slot, self._offset, label)
+        self._ctx._labware.append(self.labware)
+        return self.labware
+
+    def __repr__(self):
+        return '%s on %s' % (self._displayName, self.slot)
+
+
+class RecordingMagneticModule(RecordingModule):
+    def __init__(self, ctx, name, slot):
+        super().__init__(ctx, name, slot)
+        self.status = 'disengaged'
+        self.height = None
+
+    def engage(self, height=None, offset=None, height_from_base=None):
+        self.status = 'engaged'
+        self.height = height
+        self._ctx._record('magnet_engage', timing.magnetSeconds, 'module', module=self)
+
+    def disengage(self):
+        self.status = 'disengaged'
+        self._ctx._record('magnet_disengage', timing.magnetSeconds, 'module', module=self)
+
+
+class RecordingTemperatureModule(RecordingModule):
+    def __init__(self, ctx, name, slot):
+        super().__init__(ctx, name, slot)
+        self.temperature = timing.ambientTemperature
+        self.target = None
+        # When a ramp started with start_set_temperature reaches its target.
+        self._readyAt = 0.0
+
+    def _ramp_seconds(self, celsius):
+        return timing.ramp_seconds(self.temperature, celsius, timing.temperatureModuleHeatingRate,
+                                   timing.temperatureModuleCoolingRate)
+
+    def set_temperature(self, celsius):
+        seconds = self._ramp_seconds(celsius)
+        self.temperature = self.target = celsius
+        self._ctx._record('set_temperature', seconds, 'module', module=self, temperature=celsius)
+
+    def start_set_temperature(self, celsius):
+        seconds = self._ramp_seconds(celsius)
+        self.temperature = self.target = celsius
+        self._ctx._record('start_set_temperature', 0.0, 'module', module=self, temperature=celsius)
+        self._readyAt = self._ctx.now() + seconds
+
+    def await_temperature(self, celsius):
+        self._ctx._record('await_temperature', max(self._readyAt - self._ctx.now(), 0.0), 'module', module=self,
+                          temperature=celsius)
+
+    def deactivate(self):
+        self.target = None
+        self._ctx._record('deactivate', 0.0, 'module', module=self)
+
+    @property
+    def status(self):
+        return 'idle' if self.target is None else 'holding at target'
+
+
+class RecordingThermocycler(RecordingModule):
+    def __init__(self, ctx, name, slot):
+        super().__init__(ctx, name, slot)
+        self.lid_position = 'open'
+        self.block_temperature = timing.ambientTemperature
+        self.lid_temperature = timing.ambientTemperature
+        self._lidHeight = moduleSpecs[name]['lidHeight']
+        # End of the last command run on the background timeline.
+        self.busy_until = 0.0
+
+    def open_lid(self):
+        seconds = timing.lidSeconds if self.lid_position != 'open' else 0.0
+        self.lid_position = 'open'
+        self._ctx._record('open_lid', seconds, 'thermocycler', module=self)
+
+    def close_lid(self):
+        seconds = timing.lidSeconds if self.lid_position != 'closed' else 0.0
+        self.lid_position = 'closed'
+        self._ctx._record('close_lid', seconds, 'thermocycler', module=self)
+
+    def _block_seconds(self, temperature, hold_time_seconds=None, hold_time_minutes=None):
+        seconds = timing.ramp_seconds(self.block_temperature, temperature, timing.blockHeatingRate,
+                                      timing.blockCoolingRate)
+        self.block_temperature = temperature
+        return seconds + (hold_time_seconds or 0) + 60 * (hold_time_minutes or 0)
+
+    def set_block_temperature(self, temperature, hold_time_seconds=None, hold_time_minutes=None,
+                              ramp_rate=None, block_max_volume=None):
+        seconds = self._block_seconds(temperature, hold_time_seconds, hold_time_minutes)
+        self._ctx._record('set_block_temperature', seconds, 'thermocycler', module=self, temperature=temperature)
+
+    def set_lid_temperature(self, temperature):
+        seconds = timing.ramp_seconds(self.lid_temperature, temperature, timing.lidHeatingRate,
+                                      timing.lidHeatingRate)
+        self.lid_temperature = temperature
+        self._ctx._record('set_lid_temperature', seconds, 'thermocycler', module=self, temperature=temperature)
+
+    def execute_profile(self, steps, repetitions, block_max_volume=None):
+        seconds = 0.0
+        for _ in range(repetitions):
+            for step in steps:
+                seconds += self._block_seconds(step['temperature'], step.get('hold_time_seconds'),
+                                               step.get('hold_time_minutes'))
+        self._ctx._record('execute_profile', seconds, 'thermocycler', module=self, repetitions=repetitions)
+
+    def deactivate_lid(self):
+        self.lid_temperature = timing.ambientTemperature
+        self._ctx._record('deactivate_lid', 0.0, 'thermocycler', module=self)
+
+    def deactivate_block(self):
+        self._ctx._record('deactivate_block', 0.0, 'thermocycler', module=self)
+
+    def deactivate(self):
+        self.deactivate_lid()
+        self.deactivate_block()
+
+    @property
+    def busy_seconds(self):
+        # Time left of what is running on the background timeline.
+        return max(self.busy_until - self._ctx.now(), 0.0)
+
+    @property
+    def highest_z(self):
+        if self.labware is None:
+            return 0.0
+        return self.labware.highest_z + (self._lidHeight if self.lid_position == 'closed' else 0.0)
+
+
+moduleTypes = {
+    'magnetic module gen2': RecordingMagneticModule,
+    'temperature module gen2': RecordingTemperatureModule,
+    'thermocycler': RecordingThermocycler
+}
+
+
+# Stand-in for ProtocolContext that records every command with an estimated duration. It covers the
+# part of the Protocol API that run_polartron uses, tracks tips, pipette volumes and module state, and
+# raises SimulationError for what the robot would refuse: liquid handling without a tip, more liquid than
+# the pipette holds, picking up a tip that is not there, and moving into the thermocycler with its lid
+# closed. The trace is deterministic, so two runs of the same protocol can be compared line by line.
+class RecordingContext:
+
+    def __init__(self):
+        self.max_speeds = MaxSpeeds()
+        self.trace = []
+        self.phase = 'Protocol start'
+        self.rail_lights_on = False
+        self._elapsed = 0.0
+        self._labware = []
+        self._modules = []
+        self._instruments = {}
+        self._positions = {}
+        self._gantry = timing.homePoint
+        self._heights = {'left': timing.homeHeight, 'right': timing.homeHeight}
+        self._lastMount = None
+        self._lastLocation = None
+        self._background = None
+
+    # <editor-fold desc="Protocol API">
+
+    def is_simulating(self):
+        return True
+
+    def load_labware(self, load_name, location, label=None):
+        labware = load_labware(load_name, location, label=label)
+        self._labware.append(labware)
+        return labware
+
+    def load_labware_from_definition(self, labware_def, location, label=None):
+        labware = load_labware_from_definition(labware_def, location, label=label)
+        self._labware.append(labware)
+        return labware
+
+    def load_module(self, module_name, location=None):
+        name = module_name.lower()
+        slot = str(location) if location is not None else moduleSpecs[name]['slot']
+        module = moduleTypes[name](self, name, slot)
+        self._modules.append(module)
+        return module
+
+    def load_instrument(self, instrument_name, mount, tip_racks=None):
+        instrument = RecordingInstrument(self, instrument_name, mount)
+        self._instruments[mount] = instrument
+        return instrument
+
+    def comment(self, msg):
+        if msg.startswith(phaseMarker):
+            self.phase = msg
+        self._record('comment', 0.0, 'comment', message=msg)
+
+    def delay(self, seconds=0, minutes=0, msg=None):
+        self._record('delay', seconds + 60 * minutes, 'delay')
+
+    def pause(self, msg=None):
+        self._record('pause', 0.0, 'operator', message=msg)
+
+    def home(self):
+        self._gantry = timing.homePoint
+        self._heights = {'left': timing.homeHeight, 'right': timing.homeHeight}
+        self._positions = {}
+        self._lastLocation = None
+        self._record('home', timing.homeSeconds, 'motion')
+
+    def set_rail_lights(self, on):
+        self.rail_lights_on = on
+
+    @property
+    def location_cache(self):
+        return self._lastLocation
+
+    def commands(self):
+        return ['%s %s' % (record['command'], record.get('location', '')) for record in self.trace]
+
+    # </editor-fold>
+
+    def now(self):
+        return self._elapsed
+
+    # While set, module commands run on their own timeline starting at the current time, the way a
+    # thermocycler program runs next to the protocol. The module stays busy until that timeline ends and
+    # may not be used by the protocol before then.
+    @property
+    def background(self):
+        return self._background is not None
+
+    @background.setter
+    def background(self, on):
+        self._background = self._elapsed if on else None
+
+    def _record(self, command, seconds, category, instrument=None, location=None, module=None, **details):
+        if module is not None and self._background is None and self._elapsed < getattr(module, 'busy_until', 0.0):
+            raise SimulationError("%s of %s while it is still running a program" % (command, module))
+        record = {'command': command, 'phase': self.phase, 'category': category, 'seconds': seconds,
+                  'start': self._elapsed if self._background is None else self._background}
+        if instrument is not None:
+            record['mount'] = instrument.mount
+        if location is not None:
+            record['location'] = repr(location.labware if isinstance(location, Location) else location)
+        if module is not None:
+            record['module'] = repr(module)
+        record.update(details)
+        self.trace.append(record)
+        if self._background is not None:
+            record['background'] = True
+            self._background += seconds
+            if module is not None:
+                module.busy_until = self._background
+        else:
+            self._elapsed += seconds
+        return record
+
+    def _deck_height(self):
+        heights = [labware.highest_z for labware in self._labware]
+        heights += [module.highest_z for module in self._modules if isinstance(module, RecordingThermocycler)]
+        return max(heights or [0.0])
+
+    def _move(self, instrument, location, command):
+        well = location.labware
+        labware = getattr(well, 'parent', well)
+        for module in self._modules:
+            if isinstance(module, RecordingThermocycler) and module.labware is labware and \
+                    module.lid_position != 'open':
+                raise SimulationError("Cannot move %s to %r with the thermocycler lid closed" % (instrument, well))
+        mount = instrument.mount
+        target = location.point
+        axis = timing.mountAxes[mount]
+        zSpeed = self.max_speeds.get(axis, timing.defaultMaxSpeeds[axis])
+        xySpeed = instrument.default_speed or timing.defaultGantrySpeed
+
+        segments = []
+        if self._lastMount is not None and self._lastMount != mount:
+            # The idle mount is retracted before the other one moves.
+            other = self._lastMount
+            otherAxis = timing.mountAxes[other]
+            segments.append(((0, 0, self._heights[other]), (0, 0, timing.homeHeight),
+                             self.max_speeds.get(otherAxis, timing.defaultMaxSpeeds[otherAxis])))
+            self._heights[other] = timing.homeHeight
+            self._positions.pop(other, None)
+
+        start = (self._gantry[0], self._gantry[1], self._heights[mount])
+        end = (target.x, target.y, target.z)
+        previous = self._positions.get(mount)
+        previousWell = previous.labware if previous is not None else None
+        well = location.labware
+        if previousWell is not None and previousWell is well:
+            segments.append((start, end, zSpeed))
+        else:
+            if previousWell is not None and getattr(previousWell, 'parent', None) is getattr(well, 'parent', None):
+                safe = well.parent.highest_z + timing.arcClearance
+            else:
+                safe = self._deck_height() + timing.arcClearance
+            safe = max(safe, start[2], end[2])
+            segments.append((start, (start[0], start[1], safe), zSpeed))
+            segments.append(((start[0], start[1], safe), (end[0], end[1], safe), zSpeed))
+            segments.append(((end[0], end[1], safe), end, zSpeed))
+
+        seconds = timing.commandOverheadSeconds
+        travel = 0.0
+        slowZ = 0.0
+        for segmentStart, segmentEnd, segmentZSpeed in segments:
+            segmentTime = timing.segment_seconds(segmentStart, segmentEnd, xySpeed, segmentZSpeed)
+            seconds += segmentTime
+            travel += timing.segment_length(segmentStart, segmentEnd)
+            if segmentZSpeed < timing.defaultMaxSpeeds[axis] and segmentStart[2] != segmentEnd[2]:
+                slowZ += segmentTime
+
+        self._gantry = (target.x, target.y)
+        self._heights[mount] = target.z
+        self._positions[mount] = location
+        self._lastMount = mount
+        self._lastLocation = location
+        return self._record(command, seconds, 'motion', instrument, location=location, travel=travel,
+                            slow_z_seconds=slowZ, point=(target.x, target.y, target.z))
+
+    def __repr__(self):
+        return '<polartron.simulation.RecordingContext object at %s>' % hex(id(self))
+
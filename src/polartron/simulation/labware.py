@@ -0,0 +1,147 @@
+from polartron.labware import custom_labware
+from polartron.simulation.types import Point, Location
+
+# Slot origins of the OT-2 deck (mm).
+slotOrigins = {
+    '1': Point(0.0, 0.0, 0.0), '2': Point(132.5, 0.0, 0.0), '3': Point(265.0, 0.0, 0.0),
+    '4': Point(0.0, 90.5, 0.0), '5': Point(132.5, 90.5, 0.0), '6': Point(265.0, 90.5, 0.0),
+    '7': Point(0.0, 181.0, 0.0), '8': Point(132.5, 181.0, 0.0), '9': Point(265.0, 181.0, 0.0),
+    '10': Point(0.0, 271.5, 0.0), '11': Point(132.5, 271.5, 0.0), '12': Point(265.0, 271.5, 0.0)
+}
+
+# Geometry of the Opentrons labware the protocol loads, taken from their definitions. Wells are laid out on
+# a 9 mm grid starting at A1 (x, y); z is the well bottom above the labware base. Custom labware comes
+# from the registry in polartron.labware instead.
+labwareGeometry = {
+    'opentrons_96_tiprack_300ul': {
+        'displayName': 'Opentrons 96 Tip Rack 300 µL', 'rows': 8, 'columns': 12, 'x': 14.38, 'y': 74.24,
+        'z': 5.39, 'depth': 59.3, 'height': 64.49, 'diameter': 5.23, 'volume': 300, 'tipLength': 59.3},
+    'opentrons_96_tiprack_20ul': {
+        'displayName': 'Opentrons 96 Tip Rack 20 µL', 'rows': 8, 'columns': 12, 'x': 14.38, 'y': 74.24,
+        'z': 25.49, 'depth': 39.2, 'height': 64.69, 'diameter': 3.27, 'volume': 20, 'tipLength': 39.2},
+    'agilent_1_reservoir_290ml': {
+        'displayName': 'Agilent 1 Well Reservoir 290 mL', 'rows': 1, 'columns': 1, 'x': 63.88, 'y': 42.785,
+        'z': 4.82, 'depth': 39.22, 'height': 44.04, 'length': 108, 'width': 72, 'volume': 290000},
+    'nest_12_reservoir_15ml': {
+        'displayName': 'NEST 12 Well Reservoir 15 mL', 'rows': 1, 'columns': 12, 'x': 14.38, 'y': 42.78,
+        'z': 4.55, 'depth': 26.85, 'height': 31.4, 'length': 8.2, 'width': 71.2, 'volume': 15000},
+    'biorad_96_wellplate_200ul_pcr': {
+        'displayName': 'Bio-Rad 96 Well Plate 200 µL PCR', 'rows': 8, 'columns': 12, 'x': 14.38, 'y': 74.24,
+        'z': 1.25, 'depth': 14.81, 'height': 16.06, 'diameter': 5.46, 'volume': 200}
+}
+
+rowNames = 'ABCDEFGH'
+wellPitch = 9.0
+
+
+class Well:
+    def __init__(self, name, labware, bottom, depth, max_volume, diameter=None, length=None, width=None):
+        self.well_name = name
+        self.parent = labware
+        self._bottom = bottom
+        self.depth = depth
+        self.max_volume = max_volume
+        self.diameter = diameter
+        self.length = length
+        self.width = width
+        self.has_tip = labware.is_tiprack
+
+    @property
+    def display_name(self):
+        return '%s of %s' % (self.well_name, self.parent.display_name)
+
+    def top(self, z=0.0):
+        return Location(Point(self._bottom.x, self._bottom.y, self._bottom.z + self.depth + z), self)
+
+    def bottom(self, z=0.0):
+        return Location(Point(self._bottom.x, self._bottom.y, self._bottom.z + z), self)
+
+    def center(self):
+        return Location(Point(self._bottom.x, self._bottom.y, self._bottom.z + self.depth / 2.0), self)
+
+    def __repr__(self):
+        return self.display_name
+
+
+def geometry_definition(load_name, geometry):
+    # Expand a geometry entry into the parts of an Opentrons labware definition used here.
+    wells = {}
+    ordering = []
+    for column in range(geometry['columns']):
+        ordering.append([])
+        for row in range(geometry['rows']):
+            name = rowNames[row] + str(column + 1)
+            well = {'x': geometry['x'] + wellPitch * column, 'y': geometry['y'] - wellPitch * row,
+                    'z': geometry['z'], 'depth': geometry['depth'], 'totalLiquidVolume': geometry['volume']}
+            for key, wellKey in (('diameter', 'diameter'), ('length', 'xDimension'), ('width', 'yDimension')):
+                if key in geometry:
+                    well[wellKey] = geometry[key]
+            wells[name] = well
+            ordering[-1].append(name)
+    parameters = {'loadName': load_name, 'isTiprack': 'tipLength' in geometry}
+    if 'tipLength' in geometry:
+        parameters['tipLength'] = geometry['tipLength']
+    return {
+        'metadata': {'displayName': geometry['displayName']},
+        'dimensions': {'zDimension': geometry['height']},
+        'parameters': parameters,
+        'ordering': ordering,
+        'wells': wells
+    }
+
+
+def labware_definition(load_name):
+    if load_name in labwareGeometry:
+        return geometry_definition(load_name, labwareGeometry[load_name])
+    try:
+        return custom_labware(load_name)
+    except KeyError:
+        raise KeyError("No geometry for labware %r" % load_name)
+
+
+class Labware:
+    def __init__(self, load_name, slot, location, definition, label=None):
+        self.load_name = load_name
+        self.slot = slot
+        self.location = location
+        self.name = label or load_name
+        self._definition = definition
+        parameters = definition['parameters']
+        self.is_tiprack = parameters.get('isTiprack', False)
+        self.tip_length = parameters.get('tipLength')
+        self.highest_z = location.z + definition['dimensions']['zDimension']
+        self._wells = {}
+        for column in definition['ordering']:
+            for name in column:
+                well = definition['wells'][name]
+                bottom = location + Point(well['x'], well['y'], well['z'])
+                self._wells[name] = Well(name, self, bottom, well['depth'], well['totalLiquidVolume'],
+                                         well.get('diameter'), well.get('xDimension'), well.get('yDimension'))
+
+    @property
+    def display_name(self):
+        return '%s on %s' % (self._definition['metadata']['displayName'], self.slot)
+
+    def __getitem__(self, name):
+        return self._wells[name]
+
+    def wells(self):
+        return list(self._wells.values())
+
+    def wells_by_name(self):
+        return dict(self._wells)
+
+    def columns(self):
+        return [[self._wells[name] for name in column] for column in self._definition['ordering']]
+
+    def __repr__(self):
+        return self.display_name
+
+
+def load_labware(load_name, slot, offset=Point(0.0, 0.0, 0.0), label=None):
+    return load_labware_from_definition(labware_definition(load_name), slot, offset, label)
+
+
+def load_labware_from_definition(definition, slot, offset=Point(0.0, 0.0, 0.0), label=None):
+    load_name = definition['parameters']['loadName']
+    return Labware(load_name, str(slot), slotOrigins[str(slot)] + offset, definition, label)
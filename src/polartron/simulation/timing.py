@@ -0,0 +1,56 @@
+import math
+
+# Time model of an OT-2 with gen2 pipettes and gen2 modules. Numbers are nominal values from the
+# Opentrons documentation and timings taken on our robots; they are meant for planning, not for
+# replacing a run.
+
+# Gantry (mm/s)
+defaultGantrySpeed = 400.0
+defaultMaxSpeeds = {'X': 600.0, 'Y': 400.0, 'Z': 125.0, 'A': 125.0}
+mountAxes = {'left': 'Z', 'right': 'A'}
+arcClearance = 10.0
+homeHeight = 200.0
+homePoint = (418.0, 353.0)
+
+# Fixed costs (s)
+pickUpTipSeconds = 3.5
+dropTipSeconds = 3.0
+blowOutSeconds = 1.0
+homeSeconds = 12.0
+lidSeconds = 22.0
+magnetSeconds = 3.0
+commandOverheadSeconds = 0.05
+
+# Temperature ramp rates (°C/s)
+ambientTemperature = 25.0
+blockHeatingRate = 4.4
+blockCoolingRate = 2.2
+lidHeatingRate = 0.35
+temperatureModuleHeatingRate = 0.15
+temperatureModuleCoolingRate = 0.04
+
+
+def ramp_seconds(current, target, heating_rate, cooling_rate):
+    if current is None:
+        current = ambientTemperature
+    if target >= current:
+        return (target - current) / heating_rate
+    return (current - target) / cooling_rate
+
+
+def plunger_seconds(volume, flow_rate):
+    if not volume:
+        return 0.0
+    return abs(volume) / flow_rate
+
+
+def segment_seconds(start, end, xy_speed, z_speed):
+    # Straight line move; the gantry speed caps the overall speed and the axis limit caps Z.
+    distance = math.sqrt((end[0] - start[0]) ** 2 + (end[1] - start[1]) ** 2 + (end[2] - start[2]) ** 2)
+    if distance == 0:
+        return 0.0
+    return max(distance / xy_speed, abs(end[2] - start[2]) / z_speed)
+
+
+def segment_length(start, end):
+    return math.sqrt((end[0] - start[0]) ** 2 + (end[1] - start[1]) ** 2 + (end[2] - start[2]) ** 2)
@@ -0,0 +1,44 @@
+import math
+from collections import namedtuple
+
+
+class Point(namedtuple('Point', ['x', 'y', 'z'])):
+    __slots__ = ()
+
+    def __new__(cls, x=0.0, y=0.0, z=0.0):
+        return super().__new__(cls, x, y, z)
+
+    def __add__(self, other):
+        return Point(self.x + other.x, self.y + other.y, self.z + other.z)
+
+    def __sub__(self, other):
+        return Point(self.x - other.x, self.y - other.y, self.z - other.z)
+
+    def __mul__(self, other):
+        return Point(self.x * other, self.y * other, self.z * other)
+
+    __rmul__ = __mul__
+
+    def magnitude_to(self, other):
+        return math.sqrt((self.x - other.x) ** 2 + (self.y - other.y) ** 2 + (self.z - other.z) ** 2)
+
+
+class Location:
+    # A point on the deck and the well or labware it belongs to, as returned by Well.top()/bottom().
+    def __init__(self, point, labware):
+        self.point = point
+        self.labware = labware
+
+    def move(self, point):
+        # Accepts opentrons.types.Point as well as our own.
+        return Location(Point(self.point.x + point.x, self.point.y + point.y, self.point.z + point.z),
+                        self.labware)
+
+    def __iter__(self):
+        return iter((self.point, self.labware))
+
+    def __eq__(self, other):
+        return isinstance(other, Location) and self.point == other.point and self.labware is other.labware
+
+    def __repr__(self):
+        return 'Location(point=%r, labware=%r)' % (self.point, self.labware)
@@ -0,0 +1,131 @@
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from polartron.estimator import format_duration, summarize
+from polartron.parameters import ParameterError, check_constraints, parameterSpecs
+from polartron.simulation import RecordingContext, SimulationError
+
+# What a parameter set is judged on, and whether less or more is better: the simulated run time, the mix
+# repetitions it asks for and the fastest p300 flow rate it uses.
+objectives = [('seconds', 'min'), ('mixes', 'max'), ('peakFlowRate', 'min')]
+
+mixParameters = [name for name in parameterSpecs if name.endswith('Mixes')]
+p300RateParameters = ['p300DefaultRate', 'resuspendAspirateRate', 'resuspendDispenseRate', 'sideAspirateRate',
+                      'sideDispenseRate', 'followAspirateRate']
+
+
+def grid(space):
+    # Every combination of the values listed for each parameter, {name: [values]}.
+    names = sorted(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def evaluate(job):
+    # Simulate one parameter set. Runs in a worker process, so it takes and returns plain data.
+    parameters, sample_count, run_kwargs = job
+    from polartron.protocols.run_polartron import run
+    result = {'parameters': parameters}
+    try:
+        ctx = RecordingContext()
+        run(ctx, sample_count=sample_count, parameters=parameters, **run_kwargs)
+    except (SimulationError, ParameterError) as error:
+        result['error'] = str(error)
+        return result
+    except Exception as error:
+        # Any other failure is a failed point too, rather than the end of the whole sweep.
+        result['error'] = '%s: %s' % (type(error).__name__, error)
+        return result
+    result['seconds'] = summarize(ctx.trace)['seconds']
+    return result
+
+
+def score(result, resolved):
+    result['mixes'] = sum(resolved[name] for name in mixParameters)
+    result['peakFlowRate'] = max(resolved[name] for name in p300RateParameters)
+    return result
+
+
+def dominates(a, b):
+    # a is at least as good as b on every objective and better on one.
+    better = False
+    for name, sense in objectives:
+        difference = a[name] - b[name] if sense == 'min' else b[name] - a[name]
+        if difference > 0:
+            return False
+        better = better or difference < 0
+    return better
+
+
+def pareto_front(results):
+    return [result for result in results if not any(dominates(other, result) for other in results)]
+
+
+# Simulate every parameter set of `space` that keeps within `constraints` ({name: {'min': ..., 'max': ...}})
+# in a pool of worker processes, and rank them by run time. Sets outside the constraints are skipped
+# without being simulated; sets the simulation rejects are reported as failed.
+def sweep(space, constraints=None, sample_count=4, workers=None, **run_kwargs):
+    jobs = []
+    resolved = []
+    skipped = []
+    for parameters in grid(space):
+        try:
+            resolved.append(check_constraints(parameters, constraints or {}))
+        except ParameterError as error:
+            skipped.append({'parameters': parameters, 'error': str(error)})
+            continue
+        jobs.append((parameters, sample_count, run_kwargs))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(evaluate, jobs))
+
+    failed = [result for result in results if 'error' in result]
+    ranked = sorted((score(result, full) for result, full in zip(results, resolved) if 'error' not in result),
+                    key=lambda result: result['seconds'])
+    return {'sampleCount': sample_count, 'constraints': constraints or {}, 'ranked': ranked,
+            'front': pareto_front(ranked), 'skipped': skipped, 'failed': failed}
+
+
+def write_front(path, report):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as output:
+        json.dump({'sampleCount': report['sampleCount'], 'constraints': report['constraints'],
+                   'objectives': objectives, 'front': report['front']}, output, indent=1)
+
+
+def format_report(report, top=10):
+    lines = ['%9s %6s %8s  %s' % ('time', 'mixes', 'peak', 'parameters')]
+    for result in report['ranked'][:top]:
+        lines.append('%9s %6d %8g  %s' % (format_duration(result['seconds']), result['mixes'],
+                                          result['peakFlowRate'], json.dumps(result['parameters'], sort_keys=True)))
+    lines.append('%d simulated, %d on the Pareto front, %d outside the constraints, %d failed' % (
+        len(report['ranked']), len(report['front']), len(report['skipped']), len(report['failed'])))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate POLARtron parameter sets and rank them by run time.')
+    parser.add_argument('space', help='JSON file with the values to try for each parameter')
+    parser.add_argument('--constraints', help='JSON file with {parameter: {"min": ..., "max": ...}} bounds')
+    parser.add_argument('--samples', type=int, default=4, help='number of sample columns')
+    parser.add_argument('--workers', type=int, help='worker processes (default: one per CPU)')
+    parser.add_argument('--out', default='pareto_front.json', help='where to write the Pareto front')
+    parser.add_argument('--top', type=int, default=10, help='parameter sets to list')
+    args = parser.parse_args(argv)
+
+    with open(args.space, encoding='utf-8') as space:
+        space = json.load(space)
+    constraints = None
+    if args.constraints:
+        with open(args.constraints, encoding='utf-8') as bounds:
+            constraints = json.load(bounds)
+    report = sweep(space, constraints, args.samples, args.workers)
+    write_front(args.out, report)
+    print(format_report(report, args.top))
+    print('Pareto front written to %s' % args.out)
+
+
+if __name__ == '__main__':
+    main()
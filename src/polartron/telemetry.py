@@ -0,0 +1,261 @@
+import argparse
+import json
+import queue
+import threading
+import time
+import urllib.request
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from polartron.estimator import format_duration, summarize
+
+defaultPort = 8765
+
+# Seconds between keep-alive comments on an idle event stream.
+keepAliveSeconds = 15.0
+
+# Events a slow client may fall behind by before it is dropped.
+clientQueueSize = 1000
+
+
+# <editor-fold desc="Planned run">
+
+# Start and length of every phase of the planned run, from a simulated trace. A phase that is logged more
+# than once is told apart by how often its message has been seen, so the estimate holds even when the
+# scheduler interleaves phases differently on the robot.
+class PlannedRun:
+    def __init__(self, trace):
+        report = summarize(trace)
+        self.seconds = report['seconds']
+        self.phases = {}
+        seen = {}
+        for phase in report['phases']:
+            occurrence = seen[phase['phase']] = seen.get(phase['phase'], 0) + 1
+            self.phases[(phase['phase'], occurrence)] = (phase['start'], phase['seconds'])
+
+    def remaining(self, phase, occurrence, fraction=0.0):
+        # Seconds left in the plan once `fraction` of the given occurrence of a phase is done.
+        if (phase, occurrence) not in self.phases:
+            return None
+        start, seconds = self.phases[(phase, occurrence)]
+        return max(0.0, self.seconds - start - fraction * seconds)
+
+
+def planned_run(**run_kwargs):
+    # Simulate the run with the parameters it is started with.
+    from polartron.estimator import record_run
+    return PlannedRun(record_run(**run_kwargs).trace)
+
+# </editor-fold>
+
+
+# <editor-fold desc="Protocol side">
+
+# Progress reports from a running protocol. run() calls phase() from update_log and sample() from its
+# sample loops; each call publishes one event with the phase, the sample, module temperatures and the
+# time left according to the plan. publish takes the event dict and must not block, such as
+# TelemetryServer.publish or list.append.
+class Telemetry:
+    def __init__(self, publish, planned=None, clock=None):
+        self.publish = publish
+        self.planned = planned
+        self.clock = clock or time.monotonic
+        self.started = None
+        self.phase_name = None
+        self.occurrences = {}
+        self.samplesDone = 0
+        self.sampleCount = 0
+        self.temperatures = None
+
+    def start(self, clock=None, temperatures=None):
+        # Called by run() once the modules are loaded. temperatures returns the current module readings.
+        self.clock = clock or self.clock
+        self.temperatures = temperatures
+        self.started = self.clock()
+
+    def event(self, kind, **fields):
+        remaining = None
+        if self.planned is not None and self.phase_name is not None:
+            fraction = self.samplesDone / self.sampleCount if self.sampleCount else 0.0
+            remaining = self.planned.remaining(self.phase_name, self.occurrences[self.phase_name], fraction)
+        now = datetime.now()
+        event = {
+            'event': kind,
+            'time': now.isoformat(timespec='seconds'),
+            'elapsed': self.clock() - self.started if self.started is not None else 0.0,
+            'phase': self.phase_name,
+            'samplesDone': self.samplesDone,
+            'samples': self.sampleCount,
+            'remainingSeconds': remaining,
+            'eta': (now + timedelta(seconds=remaining)).isoformat(timespec='seconds') if remaining is not None
+            else None,
+            'temperatures': self.temperatures() if self.temperatures is not None else None
+        }
+        event.update(fields)
+        self.publish(event)
+        return event
+
+    def phase(self, message):
+        self.phase_name = message
+        self.occurrences[message] = self.occurrences.get(message, 0) + 1
+        self.samplesDone = 0
+        self.sampleCount = 0
+        return self.event('phase')
+
+    def sample(self, sample, index, count):
+        # index samples of count are done in this phase and `sample` is next; None once all are done.
+        self.samplesDone = index
+        self.sampleCount = count
+        return self.event('sample', sample=sample)
+
+    def done(self, status='complete'):
+        return self.event('end', status=status, remainingSeconds=0.0 if status == 'complete' else None)
+
+# </editor-fold>
+
+
+# <editor-fold desc="Server">
+
+class EventHandler(BaseHTTPRequestHandler):
+    # GET /events streams every event as Server-Sent Events, starting with the latest one; GET /status
+    # returns the latest event as JSON.
+    def do_GET(self):
+        if self.path == '/status':
+            body = json.dumps(self.server.telemetry.latest, ensure_ascii=False).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == '/events':
+            self.stream()
+        else:
+            self.send_error(404)
+
+    def stream(self):
+        client = self.server.telemetry.subscribe()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        try:
+            while True:
+                try:
+                    event = client.get(timeout=keepAliveSeconds)
+                except queue.Empty:
+                    self.wfile.write(b': keep-alive\n\n')
+                    self.wfile.flush()
+                    continue
+                if event is None:
+                    return
+                data = json.dumps(event, ensure_ascii=False)
+                self.wfile.write(('event: %s\ndata: %s\n\n' % (event['event'], data)).encode('utf-8'))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.server.telemetry.unsubscribe(client)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Local HTTP server pushing protocol events to any number of clients. It runs on its own thread from
+# start() to stop(); publish() only queues an event for each client, so the protocol never waits on the
+# network. A client that falls too far behind is dropped.
+class TelemetryServer:
+    def __init__(self, host='127.0.0.1', port=defaultPort):
+        self.host = host
+        self.port = port
+        self.clients = []
+        self.latest = None
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % (self.host, self.port)
+
+    def start(self):
+        if self.server is None:
+            self.server = ThreadingHTTPServer((self.host, self.port), EventHandler)
+            self.server.daemon_threads = True
+            self.server.telemetry = self
+            self.port = self.server.server_address[1]
+            self.thread = threading.Thread(target=self.server.serve_forever, name='polartron-telemetry',
+                                           daemon=True)
+            self.thread.start()
+        return self
+
+    def subscribe(self):
+        client = queue.Queue(clientQueueSize)
+        with self.lock:
+            if self.latest is not None:
+                client.put(self.latest)
+            self.clients.append(client)
+        return client
+
+    def unsubscribe(self, client):
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+
+    def publish(self, event):
+        with self.lock:
+            self.latest = event
+            for client in list(self.clients):
+                try:
+                    client.put_nowait(event)
+                except queue.Full:
+                    self.clients.remove(client)
+
+    def stop(self):
+        if self.server is not None:
+            with self.lock:
+                for client in self.clients:
+                    try:
+                        client.put_nowait(None)
+                    except queue.Full:
+                        pass
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.server = None
+            self.thread = None
+
+# </editor-fold>
+
+
+def follow(url, timeout=None):
+    # Client side: yields the events of a telemetry stream as they arrive, until the server closes it.
+    with urllib.request.urlopen(url.rstrip('/') + '/events', timeout=timeout) as stream:
+        data = []
+        for line in stream:
+            line = line.decode('utf-8').rstrip('\n')
+            if line.startswith('data: '):
+                data.append(line[len('data: '):])
+            elif not line and data:
+                yield json.loads('\n'.join(data))
+                data = []
+
+
+def format_event(event):
+    remaining = event['remainingSeconds']
+    progress = ' [%d/%d]' % (event['samplesDone'], event['samples']) if event['samples'] else ''
+    return '%s %-6s %s%s, %s left' % (event['time'], event['event'], event['phase'] or '', progress,
+                                     format_duration(remaining) if remaining is not None else '?')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Print the live progress of a POLARtron run.')
+    parser.add_argument('--url', default='http://127.0.0.1:%d' % defaultPort, help='telemetry server')
+    args = parser.parse_args(argv)
+    for event in follow(args.url):
+        print(format_event(event))
+        if event['event'] == 'end':
+            break
+
+
+if __name__ == '__main__':
+    main()
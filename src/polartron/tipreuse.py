@@ -0,0 +1,205 @@
+from polartron.motion import well_of
+
+
+class TipReuseError(RuntimeError):
+    pass
+
+
+class TipState:
+    def __init__(self, name):
+        self.name = name
+        # The sample the tip first took up; it may never go into the wells of another one.
+        self.owner = None
+        # Samples on the tip now. Washing takes them off, and a tip with sample on it stays out of shared wells.
+        self.samples = set()
+        # Reagents the tip has taken up anywhere, those it has taken up in the wells of its sample, and of
+        # those the ones it had on it when it was last picked up. A wash in water is not trusted to take
+        # primers or enzymes off, so they stay.
+        self.reagents = set()
+        self.sampleReagents = set()
+        self.carried = set()
+        # The well whose liquid the tip was last in, and the well it has since dispensed into from above, if any.
+        # Both are None once the tip is washed.
+        self.last = None
+        self.target = None
+        self.pickUps = 0
+        self.washes = 0
+        # Nothing has been done with the tip since it was picked up.
+        self.fresh = False
+
+
+# <editor-fold desc="Tip tracker">
+
+# Which samples every tip and well has been in contact with. A tip takes up whatever the well it aspirates
+# or mixes in holds, and a well takes up whatever the tip that dispenses into it carries, so sample
+# material is followed from the sample wells through every tip that touches it. A tip may only go into the
+# wells of the sample it first took up, and into shared wells only while it is clean; anything else raises
+# TipReuseError before the command runs. A tip that is picked up again is washed before it goes into any other
+# liquid than the one it was last in or dispensed into, and before it goes into a shared well with sample on
+# it, which is what lets a tip serve several roles of its sample. Reagents are followed the same way, and a
+# tip picked up again may only go into the wells of its sample that hold every reagent it took up in them
+# before, so one tip never serves two reactions, such as the two RT-PCR pools, of the same sample.
+class TipTracker:
+    def __init__(self, owners, contents, wash_wells, shared_wash, exempt=(), reagents=None):
+        # owners: {id(well): sample} for the wells of each sample; contents: {id(well): sample} for the wells
+        # that start with sample in them; wash_wells: {sample: tip wash well}; shared_wash: where tips that
+        # have only touched reagents are washed; exempt: wells anything may go into, such as the trash;
+        # reagents: {id(well): reagent} for the wells that start with a reagent in them.
+        self.owners = owners
+        self.contents = {well: {sample} for well, sample in contents.items()}
+        self.reagents = {well: {reagent} for well, reagent in (reagents or {}).items()}
+        self.wash_wells = wash_wells
+        self.shared_wash = shared_wash
+        self.exempt = {id(well) for well in exempt}
+        # Tips are washed in water, which takes up no reagent and passes none on.
+        self.rinses = {id(well) for well in wash_wells.values()} | {id(shared_wash)}
+        self.tips = {}
+
+    def pick_up(self, tip):
+        state = self.tips.setdefault(id(tip), TipState(repr(tip)))
+        state.pickUps += 1
+        state.fresh = True
+        state.carried = set(state.sampleReagents)
+        return state
+
+    def needs_wash(self, state, well):
+        if not state.fresh or state.pickUps < 2 or state.last is None or id(well) in self.exempt:
+            return False
+        return (well is not state.last and well is not state.target) or \
+            (bool(state.samples) and id(well) not in self.owners)
+
+    def wash_well(self, state):
+        # A tip is washed in the wash well of its sample; one that has only been in reagents in the shared one.
+        if state.owner is None:
+            return self.shared_wash
+        return self.wash_wells[state.owner]
+
+    def washed(self, state):
+        state.samples = set()
+        state.last = state.target = None
+        state.washes += 1
+
+    def check(self, state, well):
+        # Raises TipReuseError if the tip would carry sample where it must not go.
+        if id(well) in self.exempt:
+            return
+        owner = self.owners.get(id(well))
+        if owner is None and state.samples:
+            raise TipReuseError("The tip from %s carries %s into shared %r" % (
+                state.name, ', '.join(sorted(state.samples)), well))
+        if owner is not None and state.owner is not None and owner != state.owner:
+            raise TipReuseError("The tip from %s of %s goes into %r of %s" % (state.name, state.owner, well, owner))
+        missing = state.carried - self.reagents.get(id(well), set())
+        if owner is not None and id(well) not in self.rinses and missing:
+            raise TipReuseError("The tip from %s carries %s into %r" % (state.name, ', '.join(sorted(missing)), well))
+
+    def touch(self, state, well, into_tip=True):
+        # Liquid contact between the tip and a well: the well takes up what the tip carries and, if the tip
+        # was in the liquid, the tip what the well holds.
+        state.fresh = False
+        if id(well) in self.exempt:
+            return
+        held = self.contents.setdefault(id(well), set())
+        held |= state.samples
+        reagents = self.reagents.setdefault(id(well), set())
+        if id(well) not in self.rinses:
+            reagents |= state.reagents
+        if not into_tip:
+            state.target = well
+            return
+        state.last = well
+        state.target = None
+        if id(well) not in self.rinses:
+            state.reagents |= reagents
+            if id(well) in self.owners:
+                state.sampleReagents |= reagents
+        if held:
+            state.samples |= held
+            if state.owner is None:
+                state.owner = min(held)
+            if len(state.samples) > 1:
+                raise TipReuseError("The tip from %s has taken up %s in %r" % (
+                    state.name, ', '.join(sorted(state.samples)), well))
+
+    def report(self):
+        return {'tips': len(self.tips), 'pickUps': sum(state.pickUps for state in self.tips.values()),
+                'washes': sum(state.washes for state in self.tips.values())}
+
+# </editor-fold>
+
+
+# <editor-fold desc="Guarded pipettes">
+
+# A pipette whose every liquid command is checked against a TipTracker. A tip is washed by calling
+# wash(pipette, well) when the tracker asks for it, just before the command that needs it. Everything
+# else goes straight through to the pipette. liquids is the LiquidTracker that tells whether a dispense
+# reaches into the liquid of its well.
+class GuardedPipette:
+    def __init__(self, pipette, tracker, ptx, liquids, wash):
+        object.__setattr__(self, '_pipette', pipette)
+        object.__setattr__(self, '_tracker', tracker)
+        object.__setattr__(self, '_ptx', ptx)
+        object.__setattr__(self, '_liquids', liquids)
+        object.__setattr__(self, '_wash', wash)
+        object.__setattr__(self, '_state', None)
+
+    def __getattr__(self, name):
+        return getattr(self._pipette, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._pipette, name, value)
+
+    def _location(self, location):
+        # Location and well of a command; no location means where the pipette already is.
+        if location is None:
+            location = self._ptx.location_cache
+        return location, well_of(location) if hasattr(location, 'point') else location
+
+    def _before(self, well):
+        if self._tracker.needs_wash(self._state, well):
+            self._state.fresh = False
+            self._wash(self, self._tracker.wash_well(self._state))
+            self._tracker.washed(self._state)
+
+    def pick_up_tip(self, location=None):
+        result = self._pipette.pick_up_tip(location)
+        tip = well_of(location) if hasattr(location, 'point') else location
+        object.__setattr__(self, '_state', self._tracker.pick_up(tip))
+        return result
+
+    def return_tip(self, *args, **kwargs):
+        object.__setattr__(self, '_state', None)
+        return self._pipette.return_tip(*args, **kwargs)
+
+    def drop_tip(self, *args, **kwargs):
+        object.__setattr__(self, '_state', None)
+        return self._pipette.drop_tip(*args, **kwargs)
+
+    def aspirate(self, volume=None, location=None, rate=1.0):
+        location, well = self._location(location)
+        self._before(well)
+        self._tracker.check(self._state, well)
+        result = self._pipette.aspirate(volume, location, rate)
+        self._tracker.touch(self._state, well)
+        return result
+
+    def dispense(self, volume=None, location=None, rate=1.0):
+        location, well = self._location(location)
+        self._before(well)
+        self._tracker.check(self._state, well)
+        result = self._pipette.dispense(volume, location, rate)
+        # Dispensed at a height under the liquid it now holds, the tip has been in it.
+        submerged = not hasattr(location, 'point') or \
+            location.point.z - well.bottom().point.z <= self._liquids.height(well)
+        self._tracker.touch(self._state, well, into_tip=submerged)
+        return result
+
+    def mix(self, repetitions=1, volume=None, location=None, rate=1.0):
+        location, well = self._location(location)
+        self._before(well)
+        self._tracker.check(self._state, well)
+        result = self._pipette.mix(repetitions, volume, location, rate)
+        self._tracker.touch(self._state, well)
+        return result
+
+# </editor-fold>
@@ -0,0 +1,250 @@
+import argparse
+import copy
+import math
+
+from polartron.planner import plan_run, p200_rack_names, p200TipNeeds, p20TipNeeds, plateColumns, reusedTipRoles
+from polartron.simulation.labware import load_labware
+
+# Tip rack labware per pipette, as loaded by the protocol.
+tipRackLoadNames = {
+    'p300': 'opentrons_96_tiprack_300ul',
+    'p20': 'opentrons_96_tiprack_20ul'
+}
+
+
+def tip_positions(plan, pipette):
+    # Every tip column a pipette could use: (labware name, well) -> (x, y) of the column's A row. Columns
+    # handed out as shared tips (RT-PCR plating) are left where they are.
+    layout = plan['layout']
+    if pipette == 'p300':
+        racks = list(zip(p200_rack_names(layout), layout['p200TipRacks']))
+    else:
+        racks = [('p20TipRack', layout['p20TipRack'])]
+    sharedColumns = {(name, well[1:]) for name, well in plan['shared'].values()}
+    positions = {}
+    for name, slot in racks:
+        rack = load_labware(tipRackLoadNames[pipette], slot)
+        for column in range(1, plateColumns + 1):
+            if (name, str(column)) in sharedColumns:
+                continue
+            point = rack['A' + str(column)].top().point
+            positions[(name, 'A' + str(column))] = (point.x, point.y)
+    return positions
+
+
+def tip_roles(plan, pipette):
+    # Roles that reuse another role's tip in tip washing runs move with that role.
+    needs = p200TipNeeds if pipette == 'p300' else p20TipNeeds
+    return [(sample, role) for sample in plan['samples'] for role in needs if role in plan['polar'][sample] and
+            not (plan['tipWash'] and role in reusedTipRoles)]
+
+
+def tip_sequence(trace, plan, pipette):
+    # The gantry positions of a recorded run in order. Visits to the planned tips of this pipette are
+    # replaced by their (sample, role) so that the sequence can be re-costed for any tip assignment.
+    positions = tip_positions(plan, pipette)
+    racks = {name: load_labware(tipRackLoadNames[pipette], rack_slot(plan, name)) for name, well in positions}
+    owners = {}
+    for sample, role in tip_roles(plan, pipette):
+        name, well = plan['polar'][sample][role]
+        owners[repr(racks[name][well])] = (sample, role)
+    return [owners.get(record.get('location'), record['point'][:2]) for record in trace if 'point' in record]
+
+
+def rack_slot(plan, name):
+    layout = plan['layout']
+    if name == 'p20TipRack':
+        return layout['p20TipRack']
+    return dict(zip(p200_rack_names(layout), layout['p200TipRacks']))[name]
+
+
+def distance(a, b):
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+
+# Minimum cost assignment of rows to distinct columns (Hungarian algorithm with potentials). cost is a
+# list of rows, each a list of at least as many column costs as there are rows. Returns the column
+# picked for every row.
+def assign(cost):
+    rows = len(cost)
+    columns = len(cost[0]) if rows else 0
+    if rows > columns:
+        raise ValueError("%d tips do not fit in %d tip columns" % (rows, columns))
+    u = [0.0] * (rows + 1)
+    v = [0.0] * (columns + 1)
+    match = [0] * (columns + 1)
+    way = [0] * (columns + 1)
+    for row in range(1, rows + 1):
+        match[0] = row
+        column = 0
+        minimum = [math.inf] * (columns + 1)
+        used = [False] * (columns + 1)
+        while True:
+            used[column] = True
+            matchedRow = match[column]
+            delta = math.inf
+            nextColumn = 0
+            for candidate in range(1, columns + 1):
+                if used[candidate]:
+                    continue
+                reduced = cost[matchedRow - 1][candidate - 1] - u[matchedRow] - v[candidate]
+                if reduced < minimum[candidate]:
+                    minimum[candidate] = reduced
+                    way[candidate] = column
+                if minimum[candidate] < delta:
+                    delta = minimum[candidate]
+                    nextColumn = candidate
+            for candidate in range(columns + 1):
+                if used[candidate]:
+                    u[match[candidate]] += delta
+                    v[candidate] -= delta
+                else:
+                    minimum[candidate] -= delta
+            column = nextColumn
+            if match[column] == 0:
+                break
+        while column:
+            previous = way[column]
+            match[column] = match[previous]
+            column = previous
+    assignment = [None] * rows
+    for column in range(1, columns + 1):
+        if match[column]:
+            assignment[match[column] - 1] = column - 1
+    return assignment
+
+
+class TipTravel:
+    # Gantry travel (x/y only, mm) of a tip sequence under an assignment of tips to columns. Keeps the
+    # sequence indices of every tip so that moving one or two tips is re-costed from their neighbours only.
+    def __init__(self, sequence, assignment):
+        self.sequence = sequence
+        self.assignment = dict(assignment)
+        self.visits = {}
+        for index, entry in enumerate(sequence):
+            if isinstance(entry[0], str):
+                self.visits.setdefault(entry, []).append(index)
+
+    def point(self, index, assignment=None):
+        entry = self.sequence[index]
+        if isinstance(entry[0], str):
+            return (assignment or self.assignment)[entry]
+        return entry
+
+    def total(self):
+        return sum(distance(self.point(index), self.point(index + 1)) for index in range(len(self.sequence) - 1))
+
+    def change(self, moves):
+        # Travel saved (negative) or added by giving each tip in moves its new position.
+        edges = set()
+        for tip in moves:
+            for index in self.visits.get(tip, ()):
+                edges.update(edge for edge in (index - 1, index) if 0 <= edge < len(self.sequence) - 1)
+        moved = dict(self.assignment)
+        moved.update(moves)
+        return sum(distance(self.point(edge, moved), self.point(edge + 1, moved)) -
+                   distance(self.point(edge), self.point(edge + 1)) for edge in edges)
+
+    def improve(self, positions):
+        # Swap pairs of tips, or move a tip to a free column, while that shortens the travel.
+        improved = True
+        while improved:
+            improved = False
+            tips = sorted(self.assignment)
+            for first in tips:
+                taken = {position: tip for tip, position in self.assignment.items()}
+                for position in positions:
+                    other = taken.get(position)
+                    if other == first:
+                        continue
+                    moves = {first: position}
+                    if other is not None:
+                        moves[other] = self.assignment[first]
+                    if self.change(moves) < -1e-6:
+                        self.assignment.update(moves)
+                        taken = {position: tip for tip, position in self.assignment.items()}
+                        improved = True
+        return self.assignment
+
+
+def record_plan(plan, **run_kwargs):
+    # Imported here so that the planner side of this module loads without the protocol.
+    from polartron.estimator import record_run
+    return record_run(plan['sampleCount'], plan=plan, **run_kwargs).trace
+
+
+def travel(trace):
+    return sum(record.get('travel', 0.0) for record in trace)
+
+
+def seconds(trace):
+    return sum(record['seconds'] for record in trace)
+
+
+# Reassign the tip column of every (sample, role) so that the gantry travels as little as possible for the
+# order of operations the protocol actually runs. The run is recorded once with the given plan and the
+# sequence of gantry positions is re-costed for other assignments: a Hungarian assignment that places each
+# tip near the deck locations visited around it, and the current plan, are both improved by swapping tips
+# and the shorter result is kept. Returns the new plan and a report measured by recording the run again.
+def optimize_tips(plan, pipettes=('p300', 'p20'), **run_kwargs):
+    trace = record_plan(plan, **run_kwargs)
+    optimized = copy.deepcopy(plan)
+    for pipette in pipettes:
+        sequence = tip_sequence(trace, plan, pipette)
+        columns = tip_positions(plan, pipette)
+        positions = sorted(columns.values())
+        names = {position: column for column, position in columns.items()}
+        roles = tip_roles(plan, pipette)
+
+        current = {role: columns[plan['polar'][role[0]][role[1]]] for role in roles}
+        anchored = TipTravel(sequence, current)
+        cost = [[sum(distance(anchored.point(edge), position) for index in anchored.visits.get(role, ())
+                     for edge in (index - 1, index + 1)
+                     if 0 <= edge < len(sequence) and not isinstance(sequence[edge][0], str))
+                 for position in positions] for role in roles]
+        nearest = {role: positions[choice] for role, choice in zip(roles, assign(cost))}
+
+        candidates = [TipTravel(sequence, start) for start in (current, nearest)]
+        for candidate in candidates:
+            candidate.improve(positions)
+        best = min(candidates, key=lambda candidate: candidate.total())
+        for (sample, role), position in best.assignment.items():
+            optimized['polar'][sample][role] = names[position]
+    if plan['tipWash']:
+        for sample, needs in optimized['polar'].items():
+            for role, reusedRole in reusedTipRoles.items():
+                if role in needs:
+                    needs[role] = needs[reusedRole]
+
+    optimizedTrace = record_plan(optimized, **run_kwargs)
+    report = {
+        'travelBefore': travel(trace),
+        'travelAfter': travel(optimizedTrace),
+        'secondsBefore': seconds(trace),
+        'secondsAfter': seconds(optimizedTrace)
+    }
+    return optimized, report
+
+
+def format_report(report):
+    return '\n'.join([
+        'gantry travel: %.1f m -> %.1f m (%.1f%%)' % (
+            report['travelBefore'] / 1000.0, report['travelAfter'] / 1000.0,
+            100.0 * (report['travelAfter'] - report['travelBefore']) / report['travelBefore']),
+        'estimated run time: %.0f s -> %.0f s' % (report['secondsBefore'], report['secondsAfter'])
+    ])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Assign tip columns to minimise gantry travel.')
+    parser.add_argument('--samples', type=int, default=4, help='number of sample columns')
+    args = parser.parse_args(argv)
+    plan, report = optimize_tips(plan_run(args.samples))
+    print(format_report(report))
+    for sample, role in tip_roles(plan, 'p300') + tip_roles(plan, 'p20'):
+        name, well = plan['polar'][sample][role]
+        print('  %-10s %-18s %-14s %s' % (sample, role, name, well))
+
+
+if __name__ == '__main__':
+    main()
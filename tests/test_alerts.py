@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+from polartron.alerts import AlertWorker, FakePlayer
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out")
+        time.sleep(0.005)
+
+
+def test_alert_waiting_to_be_played_is_coalesced():
+    player = FakePlayer()
+    worker = AlertWorker(player)
+    assert worker.alert('alert')
+    assert not worker.alert('alert')
+    assert worker.alert('stop')
+    worker.start()
+    worker.join()
+    worker.stop()
+    assert player.played == ['alert', 'stop']
+
+
+def test_alert_is_queued_again_once_played():
+    player = FakePlayer()
+    worker = AlertWorker(player).start()
+    worker.alert('alert')
+    worker.join()
+    assert worker.alert('alert')
+    worker.join()
+    worker.stop()
+    assert player.played == ['alert', 'alert']
+
+
+def test_unknown_sound_is_refused():
+    with pytest.raises(KeyError):
+        AlertWorker(FakePlayer()).alert('siren')
+
+
+def test_repeating_alert_plays_until_acknowledged():
+    player = FakePlayer()
+    worker = AlertWorker(player, repeat_interval=0.01).start()
+    worker.alert('stop', repeat=True)
+    wait_until(lambda: len(player.played) >= 3)
+    worker.acknowledge()
+    worker.join()
+    played = len(player.played)
+    time.sleep(0.1)
+    worker.stop()
+    assert len(player.played) == played
+    assert set(player.played) == {'stop'}
+
+
+def test_failing_player_never_stops_the_worker():
+    calls = []
+
+    def player(sound):
+        calls.append(sound)
+        raise OSError("no speaker")
+
+    worker = AlertWorker(player).start()
+    worker.alert('alert')
+    worker.join()
+    worker.alert('stop')
+    worker.join()
+    worker.stop()
+    assert calls == ['alert', 'stop']
+    assert len(worker.errors) == 2
+
+
+def test_stop_ends_the_worker_thread():
+    worker = AlertWorker(FakePlayer()).start()
+    thread = worker.thread
+    worker.stop()
+    assert not thread.is_alive()
+    assert worker.thread is None
+    assert 'polartron-alerts' not in [other.name for other in threading.enumerate()]
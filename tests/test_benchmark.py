@@ -0,0 +1,36 @@
+import copy
+
+from polartron.benchmark import allowanceSeconds, compare, defaultThreshold, phaseMetrics
+
+
+def result(phases):
+    # A benchmark result with the given simulated seconds per phase.
+    rows = [dict({metric: 0 for metric in phaseMetrics}, phase=name, occurrence=1, seconds=seconds, commands=1)
+            for name, seconds in phases.items()]
+    total = {metric: sum(row[metric] for row in rows) for metric in phaseMetrics}
+    total.update(wallSeconds=1.0, peakMemory=1, phases=rows)
+    return total
+
+
+def test_phases_that_grow_past_threshold_and_allowance_regress():
+    baseline = {'run': result({'long': 1000.0, 'short': 10.0})}
+    grown = 1000.0 * (1 + defaultThreshold) + 1
+    comparison = compare({'run': result({'long': grown, 'short': 10.0 + allowanceSeconds + 0.5})}, baseline)
+    assert [(name, phase) for name, phase, before, after in comparison['regressions']] == \
+        [('run', 'total'), ('run', 'long (#1)'), ('run', 'short (#1)')]
+
+
+def test_small_changes_do_not_regress():
+    baseline = {'run': result({'long': 1000.0, 'short': 10.0})}
+    # Within the threshold for the long phase and within the allowance for the short one.
+    results = {'run': result({'long': 1000.0 * (1 + defaultThreshold) - 1, 'short': 10.0 + allowanceSeconds})}
+    assert compare(results, baseline)['regressions'] == []
+    assert compare(copy.deepcopy(baseline), baseline)['regressions'] == []
+
+
+def test_added_and_removed_phases_and_scenarios_are_listed():
+    baseline = {'run': result({'a': 5.0, 'b': 5.0})}
+    comparison = compare({'run': result({'a': 5.0, 'c': 5.0}), 'new': result({'a': 1.0})}, baseline)
+    assert comparison['added'] == [('run', ('c', 1)), ('new', None)]
+    assert comparison['removed'] == [('run', ('b', 1))]
+    assert comparison['regressions'] == []
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from polartron.checkpoint import CheckpointError, load_checkpoint, resume
+from polartron.protocols.run_polartron import run
+from polartron.simulation import RecordingContext
+
+
+class Interrupted(Exception):
+    pass
+
+
+class InterruptedContext(RecordingContext):
+    # Stops the run when it reaches the given phase, as a power cut would.
+    def __init__(self, phase):
+        super().__init__()
+        self.stopPhase = phase
+
+    def comment(self, msg):
+        if msg == self.stopPhase:
+            raise Interrupted(msg)
+        return super().comment(msg)
+
+
+def commands(ctx):
+    return [record['command'] for record in ctx.trace if record['category'] != 'comment']
+
+
+def interrupted_run(path, phase="ʕ·ᴥ·ʔ : Pelleting MagBeads."):
+    with pytest.raises(Interrupted):
+        run(InterruptedContext(phase), sample_count=2, checkpoint=str(path))
+    return load_checkpoint(str(path))
+
+
+def test_checkpoint_is_off_unless_asked_for():
+    ctx = RecordingContext()
+    run(ctx, sample_count=1, checkpoint=False)
+    run(ctx, sample_count=1, checkpoint=None)
+
+
+def test_checkpoint_is_saved_at_every_phase(tmp_path):
+    state = interrupted_run(tmp_path / 'checkpoint.json')
+    assert state['phase'] == "ʕ·ᴥ·ʔ : Pelleting MagBeads."
+    assert {'setUp', 'loadSamples', 'proteinaseK'} <= set(state['completed'])
+    assert 'binding' not in state['completed']
+    assert state['tipsUsed']
+    assert state['modules']
+
+
+def test_resume_skips_what_was_done(tmp_path):
+    path = tmp_path / 'checkpoint.json'
+    interrupted_run(path)
+    full = RecordingContext()
+    run(full, sample_count=2)
+    resumed = RecordingContext()
+    resume(resumed, str(path))
+
+    assert 0 < len(commands(resumed)) < len(commands(full))
+    # The run picks up again from the start of the phase it was stopped in and ends like a full run.
+    assert commands(resumed)[-20:] == commands(full)[-20:]
+    state = load_checkpoint(str(path))
+    assert {'binding', 'elution', 'rtPcr'} <= set(state['completed'])
+
+
+def test_resume_refuses_another_plan(tmp_path):
+    path = tmp_path / 'checkpoint.json'
+    interrupted_run(path)
+    with pytest.raises(CheckpointError):
+        resume(RecordingContext(), str(path), sample_count=1, plan=None)
+
+
+def test_unknown_checkpoint_format_is_refused(tmp_path):
+    path = tmp_path / 'checkpoint.json'
+    path.write_text(json.dumps({'format': 0}))
+    with pytest.raises(CheckpointError):
+        load_checkpoint(str(path))
@@ -0,0 +1,29 @@
+import pytest
+
+from polartron.dispatch import combine_logs, dispatch_plan, read_manifest, run_plan, shard
+from polartron.simulation import RecordingContext
+
+
+def test_manifest_skips_comments_and_header(tmp_path):
+    path = tmp_path / 'manifest.csv'
+    path.write_text('sample,plate\n# control\nS1,p1\n\nS2,p1\n')
+    assert read_manifest(str(path)) == ['S1', 'S2']
+    path.write_text('S1\nS1\n')
+    with pytest.raises(ValueError):
+        read_manifest(str(path))
+
+
+def test_runs_are_balanced_over_robots():
+    samples = ['S%d' % number for number in range(10)]
+    shards = shard(samples, ['a', 'b'], capacity=3, estimate=lambda count: count * 100.0)
+    assert [len(run) for runs in shards.values() for run in runs] == [3, 2, 3, 2]
+    assert sorted(sample for runs in shards.values() for run in runs for sample in run) == sorted(samples)
+
+
+def test_dispatched_runs_complete(tmp_path):
+    plan = dispatch_plan(['S1', 'S2', 'S3'], ['a', 'b'], 'test')
+    assert sum(params['sample_count'] for runs in plan.values() for params in runs) == 3
+    logs = run_plan(plan, {'a': RecordingContext, 'b': RecordingContext}, str(tmp_path))
+    report = combine_logs(logs, plan)
+    assert report['complete']
+    assert report['samples'] == 3
@@ -0,0 +1,30 @@
+import pytest
+
+from polartron.estimator import categories, estimate, format_duration, summarize
+
+
+def test_background_commands_take_no_time():
+    trace = [
+        {'phase': 'a', 'start': 0.0, 'seconds': 10.0, 'category': 'liquid'},
+        {'phase': 'a', 'start': 10.0, 'seconds': 600.0, 'category': 'thermocycler', 'background': True},
+        {'phase': 'a', 'start': 10.0, 'seconds': 5.0, 'category': 'motion', 'travel': 100.0},
+        {'phase': 'b', 'start': 15.0, 'seconds': 0.0, 'category': 'comment'}
+    ]
+    report = summarize(trace)
+    assert report['seconds'] == 15.0
+    assert report['categories']['thermocycler'] == 0.0
+    assert report['commands'] == 3
+    assert report['travel'] == 100.0
+    assert [phase['phase'] for phase in report['phases']] == ['a', 'b']
+
+
+def test_categories_add_up_to_the_run_time():
+    report = estimate(2)
+    assert sum(report['categories'][category] for category in categories) == pytest.approx(report['seconds'])
+    for phase in report['phases']:
+        assert sum(phase[category] for category in categories) == pytest.approx(phase['seconds'])
+
+
+def test_format_duration():
+    assert format_duration(3723.4) == '1:02:03'
+    assert format_duration(59.6) == '0:01:00'
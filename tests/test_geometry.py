@@ -0,0 +1,25 @@
+from polartron.geometry import GeometryIndex
+from polartron.simulation import RecordingContext
+
+
+def test_columns_and_bead_sides_follow_the_labware_ordering():
+    plate = RecordingContext().load_labware('biorad_96_wellplate_200ul_pcr', '1')
+    geometry = GeometryIndex()
+    assert geometry[plate].column(plate['H1']) == 1
+    assert geometry[plate].column(plate['A12']) == 12
+    assert geometry.bead_side(plate['C3']) == 1
+    assert geometry.bead_side(plate['C4']) == -1
+    assert geometry[plate] is geometry[plate]
+
+
+def test_offset_locations_match_the_well_and_are_built_once():
+    plate = RecordingContext().load_labware('biorad_96_wellplate_200ul_pcr', '1')
+    well = plate['B2']
+    geometry = GeometryIndex()
+    location = geometry.bottom(well, 0.5, x=-3)
+    expected = well.bottom(0.5).point
+    assert (location.point.x, location.point.y, location.point.z) == (expected.x - 3, expected.y, expected.z)
+    assert location.labware is well
+    assert geometry.bottom(well, 0.5, x=-3) is location
+    assert geometry.top(well, -2).point.z == well.top(-2).point.z
+    assert geometry.top(well, -2) is not geometry.bottom(well, -2)
@@ -0,0 +1,37 @@
+import copy
+import json
+
+import pytest
+
+from polartron.labware import LabwareDefinitionError, LabwareRegistry, read_resource, validate_definition
+
+loadName = 'eppendorf_96_well_lobind_plate_500ul'
+
+
+def test_bundled_definitions_validate():
+    registry = LabwareRegistry()
+    assert loadName in registry
+    assert registry.definition(loadName)['parameters']['loadName'] == loadName
+    with pytest.raises(KeyError):
+        registry.definition('no_such_labware')
+
+
+def test_definition_is_read_once_per_registry():
+    registry = LabwareRegistry()
+    definition = registry.definition(loadName)
+    assert registry.definition(loadName) is definition
+    assert LabwareRegistry().definition(loadName) == definition
+
+
+@pytest.mark.parametrize('breakage', [
+    lambda definition: definition.pop('wells'),
+    lambda definition: definition.update(schemaVersion=1),
+    lambda definition: definition['parameters'].update(loadName='other'),
+    lambda definition: definition['ordering'][0].pop(),
+    lambda definition: definition['wells']['A1'].pop('diameter')
+])
+def test_broken_definitions_are_refused(breakage):
+    definition = copy.deepcopy(json.loads(read_resource(loadName + '.json')))
+    breakage(definition)
+    with pytest.raises(LabwareDefinitionError):
+        validate_definition(definition, loadName)
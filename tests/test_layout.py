@@ -0,0 +1,37 @@
+import pytest
+
+from polartron.layout import (SlotMoves, candidate_slots, check_layout, deckSlots, item_slot, movable_items,
+                              thermocyclerSlots)
+from polartron.planner import defaultLayout
+
+
+def test_default_layout_is_valid():
+    check_layout(defaultLayout)
+
+
+@pytest.mark.parametrize('changes', [
+    {'trash': '12'},
+    {'magneticModule': '2'},
+    {'trash': defaultLayout['reagentResevoir']}
+])
+def test_invalid_layouts_are_refused(changes):
+    with pytest.raises(ValueError):
+        check_layout(dict(defaultLayout, **changes))
+
+
+def test_nothing_is_moved_under_the_thermocycler():
+    pinned = [item for item in movable_items(defaultLayout)
+              if item_slot(defaultLayout, item) in thermocyclerSlots]
+    assert pinned == []
+    for slots in candidate_slots(defaultLayout):
+        assert set(slots.values()) <= set(deckSlots)
+        assert len(set(slots.values())) == len(slots)
+
+
+def test_moving_labware_recosts_the_travel():
+    trace = [
+        {'command': 'move_to', 'location': 'A1 of plate on 1', 'point': [10.0, 10.0, 0.0]},
+        {'command': 'move_to', 'location': 'A1 of plate on 3', 'point': [275.0, 10.0, 0.0]},
+    ]
+    moves = SlotMoves(trace)
+    assert moves.travel({'3': '2'}) < moves.travel({})
@@ -0,0 +1,61 @@
+import pytest
+
+from polartron.labware import custom_labware
+from polartron.liquids import LiquidTracker, TrackedPipette, cross_section
+from polartron.simulation import RecordingContext
+
+
+@pytest.fixture
+def deck():
+    ctx = RecordingContext()
+    reservoir = ctx.load_labware('nest_12_reservoir_15ml', '2')
+    plate = ctx.load_labware_from_definition(custom_labware('eppendorf_96_well_lobind_plate_500ul'), '1')
+    return ctx, reservoir, plate, LiquidTracker([reservoir, plate])
+
+
+def test_multichannel_draws_per_well_from_plates_and_all_channels_from_troughs(deck):
+    ctx, reservoir, plate, liquids = deck
+    liquids.load(reservoir['A1'], 10000)
+    liquids.load(plate['A1'], 300)
+    liquids.remove(reservoir['A1'], 100, channels=8)
+    liquids.remove(plate['A1'], 100, channels=8)
+    assert liquids.volume(reservoir['A1']) == 9200
+    assert liquids.volume(plate['A1']) == 200
+    liquids.remove(plate['A1'], 500, channels=8)
+    assert liquids.volume(plate['A1']) == 0
+
+
+def test_height_follows_the_volume(deck):
+    ctx, reservoir, plate, liquids = deck
+    well = plate['A1']
+    liquids.load(well, 100)
+    assert liquids.height(well) == pytest.approx(100 / cross_section(well))
+    liquids.load(well, 10 * well.max_volume)
+    assert liquids.height(well) == well.depth
+
+
+def test_following_stays_under_the_meniscus_and_off_the_bottom(deck):
+    ctx, reservoir, plate, liquids = deck
+    well = plate['A1']
+    liquids.load(well, 300)
+    segments = liquids.follow(well, 280, channels=8)
+    assert sum(volume for volume, height in segments) == pytest.approx(280)
+    heights = [height for volume, height in segments]
+    assert heights == sorted(heights, reverse=True)
+    assert min(heights) >= 1.0
+    left = 300
+    for volume, height in segments:
+        left -= volume
+        assert height <= max(1.0, left / cross_section(well) - 2.0) + 1e-9
+
+
+def test_tracked_pipette_moves_liquid(deck):
+    ctx, reservoir, plate, liquids = deck
+    rack = ctx.load_labware('opentrons_96_tiprack_300ul', '3')
+    pipette = TrackedPipette(ctx.load_instrument('p300_multi_gen2', 'left'), liquids, ctx)
+    liquids.load(reservoir['A1'], 10000)
+    pipette.pick_up_tip(rack['A1'])
+    pipette.aspirate(50, reservoir['A1'].bottom(1))
+    pipette.dispense(50, plate['A1'].bottom(1))
+    assert liquids.volume(reservoir['A1']) == 9600
+    assert liquids.volume(plate['A1']) == 50
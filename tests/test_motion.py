@@ -0,0 +1,61 @@
+import pytest
+
+from polartron.motion import Motion
+from polartron.simulation import RecordingContext
+
+
+class Pipette:
+    # Records every move with the speed limits in force.
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.default_speed = None
+        self.moves = []
+
+    def move_to(self, location):
+        self.moves.append((location.point.z, self.ctx.max_speeds.get('Z'), self.default_speed))
+        self.ctx.location_cache = location
+
+
+class Context:
+    def __init__(self):
+        self.max_speeds = {}
+        self.location_cache = None
+
+
+@pytest.fixture
+def well():
+    return RecordingContext().load_labware('nest_12_reservoir_15ml', '2')['A1']
+
+
+def test_speeds_are_only_sent_when_they_change():
+    ctx = Context()
+    pipette = Pipette(ctx)
+    motion = Motion(ctx)
+    motion.use(pipette, 'in-liquid')
+    motion.use(pipette, 'in-liquid')
+    assert motion.changes == 2
+    assert (ctx.max_speeds['Z'], ctx.max_speeds['A'], pipette.default_speed) == (10, 10, 20)
+    with motion.profile(pipette, 'near-meniscus'):
+        assert (ctx.max_speeds['Z'], pipette.default_speed) == (None, 20)
+    assert pipette.default_speed is None
+    assert motion.changes == 4
+
+
+def test_exit_only_slows_the_part_of_the_move_in_the_well(well):
+    ctx = Context()
+    pipette = Pipette(ctx)
+    motion = Motion(ctx)
+    ctx.location_cache = well.bottom(1)
+    motion.exit(pipette, well, height=5, liquid_height=10)
+    bottom, top = well.bottom().point.z, well.top().point.z
+    assert pipette.moves == [(bottom + 12, 10, 20), (top, None, 20), (top + 5, None, None)]
+    assert pipette.default_speed is None
+
+
+def test_exit_from_above_the_well_is_one_move(well):
+    ctx = Context()
+    pipette = Pipette(ctx)
+    motion = Motion(ctx)
+    ctx.location_cache = well.top(1)
+    motion.exit(pipette, well)
+    assert pipette.moves == [(well.top().point.z, None, None)]
@@ -0,0 +1,27 @@
+import pytest
+
+from polartron.optimize import OptimizationError, check_equivalent, optimize_plan
+from polartron.plancache import compile_plan, replay
+from polartron.simulation import RecordingContext
+
+pipette = 'instrument:3'
+here = {'location': ['labware:0', 'A1', [0, 0, 1]]}
+
+
+def liquid(name, volume, location=here):
+    return {'call': pipette, 'name': name, 'args': [volume, location], 'kwargs': {}}
+
+
+def test_changed_liquid_handling_is_caught():
+    calls = [liquid('aspirate', 50), liquid('dispense', 50)]
+    with pytest.raises(OptimizationError):
+        check_equivalent(calls, [liquid('aspirate', 50), liquid('dispense', 40)])
+
+
+def test_optimized_plan_replays_with_fewer_commands():
+    plan = compile_plan(sample_count=1)
+    optimized, report = optimize_plan(plan)
+    assert report['after']['total'] < report['before']['total']
+    before = replay(RecordingContext(), plan)
+    after = replay(RecordingContext(), optimized)
+    assert len(after.trace) < len(before.trace)
@@ -0,0 +1,57 @@
+import pytest
+
+from polartron.parameters import (ParameterError, check_constraints, defaultParameters, parameterSpecs,
+                                  resolve_parameters)
+
+
+def test_defaults_are_within_their_ranges():
+    for name, (default, lowest, highest, kind) in parameterSpecs.items():
+        assert lowest <= default <= highest, name
+    assert resolve_parameters() == defaultParameters
+
+
+def test_overrides_keep_the_other_defaults():
+    resolved = resolve_parameters({'washMixes': 12, 'dryMinutes': 2.5})
+    assert resolved['washMixes'] == 12
+    assert resolved['dryMinutes'] == 2.5
+    assert resolved['elutionMixes'] == defaultParameters['elutionMixes']
+
+
+def test_whole_numbers_are_converted_to_int():
+    resolved = resolve_parameters({'washMixes': 12.0})
+    assert resolved['washMixes'] == 12
+    assert isinstance(resolved['washMixes'], int)
+
+
+@pytest.mark.parametrize('parameters', [
+    {'noSuchParameter': 1},
+    {'washMixes': 0},
+    {'washMixes': 101},
+    {'washMixes': 2.5},
+    {'washMixes': '20'},
+    {'dryMinutes': True},
+    {'p300DefaultRate': 401}
+])
+def test_invalid_parameters_are_refused(parameters):
+    with pytest.raises(ParameterError):
+        resolve_parameters(parameters)
+
+
+def test_constraints_narrow_the_ranges():
+    constraints = {'washMixes': {'min': 10, 'max': 30}}
+    assert check_constraints({'washMixes': 10}, constraints)['washMixes'] == 10
+    with pytest.raises(ParameterError):
+        check_constraints({'washMixes': 40}, constraints)
+    with pytest.raises(ParameterError):
+        check_constraints({}, {'washMixes': {'min': 25}})
+    with pytest.raises(ParameterError):
+        check_constraints({}, {'noSuchParameter': {'max': 1}})
+
+
+def test_run_refuses_invalid_parameters_before_anything_moves():
+    from polartron.protocols.run_polartron import run
+    from polartron.simulation import RecordingContext
+    ctx = RecordingContext()
+    with pytest.raises(ParameterError):
+        run(ctx, parameters={'washMixes': 0})
+    assert ctx.trace == []
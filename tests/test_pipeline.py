@@ -0,0 +1,11 @@
+import pytest
+
+from polartron.pipeline import split_batches
+
+
+def test_split_batches():
+    assert split_batches([1, 2, 3, 4, 5], 2) == [[1, 2, 3], [4, 5]]
+    assert split_batches([1, 2], 1) == [[1, 2]]
+    for batches in (0, 3, 1.5):
+        with pytest.raises(ValueError):
+            split_batches([1, 2], batches)
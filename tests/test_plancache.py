@@ -0,0 +1,82 @@
+import os
+
+from polartron.estimator import summarize
+from polartron.plancache import PlanCache, cached_plan, compile_plan, plan_key, planFormat, protocolSources, replay
+from polartron.protocols.run_polartron import run
+from polartron.simulation import RecordingContext
+
+
+def commands(ctx):
+    return [(record['command'], record.get('location')) for record in ctx.trace if record['category'] != 'comment']
+
+
+def test_key_depends_on_the_parameters():
+    assert plan_key({'sample_count': 1}) == plan_key({'sample_count': 1})
+    assert plan_key({'sample_count': 1}) != plan_key({'sample_count': 2})
+
+
+def test_every_protocol_source_is_hashed():
+    root = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src', 'polartron')
+    for source in protocolSources:
+        assert os.path.exists(os.path.join(root, source)), source
+    assert 'simulation/timing.py' in protocolSources
+
+
+def test_replay_issues_the_compiled_commands():
+    plan = compile_plan(sample_count=1)
+    first = replay(RecordingContext(), plan)
+    second = replay(RecordingContext(), plan)
+    assert commands(first) == commands(second)
+    assert any(command == 'execute_profile' for command, location in commands(first))
+    # A plan holds no simulation-only state, and replayed on the simulation it takes as long as the run.
+    assert not any(call.get('set') == 'ctx' and call['name'] == 'background' for call in plan['calls'])
+    ctx = RecordingContext()
+    run(ctx, sample_count=1)
+    assert summarize(first.trace)['seconds'] == summarize(ctx.trace)['seconds']
+
+
+class Robot:
+    # Keeps time like the robot: pipetting takes as long as it takes, and delays are waited out.
+    def __init__(self):
+        self.clock = 0.0
+        self.delays = []
+
+    def now(self):
+        return self.clock
+
+    def work(self, seconds):
+        self.clock += seconds
+
+    def delay(self, seconds=0):
+        self.delays.append(seconds)
+        self.clock += seconds
+
+
+def test_incubations_are_waited_out_on_the_replaying_clock():
+    plan = compile_plan(sample_count=1)
+    incubations = [call['incubate'] for call in plan['calls'] if 'incubate' in call]
+    assert incubations and sorted(incubations) == sorted(call['await'] for call in plan['calls'] if 'await' in call)
+
+    def replayed(workSeconds):
+        robot = Robot()
+        replay(robot, {'format': planFormat, 'calls': [
+            {'incubate': 'proteinaseK', 'seconds': 600},
+            {'call': 'ctx', 'name': 'work', 'args': [workSeconds], 'kwargs': {}},
+            {'await': 'proteinaseK'}]})
+        return robot.delays
+
+    # The robot waits for what is left of the incubation after its own work, however long that took.
+    assert replayed(100) == [500]
+    assert replayed(700) == []
+
+
+def test_cache_hits_and_evicts(tmp_path):
+    cache = PlanCache(str(tmp_path), max_entries=1)
+    plan, hit = cached_plan(cache, sample_count=1)
+    assert not hit
+    again, hit = cached_plan(cache, sample_count=1)
+    assert hit
+    assert again == plan
+    cache.put('other', {'calls': []})
+    assert cache.get(plan['key']) is None
+    assert len(cache.entries()) == 1
@@ -0,0 +1,52 @@
+import pytest
+
+from polartron.planner import CapacityError, capacity_report, loading_sheet, max_samples, plan_run
+
+
+def test_deck_capacity():
+    assert max_samples() == 4
+    assert max_samples(library_prep=True) == 3
+    assert max_samples(tip_wash=True) == 5
+    assert max_samples(library_prep=True, tip_wash=True) == 3
+
+
+def test_run_over_capacity_names_the_limit():
+    with pytest.raises(CapacityError) as error:
+        plan_run(4, library_prep=True)
+    assert error.value.limit == 3
+    assert 'at most 3' in str(error.value)
+    assert 'one plate per module' in str(error.value)
+    assert 'over capacity' in error.value.report
+
+
+def test_every_sample_gets_its_own_tips_and_wells():
+    plan = plan_run(4)
+    used = [tuple(place) for sample in plan['samples'] for place in plan['polar'][sample].values()]
+    assert len(used) == len(set(used))
+    assert plan['samples'] == ['Sample #1', 'Sample #2', 'Sample #3', 'Sample #4']
+
+
+def test_tip_washing_reuses_tips_within_a_sample_only():
+    plan = plan_run(2, tip_wash=True)
+    for sample in plan['samples']:
+        tips = plan['polar'][sample]
+        assert tips['viralBufferTip2'] == tips['viralBufferTip1']
+        assert tips['ethanolTip3'] == tips['ethanolTip2']
+        assert tips['rtPcrPool2Tip'] != tips['rtPcrPool1Tip']
+    first, second = (plan['polar'][sample]['viralBufferTip1'] for sample in plan['samples'])
+    assert first != second
+
+
+@pytest.mark.parametrize('sample_count, names', [(0, None), (2.0, None), (2, ['a', 'a']), (2, ['a'])])
+def test_invalid_runs_are_refused(sample_count, names):
+    with pytest.raises(ValueError):
+        plan_run(sample_count, names=names)
+
+
+def test_capacity_report_and_loading_sheet():
+    assert 'over capacity' not in capacity_report(4)
+    assert 'over capacity' in capacity_report(5)
+    assert 'no run takes more than 12 samples' in capacity_report(5)
+    sheet = loading_sheet(plan_run(2, tip_wash=True))
+    assert 'viralBufferBeads' in sheet
+    assert 'Sample #2 tip wash' in sheet
@@ -0,0 +1,77 @@
+import pytest
+
+from polartron.profiling import Profiler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_self_time_excludes_nested_helpers():
+    clock = Clock()
+    profiler = Profiler(clock=clock)
+
+    def inner():
+        clock.now += 2
+
+    def outer():
+        clock.now += 1
+        profiled_inner()
+
+    profiled_inner = profiler.wrap(inner)
+    profiler.phase('phase')
+    profiler.wrap(outer)()
+    stats = dict((group, stats) for group, stats in profiler.rows(('helper',)))
+    assert stats[('outer',)].seconds == 3
+    assert stats[('outer',)].selfSeconds == 1
+    assert stats[('inner',)].selfSeconds == 2
+    assert profiler.collapsed().splitlines() == ['phase;outer 1000', 'phase;outer;inner 2000']
+
+
+def test_identical_nested_frames_are_left_by_identity():
+    clock = Clock()
+    profiler = Profiler(clock=clock)
+    outer = profiler.enter('helper')
+    inner = profiler.enter('helper')
+    assert outer == inner
+    clock.now += 1
+    profiler.leave(inner)
+    assert profiler.stack == [outer] and profiler.stack[0] is outer
+    clock.now += 1
+    profiler.leave(outer)
+    assert profiler.stack == []
+    assert profiler.stacks[('helper', 'helper')] == 1
+    assert profiler.stacks[('helper',)] == 1
+
+
+def test_generator_helpers_are_timed_between_yields():
+    clock = Clock()
+    profiler = Profiler(clock=clock)
+
+    def steps():
+        clock.now += 1
+        yield 'incubation'
+        clock.now += 1
+
+    generator = profiler.wrap(steps)()
+    assert next(generator) == 'incubation'
+    clock.now += 100
+    with pytest.raises(StopIteration):
+        next(generator)
+    (group, stats), = profiler.rows(('helper',))
+    assert stats.seconds == 2
+    assert stats.calls == 1
+
+
+def test_profiled_run_reports_helpers():
+    from polartron.estimator import record_run
+    from polartron.simulation import RecordingContext
+    ctx = RecordingContext()
+    profiler = Profiler(ctx)
+    record_run(1, ctx=ctx, profiler=profiler)
+    assert profiler.rows()
+    assert profiler.stack == []
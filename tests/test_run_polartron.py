@@ -0,0 +1,64 @@
+import pytest
+
+from polartron.planner import CapacityError
+from polartron.protocols.run_polartron import run
+from polartron.simulation import RecordingContext
+
+
+@pytest.mark.parametrize('run_kwargs', [
+    {'sample_count': 1},
+    {'sample_count': 4, 'distribute': True},
+    {'sample_count': 4, 'liquid_following': True},
+    {'sample_count': 3, 'library_prep': True},
+    {'sample_count': 5, 'tip_wash': True},
+    {'sample_count': 4, 'precondition': True}
+])
+def test_run_completes(run_kwargs):
+    ctx = RecordingContext()
+    run(ctx, **run_kwargs)
+    assert ctx.trace
+
+
+def test_run_over_capacity_fails_before_anything_moves():
+    ctx = RecordingContext()
+    with pytest.raises(CapacityError):
+        run(ctx, sample_count=5)
+    assert ctx.trace == []
+
+
+
+def test_preconditioning_fills_incubations_from_the_protocol():
+    ctx = RecordingContext()
+    run(ctx, sample_count=2, precondition=True)
+    phases = [record['phase'] for record in ctx.trace if record['command'] == 'comment']
+    assert phases.index("ʕ·ᴥ·ʔ : Cooling thermocycler plate to 4°C.") > \
+        phases.index("ʕ·ᴥ·ʔ : Incubating sample with Protinase K.")
+    assert phases.index("ʕ·ᴥ·ʔ : Allowing MagBeads to dry.") < phases.index("ʕ·ᴥ·ʔ : Pre-heating thermocycler lid.") < \
+        phases.index("ʕ·ᴥ·ʔ : Eluting DNA/RNA from MagBeads.")
+    assert not any(record.get('background') for record in ctx.trace)
+
+
+class Analysis:
+    # A context without a simulated clock, like the app's analysis of the protocol: it waits on the wall clock.
+    def __init__(self, ctx):
+        self._ctx = ctx
+
+    def __getattr__(self, name):
+        if name == 'now':
+            raise AttributeError(name)
+        return getattr(self._ctx, name)
+
+
+def test_runs_take_the_same_steps_without_a_simulated_clock():
+    # Protinase K is over before the RT-PCR reactions are plated on the simulated clock, but not on the
+    # wall clock, on which the whole run takes well under a minute.
+    kwargs = {'sample_count': 2, 'parameters': {'proteinaseKMinutes': 1}}
+    simulated = RecordingContext()
+    steps = run(simulated, **kwargs)
+    ctx = RecordingContext()
+    assert run(Analysis(ctx), **kwargs) == steps
+
+    def commands(trace):
+        return [(record['command'], record.get('location')) for record in trace if record['command'] != 'delay']
+
+    assert commands(ctx.trace) == commands(simulated.trace)
@@ -0,0 +1,48 @@
+from datetime import datetime
+
+import pytest
+
+from polartron.runlog import RunLogger, read_log
+
+
+def test_records_are_written_at_phase_boundaries(tmp_path):
+    commands = []
+    log = RunLogger(str(tmp_path), 'test', commands=lambda: commands, started=datetime(2024, 1, 2, 3, 4, 5))
+    assert log.path.endswith('test_run_log_24_01_02_03_04_05.jsonl')
+    log.phase('first')
+    log.sample('Sample #1')
+    commands.extend(['aspirate', 'dispense'])
+    assert read_log(log.path) == []
+    log.phase('second')
+    entries = read_log(log.path)
+    assert [entry['event'] for entry in entries] == ['phase', 'sample', 'phase_end']
+    assert entries[-1]['phaseCommands'] == 2
+    log.close()
+    entries = read_log(log.path)
+    assert entries[-1]['event'] == 'run_end'
+    assert entries[-1]['status'] == 'complete'
+    assert log.file is None
+
+
+def test_disabled_log_writes_nothing(tmp_path):
+    log = RunLogger(str(tmp_path / 'logs'), enabled=False)
+    log.phase('first')
+    log.close('failed')
+    assert log.path is None
+    assert not (tmp_path / 'logs').exists()
+
+
+def test_failed_run_is_logged(tmp_path):
+    from polartron.protocols.run_polartron import run
+    from polartron.simulation import RecordingContext
+
+    class Failing(RecordingContext):
+        def pause(self, msg=None):
+            raise RuntimeError("door open")
+
+    with pytest.raises(RuntimeError):
+        run(Failing(), sample_count=1, log_directory=str(tmp_path))
+    path, = tmp_path.iterdir()
+    entries = read_log(str(path))
+    assert entries[-1]['event'] == 'run_end'
+    assert entries[-1]['status'] != 'complete'
@@ -0,0 +1,133 @@
+import pytest
+
+from polartron.scheduler import Scheduler, SchedulingError, incubate
+
+
+class Clock:
+    # Stands in for a protocol context: time only moves on with delays and the work the tasks do.
+    def __init__(self):
+        self.now = 0.0
+        self.log = []
+
+    def __call__(self):
+        return self.now
+
+    def delay(self, seconds=0, minutes=0, msg=None):
+        self.now += seconds + 60 * minutes
+
+    def comment(self, msg):
+        self.log.append(msg)
+
+
+def work(clock, name, seconds, done):
+    def action():
+        clock.now += seconds
+        done.append((name, clock.now))
+    return action
+
+
+def test_incubations_are_filled_with_ready_tasks():
+    clock = Clock()
+    done = []
+
+    def incubated():
+        done.append(('start', clock.now))
+        yield incubate(minutes=1, msg='waiting')
+        done.append(('end', clock.now))
+
+    scheduler = Scheduler(clock, clock=clock)
+    scheduler.add('incubated', incubated)
+    scheduler.add('other', work(clock, 'other', 20, done))
+    scheduler.add('last', work(clock, 'last', 10, done), after=['incubated'])
+    assert scheduler.run() == ['incubated', 'other', 'last']
+    # The incubation is never cut short: the task resumes once its minute is up, not when 'other' is done.
+    assert done == [('start', 0.0), ('other', 20.0), ('end', 60.0), ('last', 70.0)]
+    assert clock.log == ['waiting']
+
+
+def test_task_resumes_once_its_incubation_is_over():
+    clock = Clock()
+    done = []
+
+    def incubated():
+        yield incubate(seconds=5)
+        done.append(('end', clock.now))
+
+    scheduler = Scheduler(clock, clock=clock)
+    scheduler.add('incubated', incubated)
+    scheduler.add('long', work(clock, 'long', 30, done))
+    scheduler.run()
+    assert done == [('long', 30.0), ('end', 30.0)]
+
+
+def test_hooks_see_every_step():
+    clock = Clock()
+    steps = []
+    finished = []
+
+    def incubated():
+        yield incubate(seconds=5)
+
+    scheduler = Scheduler(clock, clock=clock, on_step=lambda task: steps.append(task.name),
+                          on_done=lambda task: finished.append(task.name))
+    scheduler.add('incubated', incubated)
+    scheduler.run()
+    assert steps == ['incubated', 'incubated']
+    assert finished == ['incubated']
+
+
+def test_bad_dependencies_are_refused():
+    clock = Clock()
+    scheduler = Scheduler(clock, clock=clock)
+    scheduler.add('first', lambda: None)
+    with pytest.raises(SchedulingError):
+        scheduler.add('first', lambda: None)
+    with pytest.raises(SchedulingError):
+        scheduler.add('second', lambda: None, after=['missing'])
+
+
+def test_planned_steps_keep_their_order_on_another_clock():
+    def tasks(clock, seconds, steps=None):
+        # 'long' takes longer than the incubation on the first clock, and no time at all on the second.
+        done = []
+
+        def incubated():
+            yield incubate(minutes=1, msg='waiting')
+            done.append(('incubated', clock.now))
+
+        scheduler = Scheduler(clock, clock=clock, steps=steps)
+        scheduler.add('incubated', incubated)
+        scheduler.add('long', work(clock, 'long', seconds, done))
+        scheduler.add('short', work(clock, 'short', 0, done))
+        return scheduler, done
+
+    simulated, done = tasks(Clock(), 70)
+    simulated.run()
+    assert [name for name, when in done] == ['long', 'incubated', 'short']
+
+    # Left to itself, the second clock runs 'short' before the incubation is over.
+    unplanned, done = tasks(Clock(), 0)
+    unplanned.run()
+    assert [name for name, when in done] == ['long', 'short', 'incubated']
+
+    wall = Clock()
+    planned, done = tasks(wall, 0, steps=simulated.steps)
+    planned.run()
+    assert planned.steps == simulated.steps
+    # The incubation is waited out on the second clock. The planned run never idled for it, so nothing is logged.
+    assert done == [('long', 0.0), ('incubated', 60.0), ('short', 60.0)]
+    assert wall.log == []
+
+
+def test_planned_steps_that_do_not_fit_are_refused():
+    clock = Clock()
+    scheduler = Scheduler(clock, clock=clock, steps=[['second', False]])
+    scheduler.add('first', lambda: None)
+    scheduler.add('second', lambda: None, after=['first'])
+    with pytest.raises(SchedulingError):
+        scheduler.run()
+    scheduler = Scheduler(clock, clock=clock, steps=[['first', False]])
+    scheduler.add('first', lambda: None)
+    scheduler.add('second', lambda: None)
+    with pytest.raises(SchedulingError):
+        scheduler.run()
@@ -0,0 +1,35 @@
+from polartron import sweep
+
+
+def test_grid_lists_every_combination():
+    assert sweep.grid({'washMixes': [10, 20], 'dryMinutes': [1]}) == [
+        {'dryMinutes': 1, 'washMixes': 10}, {'dryMinutes': 1, 'washMixes': 20}]
+
+
+def test_pareto_front_keeps_undominated_results():
+    results = [{'seconds': 10, 'mixes': 5, 'peakFlowRate': 50},
+               {'seconds': 20, 'mixes': 5, 'peakFlowRate': 50},
+               {'seconds': 20, 'mixes': 9, 'peakFlowRate': 50}]
+    assert sweep.pareto_front(results) == [results[0], results[2]]
+
+
+def test_any_failure_is_recorded_against_its_point(monkeypatch):
+    def broken(ctx, **kwargs):
+        raise KeyError('missing')
+
+    monkeypatch.setattr('polartron.protocols.run_polartron.run', broken)
+    result = sweep.evaluate(({'washMixes': 10}, 1, {}))
+    assert result == {'parameters': {'washMixes': 10}, 'error': "KeyError: 'missing'"}
+
+
+def test_evaluate_simulates_a_point():
+    result = sweep.evaluate(({'dryMinutes': 1}, 1, {}))
+    assert 'error' not in result
+    assert result['seconds'] > 0
+
+
+def test_sweep_skips_points_outside_the_constraints():
+    report = sweep.sweep({'dryMinutes': [1, 2]}, {'dryMinutes': {'max': 1}}, sample_count=1, workers=1)
+    assert [result['parameters'] for result in report['ranked']] == [{'dryMinutes': 1}]
+    assert [result['parameters'] for result in report['skipped']] == [{'dryMinutes': 2}]
+    assert report['failed'] == []
@@ -0,0 +1,92 @@
+import json
+import threading
+import time
+import urllib.request
+
+from polartron.telemetry import PlannedRun, Telemetry, TelemetryServer, follow
+
+
+def trace(*phases):
+    # A trace with one command of the given length per phase.
+    records = []
+    start = 0.0
+    for phase, seconds in phases:
+        records.append({'phase': phase, 'start': start, 'seconds': seconds, 'category': 'liquid'})
+        start += seconds
+    return records
+
+
+def test_planned_run_tells_repeated_phases_apart():
+    planned = PlannedRun(trace(('mix', 10.0), ('wait', 30.0), ('mix', 20.0)))
+    assert planned.seconds == 60.0
+    assert planned.remaining('mix', 1) == 60.0
+    assert planned.remaining('mix', 2, fraction=0.5) == 10.0
+    assert planned.remaining('mix', 3) is None
+
+
+def test_events_carry_progress_and_time_left():
+    events = []
+    clock = iter([0.0, 5.0, 6.0, 7.0]).__next__
+    telemetry = Telemetry(events.append, PlannedRun(trace(('mix', 10.0), ('wait', 30.0))), clock=clock)
+    telemetry.start(temperatures=lambda: {'thermocycler': 4})
+    telemetry.phase('mix')
+    telemetry.sample('Sample #2', 1, 2)
+    telemetry.done()
+    assert [event['event'] for event in events] == ['phase', 'sample', 'end']
+    assert events[0]['remainingSeconds'] == 40.0
+    assert events[1]['remainingSeconds'] == 35.0
+    assert events[1]['sample'] == 'Sample #2'
+    assert events[1]['samplesDone'] == 1
+    assert events[1]['temperatures'] == {'thermocycler': 4}
+    assert events[2]['remainingSeconds'] == 0.0
+    assert events[1]['elapsed'] == 6.0
+
+
+def test_server_streams_events_to_clients():
+    server = TelemetryServer(port=0).start()
+    try:
+        server.publish({'event': 'phase', 'phase': 'first'})
+        received = []
+
+        def listen():
+            for event in follow(server.url, timeout=5):
+                received.append(event)
+                if event['event'] == 'end':
+                    return
+
+        listener = threading.Thread(target=listen)
+        listener.start()
+        deadline = time.monotonic() + 5
+        while not server.clients and time.monotonic() < deadline:
+            time.sleep(0.01)
+        server.publish({'event': 'sample', 'phase': 'first', 'sample': 'Sample #1'})
+        server.publish({'event': 'end', 'phase': 'first'})
+        listener.join(5)
+        assert [event['event'] for event in received] == ['phase', 'sample', 'end']
+        assert received[1]['sample'] == 'Sample #1'
+
+        with urllib.request.urlopen(server.url + '/status', timeout=5) as response:
+            assert json.load(response) == {'event': 'end', 'phase': 'first'}
+    finally:
+        server.stop()
+    assert server.clients == []
+
+
+def test_slow_client_is_dropped(monkeypatch):
+    monkeypatch.setattr('polartron.telemetry.clientQueueSize', 2)
+    server = TelemetryServer(port=0)
+    client = server.subscribe()
+    for number in range(3):
+        server.publish({'event': 'phase', 'phase': str(number)})
+    assert client not in server.clients
+    assert server.latest == {'event': 'phase', 'phase': '2'}
+
+
+def test_run_publishes_a_phase_event_per_update():
+    from polartron.protocols.run_polartron import run
+    from polartron.simulation import RecordingContext
+    events = []
+    run(RecordingContext(), sample_count=1, telemetry=Telemetry(events.append))
+    assert events[-1]['event'] == 'end'
+    assert events[-1]['status'] == 'complete'
+    assert any(event['event'] == 'sample' for event in events)
@@ -0,0 +1,103 @@
+import pytest
+
+from polartron import planner
+from polartron.protocols.run_polartron import run
+from polartron.simulation import RecordingContext
+from polartron.tipreuse import TipReuseError, TipTracker
+
+
+class Well:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+@pytest.fixture
+def deck():
+    wells = {name: Well(name) for name in ('tip', 'sample1', 'sample2', 'pool1', 'pool2', 'wash1', 'wash2',
+                                           'sharedWash', 'buffer', 'mix1', 'mix2', 'trash')}
+    owners = {id(wells[name]): sample for name, sample in (('sample1', 'A'), ('pool1', 'A'), ('pool2', 'A'),
+                                                           ('wash1', 'A'), ('sample2', 'B'), ('wash2', 'B'))}
+    tracker = TipTracker(owners, {id(wells['sample1']): 'A', id(wells['sample2']): 'B'},
+                         {'A': wells['wash1'], 'B': wells['wash2']}, wells['sharedWash'], exempt=[wells['trash']],
+                         reagents={id(wells['buffer']): 'buffer', id(wells['mix1']): 'mix1',
+                                   id(wells['mix2']): 'mix2'})
+    return tracker, wells
+
+
+def use(tracker, state, well, into_tip=True):
+    tracker.check(state, well)
+    tracker.touch(state, well, into_tip)
+
+
+def plate(tracker, wells, mix, pool):
+    # A fresh tip takes a master mix into a reaction well.
+    state = tracker.pick_up(Well('plating ' + pool))
+    use(tracker, state, wells[mix])
+    use(tracker, state, wells[pool], into_tip=False)
+
+
+def test_tip_may_not_go_into_another_samples_wells(deck):
+    tracker, wells = deck
+    state = tracker.pick_up(wells['tip'])
+    use(tracker, state, wells['sample1'])
+    with pytest.raises(TipReuseError):
+        tracker.check(state, wells['sample2'])
+
+
+def test_tip_with_sample_on_it_stays_out_of_shared_wells(deck):
+    tracker, wells = deck
+    state = tracker.pick_up(wells['tip'])
+    use(tracker, state, wells['buffer'])
+    use(tracker, state, wells['sample1'])
+    with pytest.raises(TipReuseError):
+        tracker.check(state, wells['buffer'])
+    # Anything may go into the trash.
+    tracker.check(state, wells['trash'])
+
+
+def test_reused_tip_is_washed_in_its_samples_wash_well(deck):
+    tracker, wells = deck
+    state = tracker.pick_up(wells['tip'])
+    use(tracker, state, wells['sample1'])
+    state = tracker.pick_up(wells['tip'])
+    assert not tracker.needs_wash(state, wells['sample1'])
+    assert tracker.needs_wash(state, wells['buffer'])
+    assert tracker.wash_well(state) is wells['wash1']
+    use(tracker, state, wells['wash1'])
+    tracker.washed(state)
+    tracker.check(state, wells['buffer'])
+    assert tracker.report() == {'tips': 1, 'pickUps': 2, 'washes': 1}
+
+
+def test_reused_tip_may_not_carry_one_reaction_into_another(deck):
+    tracker, wells = deck
+    plate(tracker, wells, 'mix1', 'pool1')
+    plate(tracker, wells, 'mix2', 'pool2')
+    state = tracker.pick_up(wells['tip'])
+    use(tracker, state, wells['sample1'])
+    use(tracker, state, wells['pool1'])
+    state = tracker.pick_up(wells['tip'])
+    use(tracker, state, wells['wash1'])
+    tracker.washed(state)
+    # A wash in water takes sample off the tip, but not Pool 1 master mix.
+    with pytest.raises(TipReuseError, match='mix1'):
+        tracker.check(state, wells['pool2'])
+    # Within one pick up a tip still serves several wells, as a fresh tip does.
+    fresh = tracker.pick_up(Well('fresh'))
+    use(tracker, fresh, wells['pool1'])
+    tracker.check(fresh, wells['pool2'])
+
+
+def test_tip_washing_run_keeps_every_guard():
+    ctx = RecordingContext()
+    run(ctx, sample_count=planner.max_samples(tip_wash=True), tip_wash=True)
+    assert any(record['command'] == 'mix' for record in ctx.trace)
+
+
+def test_sharing_the_rt_pcr_pool_tips_is_caught(monkeypatch):
+    monkeypatch.setitem(planner.reusedTipRoles, 'rtPcrPool2Tip', 'rtPcrPool1Tip')
+    with pytest.raises(TipReuseError, match='rtPcrPool1MasterMix'):
+        run(RecordingContext(), sample_count=2, tip_wash=True)
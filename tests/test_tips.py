@@ -0,0 +1,30 @@
+import pytest
+
+from polartron.planner import plan_run
+from polartron.tips import assign, optimize_tips
+
+
+def test_assignment_has_the_lowest_cost():
+    cost = [[4, 1, 3],
+            [2, 0, 5],
+            [3, 2, 2]]
+    choice = assign(cost)
+    assert sorted(choice) == [0, 1, 2]
+    assert sum(cost[row][column] for row, column in enumerate(choice)) == 5
+    with pytest.raises(ValueError):
+        assign([[1], [2]])
+
+
+def test_optimized_tips_travel_no_further():
+    plan = plan_run(2)
+    optimized, report = optimize_tips(plan)
+    assert report['travelAfter'] <= report['travelBefore'] + 1e-6
+    tips = [tuple(optimized['polar'][sample][role]) for sample in optimized['samples']
+            for role in ('mixTip', 'elutionTip', 'rtPcrPool1Tip')]
+    assert len(tips) == len(set(tips))
+
+
+def test_tip_washing_plans_keep_reused_tips_together():
+    optimized, report = optimize_tips(plan_run(2, tip_wash=True))
+    for needs in optimized['polar'].values():
+        assert needs['ethanolTip3'] == needs['ethanolTip2']